@@ -157,7 +157,11 @@ RESOURCE_ATTRIBUTE_MAP = {
                    'is_visible': True},
         'tenant_id': {'allow_post': True, 'allow_put': False,
                       'required_by_policy': True,
-                      'is_visible': True}
+                      'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'updated_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
     },
     'ports': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -191,6 +195,10 @@ RESOURCE_ATTRIBUTE_MAP = {
                       'is_visible': True},
         'status': {'allow_post': False, 'allow_put': False,
                    'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'updated_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
     },
     'subnets': {
         'id': {'allow_post': False, 'allow_put': False,
@@ -230,5 +238,9 @@ RESOURCE_ATTRIBUTE_MAP = {
                         'convert_to': convert_to_boolean,
                         'validate': {'type:boolean': None},
                         'is_visible': True},
+        'created_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
+        'updated_at': {'allow_post': False, 'allow_put': False,
+                       'is_visible': True},
     }
 }
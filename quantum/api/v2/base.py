@@ -15,6 +15,7 @@
 
 import logging
 import socket
+import urllib
 
 import webob.exc
 
@@ -23,7 +24,9 @@ from quantum.api.v2 import resource as wsgi_resource
 from quantum.common import exceptions
 from quantum.common import utils
 from quantum.openstack.common import cfg
+from quantum.openstack.common import excutils
 from quantum.openstack.common.notifier import api as notifier_api
+from quantum.openstack.common import timeutils
 from quantum import policy
 from quantum import quota
 
@@ -40,10 +43,14 @@ FAULT_MAP = {exceptions.NotFound: webob.exc.HTTPNotFound,
              exceptions.OverlappingAllocationPools: webob.exc.HTTPConflict,
              exceptions.OutOfBoundsAllocationPool: webob.exc.HTTPBadRequest,
              exceptions.InvalidAllocationPool: webob.exc.HTTPBadRequest,
+             exceptions.OverQuota: webob.exc.HTTPConflict,
              }
 
 QUOTAS = quota.QUOTAS
 
+PAGINATION_PARAMS = ('limit', 'marker', 'sort_key', 'sort_dir',
+                     'page_reverse')
+
 
 def _get_hostname():
     return socket.gethostname()
@@ -74,7 +81,8 @@ def filters(request):
     """
     res = {}
     for key in set(request.GET):
-        if key in ('verbose', 'fields'):
+        if (key in ('verbose', 'fields', 'changes_since', 'count') or
+                key in PAGINATION_PARAMS):
             continue
 
         values = [v for v in request.GET.getall(key) if v]
@@ -115,6 +123,104 @@ def verbose(request):
     return verbose
 
 
+def sorting(request, attr_info):
+    """
+    Extracts the sort order from the request string
+
+    sort_key=name&sort_dir=desc&sort_key=id&sort_dir=asc
+
+    becomes
+
+    [('name', False), ('id', True)]
+
+    sort_dir defaults to ascending when it is not given at all.
+    """
+    keys = request.GET.getall('sort_key')
+    dirs = request.GET.getall('sort_dir')
+    if not dirs:
+        dirs = ['asc'] * len(keys)
+    if len(keys) != len(dirs):
+        msg = _("The number of sort_key and sort_dir must be the same")
+        raise webob.exc.HTTPBadRequest(msg)
+    sorts = []
+    for key, direction in zip(keys, dirs):
+        if key not in attr_info or not attr_info[key]['is_visible']:
+            msg = _("%s is not a valid sort key") % key
+            raise webob.exc.HTTPBadRequest(msg)
+        if direction not in ('asc', 'desc'):
+            msg = _("%s is not a valid sort direction") % direction
+            raise webob.exc.HTTPBadRequest(msg)
+        sorts.append((key, direction == 'asc'))
+    return sorts
+
+
+def pagination(request):
+    """
+    Extracts the page requested
+
+    Returns a (limit, marker, page_reverse) tuple. The limit is capped by
+    the pagination_max_limit option, which also applies when no limit
+    is requested. It is None when there is no limit at all.
+    """
+    max_limit = cfg.CONF.pagination_max_limit
+    limit = request.GET.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit <= 0:
+            msg = _("limit must be a positive integer")
+            raise webob.exc.HTTPBadRequest(msg)
+    if max_limit > 0:
+        limit = min(limit or max_limit, max_limit)
+    marker = request.GET.get('marker') or None
+    page_reverse = utils.boolize(request.GET.get('page_reverse', False))
+    return limit, marker, page_reverse is True
+
+
+def changes_since(request):
+    """
+    Extracts the changes_since time from the request string
+
+    changes_since=2012-08-20T10:00:00Z
+
+    becomes the naive UTC datetime 2012-08-20 10:00:00, and None when it
+    is not given.
+    """
+    value = request.GET.get('changes_since')
+    if not value:
+        return None
+    try:
+        return timeutils.normalize_time(timeutils.parse_isotime(value))
+    except ValueError:
+        msg = _("%s is not a valid changes_since time") % value
+        raise webob.exc.HTTPBadRequest(msg)
+
+
+def _paginate(items, sorts, limit, marker, page_reverse):
+    """Sort and page a full list like a native plugin would."""
+    sorts = list(sorts)
+    if 'id' not in [key for key, ascending in sorts]:
+        sorts.append(('id', True))
+    if page_reverse:
+        sorts = [(key, not ascending) for key, ascending in sorts]
+    for key, ascending in reversed(sorts):
+        items = sorted(items, key=lambda item: item.get(key),
+                       reverse=not ascending)
+    if marker:
+        ids = [item['id'] for item in items]
+        if marker not in ids:
+            msg = _("Marker %s not found") % marker
+            raise webob.exc.HTTPBadRequest(msg)
+        items = items[ids.index(marker) + 1:]
+    if limit:
+        items = items[:limit]
+    if page_reverse:
+        items.reverse()
+    return items
+
+
 class Controller(object):
     def __init__(self, plugin, collection, resource, attr_info):
         self._plugin = plugin
@@ -125,6 +231,10 @@ class Controller(object):
                               if 'required_by_policy' in info
                               and info['required_by_policy']]
         self._publisher_id = notifier_api.publisher_id('network')
+        self._native_pagination = getattr(
+            plugin, 'native_pagination_support', False)
+        self._native_changes_since = getattr(
+            plugin, 'native_changes_since_support', False)
 
     def _is_visible(self, attr):
         attr_val = self._attr_info.get(attr)
@@ -156,8 +266,39 @@ class Controller(object):
         kwargs = {'filters': filters(request),
                   'verbose': verbose(request),
                   'fields': original_fields}
+        sorts = sorting(request, self._attr_info)
+        limit, marker, page_reverse = pagination(request)
+        since = changes_since(request)
+        if since:
+            if not self._native_changes_since:
+                msg = _("changes_since is not supported by the plugin")
+                raise webob.exc.HTTPBadRequest(msg)
+            kwargs['changes_since'] = since
+        if original_fields and (sorts or limit or marker):
+            # The id and sort keys are needed to sort and link the pages
+            extra = [key for key in ['id'] + [k for k, asc in sorts]
+                     if key not in original_fields]
+            original_fields.extend(extra)
+            fields_to_add = (fields_to_add or []) + extra
+        # NOTE: one more item than the page is fetched to know whether
+        #       there is a page after it
+        fetch = limit + 1 if limit else None
+        if self._native_pagination:
+            # Only pass the arguments in use, for plugins wrapping the
+            # get methods of a native plugin
+            for key, value in (('sorts', sorts), ('limit', fetch),
+                               ('marker', marker),
+                               ('page_reverse', page_reverse)):
+                if value:
+                    kwargs[key] = value
         obj_getter = getattr(self._plugin, "get_%s" % self._collection)
         obj_list = obj_getter(request.context, **kwargs)
+        if not self._native_pagination and (sorts or limit or marker):
+            obj_list = _paginate(obj_list, sorts, fetch, marker,
+                                 page_reverse)
+        more = bool(limit) and len(obj_list) > limit
+        if more:
+            obj_list = obj_list[1:] if page_reverse else obj_list[:limit]
         # Check authz
         if do_authz:
             # Omit items from list that should not be visible
@@ -166,9 +307,44 @@ class Controller(object):
                                         "get_%s" % self._resource,
                                         obj)]
 
-        return {self._collection: [self._view(obj,
-                                              fields_to_strip=fields_to_add)
-                                   for obj in obj_list]}
+        result = {self._collection: [self._view(obj,
+                                                fields_to_strip=fields_to_add)
+                                     for obj in obj_list]}
+        if since:
+            # NOTE: the filters other than tenant_id do not apply to the
+            #       deleted items
+            result[self._collection + '_deleted'] = [
+                {'id': deleted['id'], 'deleted_at': deleted['deleted_at']}
+                for deleted in self._plugin.get_deletions(
+                    request.context, self._resource, since)]
+        if limit and obj_list:
+            links = self._page_links(request, obj_list, marker, page_reverse,
+                                     more)
+            if links:
+                result[self._collection + '_links'] = links
+        return result
+
+    def _page_links(self, request, obj_list, marker, page_reverse, more):
+        """Return the links to the pages around the one in obj_list."""
+        params = [(key, value) for key, value in request.GET.items()
+                  if key not in ('marker', 'page_reverse')]
+        if page_reverse:
+            has_next, has_previous = marker, more
+        else:
+            has_next, has_previous = more, marker
+        links = []
+        if has_next:
+            query = params + [('marker', obj_list[-1]['id'])]
+            links.append({'rel': 'next',
+                          'href': '%s?%s' % (request.path_url,
+                                             urllib.urlencode(query))})
+        if has_previous:
+            query = params + [('marker', obj_list[0]['id']),
+                              ('page_reverse', 'True')]
+            links.append({'rel': 'previous',
+                          'href': '%s?%s' % (request.path_url,
+                                             urllib.urlencode(query))})
+        return links
 
     def _item(self, request, id, do_authz=False):
         """Retrieves and formats a single element of the requested entity"""
@@ -188,12 +364,61 @@ class Controller(object):
 
         return {self._resource: self._view(obj, fields_to_strip=added_fields)}
 
+    def _read_only(self, request):
+        # NOTE: the context only switches to the replica, if any, while it
+        #       has not opened a session on the master yet
+        if request.context._session is None:
+            request.context.read_only = True
+
+    def _count_scoped(self, context, filters):
+        """Return whether the policy lets context see all it counts.
+
+        The plugin scopes the count to the tenant of a non admin context,
+        like its lists. The count is only right if the get policy then
+        shows every item whatever its attributes other than tenant_id,
+        which is checked on items holding only a tenant_id: a rule that
+        looks at other attributes fails to check them.
+        """
+        tenant_ids = [context.tenant_id]
+        if context.is_admin:
+            tenant_ids = filters.get('tenant_id') or [utils.str_uuid()]
+        try:
+            return all(policy.check(context, "get_%s" % self._resource,
+                                    {'tenant_id': tenant_id})
+                       for tenant_id in tenant_ids)
+        except KeyError:
+            return False
+
+    def _count(self, request):
+        """Returns the number of elements of the requested entity
+
+        Only the filters of the request apply. The items are counted by
+        the plugin, unless the policy may hide some of them: the list is
+        then read and checked.
+        """
+        query_filters = filters(request)
+        if self._count_scoped(request.context, query_filters):
+            obj_counter = getattr(self._plugin,
+                                  "get_%s_count" % self._collection)
+            count = obj_counter(request.context, filters=query_filters)
+        else:
+            obj_getter = getattr(self._plugin, "get_%s" % self._collection)
+            count = len([obj for obj in
+                         obj_getter(request.context, filters=query_filters)
+                         if policy.check(request.context,
+                                         "get_%s" % self._resource, obj)])
+        return {self._collection + '_count': count}
+
     def index(self, request):
         """Returns a list of the requested entity"""
+        self._read_only(request)
+        if utils.boolize(request.GET.get('count', False)) is True:
+            return self._count(request)
         return self._items(request, True)
 
     def show(self, request, id):
         """Returns detailed information about the requested entity"""
+        self._read_only(request)
         try:
             return self._item(request, id, True)
         except exceptions.PolicyNotAuthorized:
@@ -201,6 +426,27 @@ class Controller(object):
             # doesn't exist
             raise webob.exc.HTTPNotFound()
 
+    def _make_reservations(self, request, requested):
+        """Reserve the quota of the items about to be created.
+
+        :param requested: dict of the number of items of each tenant.
+        :raises: OverQuota if a tenant would exceed its quota.
+        """
+        reservations = []
+        try:
+            for tenant_id, count in requested.iteritems():
+                reservations.append(QUOTAS.make_reservation(
+                    request.context, tenant_id, {self._resource: count},
+                    self._plugin))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self._release_reservations(request, reservations)
+        return reservations
+
+    def _release_reservations(self, request, reservations):
+        for reservation in reservations:
+            QUOTAS.release_reservation(request.context, reservation)
+
     def create(self, request, body=None):
         """Creates a new instance of the requested entity"""
         notifier_api.notify(request.context,
@@ -216,6 +462,7 @@ class Controller(object):
         try:
             if self._collection in body:
                 # Have to account for bulk create
+                requested = {}
                 for item in body[self._collection]:
                     self._validate_network_tenant_ownership(
                         request,
@@ -226,29 +473,37 @@ class Controller(object):
                         action,
                         item[self._resource],
                     )
-                    count = QUOTAS.count(request.context, self._resource,
-                                         self._plugin, self._collection,
-                                         item[self._resource]['tenant_id'])
-                    kwargs = {self._resource: count + 1}
-                    QUOTAS.limit_check(request.context, **kwargs)
+                    tenant_id = item[self._resource]['tenant_id']
+                    requested[tenant_id] = requested.get(tenant_id, 0) + 1
             else:
                 self._validate_network_tenant_ownership(
                     request,
                     body[self._resource]
                 )
                 policy.enforce(request.context, action, body[self._resource])
-                count = QUOTAS.count(request.context, self._resource,
-                                     self._plugin, self._collection,
-                                     body[self._resource]['tenant_id'])
-                kwargs = {self._resource: count + 1}
-                QUOTAS.limit_check(request.context, **kwargs)
+                requested = {body[self._resource]['tenant_id']: 1}
         except exceptions.PolicyNotAuthorized:
             raise webob.exc.HTTPForbidden()
 
-        obj_creator = getattr(self._plugin, action)
-        kwargs = {self._resource: body}
-        obj = obj_creator(request.context, **kwargs)
-        result = {self._resource: self._view(obj)}
+        # One reservation per tenant rather than one per item
+        reservations = self._make_reservations(request, requested)
+        try:
+            if self._collection in body:
+                obj_creator = getattr(self._plugin,
+                                      "create_%s_bulk" % self._collection)
+                kwargs = {self._collection: body}
+                objs = obj_creator(request.context, **kwargs)
+                result = {self._collection: [self._view(obj)
+                                             for obj in objs]}
+            else:
+                obj_creator = getattr(self._plugin, action)
+                kwargs = {self._resource: body}
+                obj = obj_creator(request.context, **kwargs)
+                result = {self._resource: self._view(obj)}
+        finally:
+            # The usage of the created items is recorded by the creation
+            # itself, whether it succeeded or not the reservation is over
+            self._release_reservations(request, reservations)
         notifier_api.notify(request.context,
                             self._publisher_id,
                             self._resource + '.create.end',
@@ -314,6 +569,70 @@ class Controller(object):
                             result)
         return result
 
+    def _bulk_ids(self, request, action):
+        """Returns the ids of the entities matched by the request filters
+
+        The entities the policy does not let the context run action on
+        are left out, as they are left out of the lists.
+        """
+        bulk_filters = filters(request)
+        if not bulk_filters:
+            msg = _("Bulk operations require filters")
+            raise webob.exc.HTTPBadRequest(msg)
+        obj_getter = getattr(self._plugin, "get_%s" % self._collection)
+        objs = obj_getter(request.context, filters=bulk_filters,
+                          fields=['id'] + self._policy_attrs)
+        return [obj['id'] for obj in objs
+                if policy.check(request.context, action, obj)]
+
+    def _bulk_failures(self, errors):
+        return [{'id': id, 'error': str(error)}
+                for id, error in errors.iteritems()]
+
+    def delete_bulk(self, request):
+        """Deletes the entities matched by the filters of the request"""
+        ids = self._bulk_ids(request, "delete_%s" % self._resource)
+        notifier_api.notify(request.context,
+                            self._publisher_id,
+                            self._resource + '.delete.start',
+                            notifier_api.INFO,
+                            {self._resource + '_ids': ids})
+        obj_deleter = getattr(self._plugin,
+                              "delete_%s_bulk" % self._collection)
+        errors = obj_deleter(request.context, ids)
+        deleted = [id for id in ids if id not in errors]
+        notifier_api.notify(request.context,
+                            self._publisher_id,
+                            self._resource + '.delete.end',
+                            notifier_api.INFO,
+                            {self._resource + '_ids': deleted})
+        return {self._collection + '_deleted': deleted,
+                self._collection + '_failed': self._bulk_failures(errors)}
+
+    def update_bulk(self, request, body=None):
+        """Updates the entities matched by the filters of the request"""
+        body = self._prepare_request_body(request.context, body, False)
+        ids = self._bulk_ids(request, "update_%s" % self._resource)
+        payload = body.copy()
+        payload[self._resource + '_ids'] = ids
+        notifier_api.notify(request.context,
+                            self._publisher_id,
+                            self._resource + '.update.start',
+                            notifier_api.INFO,
+                            payload)
+        obj_updater = getattr(self._plugin,
+                              "update_%s_bulk" % self._collection)
+        objs, errors = obj_updater(request.context, ids,
+                                   **{self._resource: body})
+        result = {self._collection: [self._view(obj) for obj in objs]}
+        notifier_api.notify(request.context,
+                            self._publisher_id,
+                            self._resource + '.update.end',
+                            notifier_api.INFO,
+                            result)
+        result[self._collection + '_failed'] = self._bulk_failures(errors)
+        return result
+
     def _populate_tenant_id(self, context, res_dict, is_create):
 
         if (('tenant_id' in res_dict and
@@ -17,6 +17,7 @@
 Utility methods for working with WSGI servers redux
 """
 import logging
+import time
 
 import webob
 import webob.dec
@@ -24,6 +25,7 @@ import webob.exc
 
 from quantum.common import exceptions
 from quantum import context
+from quantum.db import stats
 from quantum.openstack.common import jsonutils as json
 from quantum import wsgi
 
@@ -69,6 +71,17 @@ def Resource(controller, faults=None, deserializers=None, serializers=None):
 
     @webob.dec.wsgify(RequestClass=Request)
     def resource(request):
+        stats.start_request()
+        start = time.time()
+        try:
+            return handle(request)
+        finally:
+            queries, query_time = stats.end_request()
+            LOG.debug("%s %s: %s queries in %.3fs, %.3fs in total",
+                      request.method, request.path, queries, query_time,
+                      time.time() - start)
+
+    def handle(request):
         route_args = request.environ.get('wsgiorg.routing_args')
         if route_args:
             args = route_args[1].copy()
@@ -86,8 +86,13 @@ class APIRouter(wsgi.Router):
             mapper_kwargs = dict(controller=controller,
                                  requirements=REQUIREMENTS,
                                  **col_kwargs)
-            return mapper.collection(collection, resource,
-                                     **mapper_kwargs)
+            submapper = mapper.collection(collection, resource,
+                                          **mapper_kwargs)
+            # PUT and DELETE on the collection act on all the items
+            # matched by the filters of the request
+            submapper.action(action='update_bulk', method='PUT')
+            submapper.action(action='delete_bulk', method='DELETE')
+            return submapper
 
         mapper.connect('index', '/', controller=Index(resources))
         for resource in resources:
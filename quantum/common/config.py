@@ -42,7 +42,9 @@ core_opts = [
     cfg.StrOpt('core_plugin',
                default='quantum.plugins.sample.SamplePlugin.FakePlugin'),
     cfg.StrOpt('base_mac', default="fa:16:3e:00:00:00"),
-    cfg.IntOpt('mac_generation_retries', default=16)
+    cfg.IntOpt('mac_generation_retries', default=16),
+    cfg.StrOpt('mac_generation', default='random'),
+    cfg.IntOpt('pagination_max_limit', default=-1),
 ]
 
 # Register the configuration options
@@ -50,8 +52,9 @@ cfg.CONF.register_opts(core_opts)
 
 
 def parse(args):
-    cfg.CONF(args=args, project='quantum',
-             version='%%prog %s' % version_string())
+    """Parse the options, returning the arguments left over."""
+    return cfg.CONF(args=args, project='quantum',
+                    version='%%prog %s' % version_string())
 
 
 def setup_logging(conf):
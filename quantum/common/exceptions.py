@@ -105,6 +105,11 @@ class IpAddressInUse(InUse):
                 "The IP address %(ip_address)s is in use.")
 
 
+class PortConflict(InUse):
+    message = _("Unable to create the port on network %(net_id)s. "
+                "Its id or one of its addresses is in use.")
+
+
 class VlanIdInUse(InUse):
     message = _("Unable to create the network. "
                 "The VLAN %(vlan_id)s is in use.")
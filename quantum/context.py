@@ -57,6 +57,9 @@ class Context(common_context.RequestContext):
         if not timestamp:
             timestamp = datetime.utcnow()
         self.timestamp = timestamp
+        # NOTE: read only contexts may be served by a lagging replica of
+        #       the database, see slave_connection
+        self.read_only = False
         self._session = None
 
     def _get_read_deleted(self):
@@ -77,7 +80,7 @@ class Context(common_context.RequestContext):
     @property
     def session(self):
         if self._session is None:
-            self._session = db_api.get_session()
+            self._session = db_api.get_session(slave=self.read_only)
         return self._session
 
     def to_dict(self):
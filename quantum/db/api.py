@@ -20,6 +20,7 @@
 import logging
 import time
 
+from eventlet import tpool
 import sqlalchemy as sql
 from sqlalchemy import create_engine
 from sqlalchemy.exc import DisconnectionError
@@ -28,13 +29,45 @@ from sqlalchemy.orm import sessionmaker, exc
 from quantum.api.api_common import OperationalStatus
 from quantum.common import exceptions as q_exc
 from quantum.db import model_base, models
+from quantum.db import stats
+from quantum.openstack.common import cfg
 
 
 LOG = logging.getLogger(__name__)
 
+database_opts = [
+    cfg.IntOpt('sql_pool_size', default=None,
+               help='number of connections kept open to the database, '
+                    'unset for the SQLAlchemy default'),
+    cfg.IntOpt('sql_max_overflow', default=None,
+               help='connections opened on top of sql_pool_size under '
+                    'load, unset for the SQLAlchemy default'),
+    cfg.IntOpt('sql_pool_timeout', default=None,
+               help='seconds to wait for a free connection before '
+                    'failing, unset for the SQLAlchemy default'),
+    cfg.BoolOpt('sql_dbpool_enable', default=False,
+                help='run the calls made on the database connections by '
+                     'the threads of the eventlet tpool, so that a slow '
+                     'query does not block the other green threads'),
+    cfg.IntOpt('sql_dbpool_threads', default=20,
+               help='number of threads of the eventlet tpool, at most as '
+                    'many queries run at the same time'),
+    cfg.StrOpt('slave_connection', default=None,
+               help='connection string of a read only replica of the '
+                    'database, used by the v2 API to answer GET requests'),
+    cfg.IntOpt('reconnect_interval_max', default=None,
+               help='the interval between two connection attempts is '
+                    'doubled after each of them up to this many seconds, '
+                    'unset to keep it constant'),
+]
+# Register the configuration options
+cfg.CONF.register_opts(database_opts, 'DATABASE')
+
 
 _ENGINE = None
 _MAKER = None
+_SLAVE_ENGINE = None
+_SLAVE_MAKER = None
 BASE = model_base.BASE
 
 
@@ -49,9 +82,12 @@ class MySQLPingListener(object):
     """
 
     def checkout(self, dbapi_con, con_record, con_proxy):
+        # NOTE: the tpool proxies of the connections do not hand out the
+        #       exception classes of the driver
+        error = getattr(dbapi_con, '_obj', dbapi_con).OperationalError
         try:
             dbapi_con.cursor().execute('select 1')
-        except dbapi_con.OperationalError, ex:
+        except error, ex:
             if ex.args[0] in (2006, 2013, 2014, 2045, 2055):
                 LOG.warn('Got mysql server has gone away: %s', ex)
                 raise DisconnectionError("Database server went away")
@@ -64,27 +100,84 @@ def configure_db(options):
     Establish the database, create an engine if needed, and
     register the models.
 
+    The pool options and slave_connection missing from options are taken
+    from the DATABASE section of the configuration.
+
     :param options: Mapping of configuration options
     """
-    global _ENGINE
+    global _ENGINE, _SLAVE_ENGINE, _SLAVE_MAKER
     if not _ENGINE:
-        connection_dict = sql.engine.url.make_url(options['sql_connection'])
-        engine_args = {
-            'pool_recycle': 3600,
-            'echo': False,
-            'convert_unicode': True,
-        }
-
-        if 'mysql' in connection_dict.drivername:
-            engine_args['listeners'] = [MySQLPingListener()]
-
-        _ENGINE = create_engine(options['sql_connection'], **engine_args)
+        _ENGINE = _create_engine(options['sql_connection'], options)
+        slave_connection = options.get('slave_connection',
+                                       cfg.CONF.DATABASE.slave_connection)
+        _SLAVE_ENGINE = None
+        _SLAVE_MAKER = None
+        if slave_connection:
+            _SLAVE_ENGINE = _create_engine(slave_connection, options)
         base = options.get('base', BASE)
         if not register_models(base):
             if 'reconnect_interval' in options:
                 remaining = options.get('sql_max_retries', -1)
                 reconnect_interval = options['reconnect_interval']
-                retry_registration(remaining, reconnect_interval, base)
+                reconnect_interval_max = options.get(
+                    'reconnect_interval_max',
+                    cfg.CONF.DATABASE.reconnect_interval_max)
+                retry_registration(remaining, reconnect_interval, base,
+                                   reconnect_interval_max)
+
+
+def _create_engine(sql_connection, options):
+    connection_dict = sql.engine.url.make_url(sql_connection)
+    engine_args = {
+        'pool_recycle': 3600,
+        'echo': False,
+        'convert_unicode': True,
+        'listeners': [stats.StatsListener()],
+    }
+
+    if 'mysql' in connection_dict.drivername:
+        engine_args['listeners'].append(MySQLPingListener())
+
+    # NOTE: the sqlite pools keep a single connection, they take none
+    #       of the pool options
+    if 'sqlite' not in connection_dict.drivername:
+        engine_args['poolclass'] = stats.TimedQueuePool
+        for option, arg in (('sql_pool_size', 'pool_size'),
+                            ('sql_max_overflow', 'max_overflow'),
+                            ('sql_pool_timeout', 'pool_timeout')):
+            value = options.get(option, cfg.CONF.DATABASE[option])
+            if value is not None:
+                engine_args[arg] = value
+
+    if options.get('sql_dbpool_enable', cfg.CONF.DATABASE.sql_dbpool_enable):
+        tpool.set_num_threads(options.get(
+            'sql_dbpool_threads', cfg.CONF.DATABASE.sql_dbpool_threads))
+        engine_args['creator'] = _tpool_creator(connection_dict)
+
+    engine = create_engine(sql_connection, **engine_args)
+    stats.listen(engine)
+    return engine
+
+
+def _tpool_creator(connection_dict):
+    """Return a function opening connections run by the eventlet tpool.
+
+    The database drivers are C extensions blocking the hub of eventlet
+    for as long as a query runs. The calls made on these connections
+    and on their cursors are run by the threads of the tpool instead.
+    """
+    dialect_cls = connection_dict.get_dialect()
+    dbapi = dialect_cls.dbapi()
+    dialect = dialect_cls(dbapi=dbapi)
+    cargs, cparams = dialect.create_connect_args(connection_dict)
+    if 'sqlite' in connection_dict.drivername:
+        # the connection is used by any of the threads of the tpool
+        cparams['check_same_thread'] = False
+
+    def connect():
+        connection = tpool.execute(dbapi.connect, *cargs, **cparams)
+        return tpool.Proxy(connection, autowrap_names=('cursor',))
+    return connect
 
 
 def clear_db(base=BASE):
@@ -94,9 +187,25 @@ def clear_db(base=BASE):
         _ENGINE.execute(table.delete())
 
 
-def get_session(autocommit=True, expire_on_commit=False):
-    """Helper method to grab session"""
-    global _MAKER, _ENGINE
+def get_stats():
+    """Return the connection and query counters of the process."""
+    return stats.get_stats(_ENGINE)
+
+
+def get_session(autocommit=True, expire_on_commit=False, slave=False):
+    """Helper method to grab session
+
+    :param slave: return a session of the slave_connection database, if
+                  one is configured. Its data may lag behind the one of
+                  the main database, and it must not be written to.
+    """
+    global _MAKER, _ENGINE, _SLAVE_MAKER
+    if slave and _SLAVE_ENGINE:
+        if not _SLAVE_MAKER:
+            _SLAVE_MAKER = sessionmaker(bind=_SLAVE_ENGINE,
+                                        autocommit=autocommit,
+                                        expire_on_commit=expire_on_commit)
+        return _SLAVE_MAKER()
     if not _MAKER:
         assert _ENGINE
         _MAKER = sessionmaker(bind=_ENGINE,
@@ -105,7 +214,8 @@ def get_session(autocommit=True, expire_on_commit=False):
     return _MAKER()
 
 
-def retry_registration(remaining, reconnect_interval, base=BASE):
+def retry_registration(remaining, reconnect_interval, base=BASE,
+                       reconnect_interval_max=None):
     if remaining == -1:
         remaining = 'infinite'
     while True:
@@ -119,6 +229,9 @@ def retry_registration(remaining, reconnect_interval, base=BASE):
         time.sleep(reconnect_interval)
         if register_models(base):
             break
+        if reconnect_interval_max:
+            reconnect_interval = min(reconnect_interval * 2,
+                                     reconnect_interval_max)
 
 
 def register_models(base=BASE):
@@ -13,10 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import ast
 import logging
 import random
 
 import netaddr
+import sqlalchemy as sql
+from sqlalchemy import exc as sql_exc
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
 
@@ -24,9 +27,15 @@ from quantum.api.v2 import attributes
 from quantum.common import exceptions as q_exc
 from quantum.common import utils
 from quantum.db import api as db
+from quantum.db import deletions
+from quantum.db.ipam import base as ipam
 from quantum.db import models_v2
+from quantum.db import port_pool
+from quantum.db import sqlalchemyutils
 from quantum.openstack.common import cfg
+from quantum.openstack.common import timeutils
 from quantum import quantum_plugin_base_v2
+from quantum import quota
 
 
 LOG = logging.getLogger(__name__)
@@ -41,6 +50,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         certain events.
     """
 
+    # NOTE: subclasses overriding the get_<resources> methods must take
+    #       and pass on the pagination and changes_since arguments
+    native_pagination_support = True
+    native_changes_since_support = True
+
     def __init__(self):
         # NOTE(jkoelker) This is an incomlete implementation. Subclasses
         #                must override __init__ and setup the database
@@ -55,6 +69,9 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         base_mac = cfg.CONF.base_mac.split(':')
         if len(base_mac) != 6:
             raise Exception("illegal base_mac format %s", cfg.CONF.base_mac)
+        if cfg.CONF.mac_generation not in ('random', 'sequential'):
+            raise Exception("illegal mac_generation %s",
+                            cfg.CONF.mac_generation)
 
     def _get_tenant_id_for_create(self, context, resource):
         if context.is_admin and 'tenant_id' in resource:
@@ -76,8 +93,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
         return query
 
-    def _get_by_id(self, context, model, id, joins=(), verbose=None):
+    def _get_by_id(self, context, model, id, joins=(), verbose=None,
+                   lock=False):
         query = self._model_query(context, model)
+        if lock:
+            query = query.with_lockmode('update')
         if verbose:
             if verbose and isinstance(verbose, list):
                 options = [orm.joinedload(join) for join in joins
@@ -87,10 +107,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             query = query.options(*options)
         return query.filter_by(id=id).one()
 
-    def _get_network(self, context, id, verbose=None):
+    def _get_network(self, context, id, verbose=None, lock=False):
         try:
             network = self._get_by_id(context, models_v2.Network, id,
-                                      joins=('subnets',), verbose=verbose)
+                                      joins=('subnets',), verbose=verbose,
+                                      lock=lock)
         except exc.NoResultFound:
             raise q_exc.NetworkNotFound(net_id=id)
         except exc.MultipleResultsFound:
@@ -98,10 +119,10 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             raise q_exc.NetworkNotFound(net_id=id)
         return network
 
-    def _get_subnet(self, context, id, verbose=None):
+    def _get_subnet(self, context, id, verbose=None, lock=False):
         try:
             subnet = self._get_by_id(context, models_v2.Subnet, id,
-                                     verbose=verbose)
+                                     verbose=verbose, lock=lock)
         except exc.NoResultFound:
             raise q_exc.SubnetNotFound(subnet_id=id)
         except exc.MultipleResultsFound:
@@ -109,6 +130,16 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             raise q_exc.SubnetNotFound(subnet_id=id)
         return subnet
 
+    @staticmethod
+    def _exists(context, column, *criterion):
+        """Return whether any row matches criterion.
+
+        Only column of the first matching row is read, so the check costs
+        the same however many rows match.
+        """
+        query = context.session.query(column).filter(*criterion)
+        return query.limit(1).first() is not None
+
     def _get_port(self, context, id, verbose=None):
         try:
             port = self._get_by_id(context, models_v2.Port, id,
@@ -128,39 +159,255 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                          if key in fields))
         return resource
 
+    def _has_native_bulk(self, resource, action='create'):
+        """Return whether bulk actions on resource can be done natively.
+
+        Subclasses overriding <action>_<resource> (to bind VLANs, notify
+        a controller, ...) get the emulated bulk action instead, which
+        calls their method once per item.
+        """
+        method = '%s_%s' % (action, resource)
+        return (getattr(type(self), method).im_func is
+                getattr(QuantumDbPluginV2, method).im_func)
+
     def _get_collection(self, context, model, dict_func, filters=None,
-                        fields=None, verbose=None):
-        collection = self._model_query(context, model)
+                        fields=None, verbose=None, query=None, joins=(),
+                        sorts=None, limit=None, marker=None,
+                        page_reverse=False, changes_since=None):
+        """Return the dicts of the model rows matching filters.
+
+        :param query: query to start from instead of all the rows of the
+                      model visible in the context.
+        :param joins: relationships used by dict_func. Each of them is
+                      loaded for all the rows with one extra query rather
+                      than one query per row, unless fields leaves it out.
+        :param sorts: list of (key, ascending) tuples to sort the rows by.
+        :param limit: maximum number of rows returned.
+        :param marker: id of the row the page starts after.
+        :param page_reverse: return the page before marker instead.
+        :param changes_since: only return the rows created or updated
+                              since this time.
+        """
+        if query is None:
+            query = self._model_query(context, model)
+        if changes_since:
+            query = query.filter(model.updated_at >= changes_since)
+        if fields:
+            joins = [join for join in joins if join in fields]
+        collection = query.options(*[orm.subqueryload(join)
+                                     for join in joins])
+        collection = self._apply_filters_to_query(collection, model, filters)
+        if sorts or limit or marker:
+            marker_obj = None
+            if marker:
+                try:
+                    marker_obj = self._get_by_id(context, model, marker)
+                except exc.NoResultFound:
+                    msg = _("Marker %s not found") % marker
+                    raise q_exc.InvalidInput(error_message=msg)
+            collection = sqlalchemyutils.paginate_query(
+                collection, model, limit, sorts, marker_obj, page_reverse)
+        if fields and not joins:
+            items = self._get_columns(collection, model, fields)
+        else:
+            items = [dict_func(c, fields) for c in collection.all()]
+        if page_reverse:
+            items.reverse()
+        return items
+
+    def _apply_filters_to_query(self, query, model, filters):
         if filters:
             for key, value in filters.iteritems():
                 column = getattr(model, key, None)
                 if column:
-                    collection = collection.filter(column.in_(value))
-        return [dict_func(c, fields) for c in collection.all()]
+                    query = query.filter(column.in_(value))
+        return query
+
+    def _get_collection_count(self, context, model, filters=None,
+                              query=None):
+        """Return the number of model rows matching filters.
+
+        The rows are counted by the database, none of them is loaded.
+        """
+        if query is None:
+            query = self._model_query(context, model)
+        return self._apply_filters_to_query(query, model, filters).count()
+
+    def _get_columns(self, query, model, fields):
+        """Return the dicts of the rows of query, reduced to fields.
+
+        Only the columns named in fields, and the id, are selected, and
+        no model instance is built. The dict keys of the resources match
+        the names of the columns they come from.
+        """
+        names = [column.name for column in model.__table__.columns
+                 if column.name in fields or column.name == 'id']
+        rows = query.with_entities(*[getattr(model, name) for name in names])
+        return [self._fields(dict(zip(names, row)), fields) for row in rows]
+
+    def _update_bulk_native(self, context, model, ids, values,
+                            not_found, dict_func, joins=()):
+        """Update the model rows of ids with values in one statement.
+
+        :param not_found: function returning the error of a missing id.
+        :returns: a tuple of the dicts of the updated rows, and of a dict
+                  mapping each missing id to its error.
+        """
+        with context.session.begin(subtransactions=True):
+            query = self._model_query(context, model).filter(
+                model.id.in_(ids))
+            found = [row[0] for row in query.with_entities(model.id)]
+            if found and values:
+                query.update(values, synchronize_session='fetch')
+        errors = dict((id, not_found(id)) for id in ids if id not in found)
+        if not found:
+            return [], errors
+        return (self._get_collection(context, model, dict_func,
+                                     filters={'id': found}, joins=joins),
+                errors)
+
+    @staticmethod
+    def _is_column_update(model, values):
+        """Return whether values only changes columns of model."""
+        columns = set(column.name for column in model.__table__.columns)
+        return all(key in columns for key in values)
 
     @staticmethod
-    def _generate_mac(context, network_id):
+    def _random_mac(base_mac):
+        mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+               int(base_mac[2], 16), random.randint(0x00, 0xff),
+               random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+        if base_mac[3] != '00':
+            mac[3] = int(base_mac[3], 16)
+        return ':'.join(map(lambda x: "%02x" % x, mac))
+
+    @staticmethod
+    def _next_macs(context, network_id, base_mac, count):
+        """Return count MAC addresses from the counter of the network.
+
+        The octets of base_mac kept by the random generation are kept as
+        well and the others are taken from the counter of the network and
+        base_mac. It is moved forward by a single UPDATE, so concurrent
+        requests never get the same addresses, and starts above the
+        highest address of the network. Fewer than count addresses are
+        returned once the end of the range is reached.
+        """
+        fixed = 4 if base_mac[3] != '00' else 3
+        prefix = ':'.join(base_mac[:fixed]).lower()
+        free_bits = 8 * (6 - fixed)
+        counter = models_v2.MacAddressCounter
+        counter_qry = context.session.query(counter).filter_by(
+            network_id=network_id, prefix=prefix)
+        values = {'next_value': counter.next_value + count}
+        if counter_qry.update(values, synchronize_session=False):
+            first = counter_qry.with_entities(
+                counter.next_value).scalar() - count
+        else:
+            mac_qry = context.session.query(
+                sql.func.max(sql.func.lower(models_v2.Port.mac_address)))
+            last = mac_qry.filter(
+                models_v2.Port.network_id == network_id,
+                models_v2.Port.mac_address.like(prefix + ':%')).scalar()
+            first = 1
+            if last:
+                first = int(last.replace(':', '')[2 * fixed:], 16) + 1
+            try:
+                with context.session.begin_nested():
+                    context.session.add(counter(network_id=network_id,
+                                                prefix=prefix,
+                                                next_value=first + count))
+            except sql_exc.IntegrityError:
+                # NOTE: a concurrent request created the counter first
+                if not counter_qry.update(values,
+                                          synchronize_session=False):
+                    return []
+                first = counter_qry.with_entities(
+                    counter.next_value).scalar() - count
+        base = int(prefix.replace(':', ''), 16) << free_bits
+        macs = []
+        for value in xrange(first, min(first + count, 1 << free_bits)):
+            mac = '%012x' % (base + value)
+            macs.append(':'.join(mac[i:i + 2] for i in range(0, 12, 2)))
+        return macs
+
+    @staticmethod
+    def _generate_mac(context, network_id, sequential=True):
+        """Return a MAC address for a new port of the network.
+
+        The address is not checked: the unique (network_id, mac_address)
+        index rejects the port if it is in use, and create_port tries
+        again with another address.
+
+        :param sequential: take the address from the counter of the
+                           network when mac_generation is sequential.
+        """
+        base_mac = cfg.CONF.base_mac.split(':')
+        if sequential and cfg.CONF.mac_generation == 'sequential':
+            macs = QuantumDbPluginV2._next_macs(context, network_id,
+                                                base_mac, 1)
+            if macs:
+                LOG.debug("Generated mac for network %s is %s",
+                          network_id, macs[0])
+                return macs[0]
+            LOG.debug("Sequential macs of network %s exhausted, "
+                      "falling back to random macs", network_id)
+        mac_address = QuantumDbPluginV2._random_mac(base_mac)
+        LOG.debug("Generated mac for network %s is %s",
+                  network_id, mac_address)
+        return mac_address
+
+    @staticmethod
+    def _generate_macs(context, network_id, count, reserved=()):
+        """Generate count distinct MAC addresses unused on the network.
+
+        Sequential addresses come from the counter of the network, random
+        ones make up for those in use. Each attempt at random ones checks
+        all of its candidates with a single query.
+
+        :param reserved: addresses that must not be generated.
+        """
         base_mac = cfg.CONF.base_mac.split(':')
         max_retries = cfg.CONF.mac_generation_retries
+        macs = set()
+        if cfg.CONF.mac_generation == 'sequential':
+            next_macs = set(QuantumDbPluginV2._next_macs(
+                context, network_id, base_mac, count)) - set(reserved)
+            macs.update(next_macs - QuantumDbPluginV2._macs_in_use(
+                context, network_id, next_macs))
+            if len(macs) == count:
+                LOG.debug("Generated %s macs for network %s",
+                          count, network_id)
+                return sorted(macs)
         for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
-            if QuantumDbPluginV2._check_unique_mac(context, network_id,
-                                                   mac_address):
-                LOG.debug("Generated mac for network %s is %s",
-                          network_id, mac_address)
-                return mac_address
-            else:
-                LOG.debug("Generated mac %s exists. Remaining attempts %s.",
-                          mac_address, max_retries - (i + 1))
-        LOG.error("Unable to generate mac address after %s attempts",
+            candidates = set()
+            while len(macs) + len(candidates) < count:
+                mac_address = QuantumDbPluginV2._random_mac(base_mac)
+                if mac_address not in macs and mac_address not in reserved:
+                    candidates.add(mac_address)
+            in_use = QuantumDbPluginV2._macs_in_use(context, network_id,
+                                                    candidates)
+            macs.update(candidates - in_use)
+            if len(macs) == count:
+                LOG.debug("Generated %s macs for network %s",
+                          count, network_id)
+                return list(macs)
+            LOG.debug("%s generated macs exist. Remaining attempts %s.",
+                      len(in_use), max_retries - (i + 1))
+        LOG.error("Unable to generate mac addresses after %s attempts",
                   max_retries)
         raise q_exc.MacAddressGenerationFailure(net_id=network_id)
 
+    @staticmethod
+    def _macs_in_use(context, network_id, mac_addresses):
+        """Return the subset of mac_addresses used on the network."""
+        if not mac_addresses:
+            return set()
+        mac_qry = context.session.query(models_v2.Port.mac_address)
+        mac_qry = mac_qry.filter(
+            models_v2.Port.network_id == network_id,
+            models_v2.Port.mac_address.in_(mac_addresses))
+        return set(row[0] for row in mac_qry)
+
     @staticmethod
     def _check_unique_mac(context, network_id, mac_address):
         mac_qry = context.session.query(models_v2.Port)
@@ -172,89 +419,61 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         return False
 
     @staticmethod
-    def _recycle_ip(context, network_id, subnet_id, port_id, ip_address):
-        """Return an IP address to the pool of free IP's on the network
-        subnet.
+    def _find_port_conflict(context, port, ips, generated_mac):
+        """Find the address that made the insert of port fail.
+
+        Raises if the address was requested by the user. Otherwise the
+        address was handed out to a concurrent request, and the exception
+        to raise if no other one can be found is returned. None is
+        returned if no address of the port is in use.
         """
-        # Grab all allocation pools for the subnet
-        pool_qry = context.session.query(models_v2.IPAllocationPool)
-        allocation_pools = pool_qry.filter_by(subnet_id=subnet_id).all()
-        # Find the allocation pool for the IP to recycle
-        pool_id = None
-        for allocation_pool in allocation_pools:
-            allocation_pool_range = netaddr.IPRange(
-                allocation_pool['first_ip'],
-                allocation_pool['last_ip'])
-            if netaddr.IPAddress(ip_address) in allocation_pool_range:
-                pool_id = allocation_pool['id']
-                break
-        if not pool_id:
-            error_message = ("No allocation pool found for "
-                             "ip address:%s" % ip_address)
-            raise q_exc.InvalidInput(error_message=error_message)
-        # Two requests will be done on the database. The first will be to
-        # search if an entry starts with ip_address + 1 (r1). The second
-        # will be to see if an entry ends with ip_address -1 (r2).
-        # If 1 of the above holds true then the specific entry will be
-        # modified. If both hold true then the two ranges will be merged.
-        # If there are no entries then a single entry will be added.
-        range_qry = context.session.query(models_v2.IPAvailabilityRange)
-        ip_first = str(netaddr.IPAddress(ip_address) + 1)
-        ip_last = str(netaddr.IPAddress(ip_address) - 1)
-        LOG.debug("Recycle %s", ip_address)
-        try:
-            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     first_ip=ip_first).one()
-            LOG.debug("Recycle: first match for %s-%s", r1['first_ip'],
-                      r1['last_ip'])
-        except exc.NoResultFound:
-            r1 = []
-        try:
-            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     last_ip=ip_last).one()
-            LOG.debug("Recycle: last match for %s-%s", r2['first_ip'],
-                      r2['last_ip'])
-        except exc.NoResultFound:
-            r2 = []
-
-        if r1 and r2:
-            # Merge the two ranges
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=r2['first_ip'],
-                last_ip=r1['last_ip'])
-            context.session.add(ip_range)
-            LOG.debug("Recycle: merged %s-%s and %s-%s", r2['first_ip'],
-                      r2['last_ip'], r1['first_ip'], r1['last_ip'])
-            context.session.delete(r1)
-            context.session.delete(r2)
-        elif r1:
-            # Update the range with matched first IP
-            r1['first_ip'] = ip_address
-            LOG.debug("Recycle: updated first %s-%s", r1['first_ip'],
-                      r1['last_ip'])
-        elif r2:
-            # Update the range with matched last IP
-            r2['last_ip'] = ip_address
-            LOG.debug("Recycle: updated last %s-%s", r2['first_ip'],
-                      r2['last_ip'])
-        else:
-            # Create a new range
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=ip_address,
-                last_ip=ip_address)
-            context.session.add(ip_range)
-            LOG.debug("Recycle: created new %s-%s", ip_address, ip_address)
-
-        # Delete the IP address from the IPAllocate table
-        LOG.debug("Delete allocated IP %s (%s/%s/%s)", ip_address,
-                  network_id, subnet_id, port_id)
-        alloc_qry = context.session.query(models_v2.IPAllocation)
-        allocated = alloc_qry.filter_by(network_id=network_id,
-                                        port_id=port_id,
-                                        ip_address=ip_address,
-                                        subnet_id=subnet_id).delete()
+        network_id = port['network_id']
+        if not QuantumDbPluginV2._check_unique_mac(context, network_id,
+                                                   port['mac_address']):
+            if not generated_mac:
+                raise q_exc.MacAddressInUse(net_id=network_id,
+                                            mac=port['mac_address'])
+            return q_exc.MacAddressGenerationFailure(net_id=network_id)
+        requested = []
+        if port['fixed_ips'] != attributes.ATTR_NOT_SPECIFIED:
+            requested = [fixed['ip_address'] for fixed in port['fixed_ips']
+                         if 'ip_address' in fixed]
+        for ip in ips:
+            if QuantumDbPluginV2._check_unique_ip(context, network_id,
+                                                  ip['subnet_id'],
+                                                  ip['ip_address']):
+                continue
+            if ip['ip_address'] in requested:
+                raise q_exc.IpAddressInUse(net_id=network_id,
+                                           ip_address=ip['ip_address'])
+            return q_exc.IpAddressGenerationFailure(net_id=network_id)
+
+    @staticmethod
+    def _recycle_ips(context, network_id, port_id, ips):
+        """Return IP addresses of the port to the pools of free IP's.
+
+        The addresses are grouped by subnet, so that the addresses of a
+        subnet are released, and their IPAllocation rows deleted, in one
+        pass.
+        """
+        ip_addresses = {}
+        for ip in ips:
+            ip_addresses.setdefault(ip['subnet_id'], []).append(
+                ip['ip_address'])
+        driver = ipam.get_driver()
+        for subnet_id, subnet_ips in ip_addresses.iteritems():
+            driver.recycle_ips(context, subnet_id, subnet_ips)
+
+            # Delete the IP addresses from the IPAllocate table
+            LOG.debug("Delete allocated IP's %s (%s/%s/%s)", subnet_ips,
+                      network_id, subnet_id, port_id)
+            alloc_qry = context.session.query(models_v2.IPAllocation)
+            alloc_qry.filter(
+                models_v2.IPAllocation.network_id == network_id,
+                models_v2.IPAllocation.port_id == port_id,
+                models_v2.IPAllocation.subnet_id == subnet_id,
+                models_v2.IPAllocation.ip_address.in_(subnet_ips)).delete(
+                    synchronize_session='fetch')
 
     @staticmethod
     def _generate_ip(context, network_id, subnets):
@@ -263,62 +482,18 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         The IP address will be generated from one of the subnets defined on
         the network.
         """
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange).join(
-                models_v2.IPAllocationPool)
+        driver = ipam.get_driver()
         for subnet in subnets:
-            range = range_qry.filter_by(subnet_id=subnet['id']).first()
-            if not range:
-                LOG.debug("All IP's from subnet %s (%s) allocated",
-                          subnet['id'], subnet['cidr'])
-                continue
-            ip_address = range['first_ip']
-            LOG.debug("Allocated IP - %s from %s to %s", ip_address,
-                      range['first_ip'], range['last_ip'])
-            if range['first_ip'] == range['last_ip']:
-                # No more free indices on subnet => delete
-                LOG.debug("No more free IP's in slice. Deleting allocation "
-                          "pool.")
-                context.session.delete(range)
-            else:
-                # increment the first free
-                range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-            return {'ip_address': ip_address, 'subnet_id': subnet['id']}
+            ip_address = driver.generate_ip(context, subnet)
+            if ip_address:
+                return {'ip_address': ip_address, 'subnet_id': subnet['id']}
         raise q_exc.IpAddressGenerationFailure(net_id=network_id)
 
     @staticmethod
     def _allocate_specific_ip(context, subnet_id, ip_address):
         """Allocate a specific IP address on the subnet."""
-        ip = int(netaddr.IPAddress(ip_address))
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange,
-            models_v2.IPAllocationPool).join(
-                models_v2.IPAllocationPool)
-        results = range_qry.filter_by(subnet_id=subnet_id).all()
-        for (range, pool) in results:
-            first = int(netaddr.IPAddress(range['first_ip']))
-            last = int(netaddr.IPAddress(range['last_ip']))
-            if first <= ip <= last:
-                if first == last:
-                    context.session.delete(range)
-                    return
-                elif first == ip:
-                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-                    return
-                elif last == ip:
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    return
-                else:
-                    # Split into two ranges
-                    new_first = str(netaddr.IPAddress(ip_address) + 1)
-                    new_last = range['last_ip']
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    ip_range = models_v2.IPAvailabilityRange(
-                        allocation_pool_id=pool['id'],
-                        first_ip=new_first,
-                        last_ip=new_last)
-                    context.session.add(ip_range)
-                    return
+        ipam.get_driver().allocate_specific_ip(context, subnet_id,
+                                               ip_address)
 
     @staticmethod
     def _check_unique_ip(context, network_id, subnet_id, ip_address):
@@ -441,13 +616,12 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
         # Check if the IP's to add are OK
         to_add = self._test_fixed_ips_for_port(context, network_id, new_ips)
-        for ip in original_ips:
-            LOG.debug("Port update. Deleting %s", ip)
-            QuantumDbPluginV2._recycle_ip(context,
-                                          network_id=network_id,
-                                          subnet_id=ip['subnet_id'],
-                                          ip_address=ip['ip_address'],
-                                          port_id=port_id)
+        if original_ips:
+            LOG.debug("Port update. Deleting %s", original_ips)
+            QuantumDbPluginV2._recycle_ips(context,
+                                           network_id=network_id,
+                                           port_id=port_id,
+                                           ips=original_ips)
 
         if to_add:
             LOG.debug("Port update. Adding %s", to_add)
@@ -491,6 +665,81 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                 'subnet_id': result['subnet_id']})
         return ips
 
+    def _allocate_ips_for_ports(self, context, network, ports):
+        """Allocate IP addresses for several ports of the network.
+
+        Ports without fixed_ips get one address per IP version, as in
+        _allocate_ips_for_port(), handed out by the IPAM driver for all
+        of them at once.
+
+        :returns: the list of IP's of each port, in the order of ports.
+        """
+        # NOTE: _check_unique_ip only looks at the addresses already
+        #       allocated, not at the ones requested by the other ports
+        seen = set()
+        for p in ports:
+            if p['fixed_ips'] == attributes.ATTR_NOT_SPECIFIED:
+                continue
+            for fixed in p['fixed_ips']:
+                ip_address = fixed.get('ip_address')
+                if ip_address is None:
+                    continue
+                if ip_address in seen:
+                    raise q_exc.IpAddressInUse(net_id=network['id'],
+                                               ip_address=ip_address)
+                seen.add(ip_address)
+
+        port_ips = [[] for p in ports]
+        auto = []
+        for i, p in enumerate(ports):
+            if p['fixed_ips'] != attributes.ATTR_NOT_SPECIFIED:
+                port_ips[i] = self._allocate_ips_for_port(context, network,
+                                                          {'port': p})
+            else:
+                auto.append(i)
+        if not auto:
+            return port_ips
+
+        driver = ipam.get_driver()
+        subnet_qry = self._model_query(context, models_v2.Subnet)
+        subnets = subnet_qry.filter_by(network_id=network['id']).all()
+        for version in (4, 6):
+            version_subnets = [subnet for subnet in subnets
+                               if subnet['ip_version'] == version]
+            if not version_subnets:
+                continue
+            ips = []
+            for subnet in version_subnets:
+                ips.extend({'ip_address': ip_address,
+                            'subnet_id': subnet['id']}
+                           for ip_address in driver.generate_ips(
+                               context, subnet, len(auto) - len(ips)))
+                if len(ips) == len(auto):
+                    break
+            if len(ips) < len(auto):
+                raise q_exc.IpAddressGenerationFailure(net_id=network['id'])
+            for i, ip in zip(auto, ips):
+                port_ips[i].append(ip)
+        return port_ips
+
+    @staticmethod
+    def _find_overlap(ranges):
+        """Return a pair of overlapping ranges, or None.
+
+        :param ranges: list of (first, last, item) tuples, first and last
+                       being the integer values of the bounds. The items
+                       of the first overlapping pair found are returned.
+
+        Sorted by their first address, the ranges checked so far do not
+        overlap and the last of them reaches the furthest, so each range
+        only needs to be compared with the one sorted right before it.
+        """
+        previous = None
+        for first, last, item in sorted(ranges, key=lambda r: r[:2]):
+            if previous is not None and first <= previous[1]:
+                return previous[2], item
+            previous = (first, last, item)
+
     def _validate_subnet_cidr(self, network, new_subnet_cidr):
         """Validate the CIDR for a subnet.
 
@@ -498,9 +747,13 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         for the other subnets specified for this network.
 
         """
+        new_net = netaddr.IPNetwork(new_subnet_cidr)
+        # The subnets of the network do not overlap each other, comparing
+        # the bounds of each of them with the new one is enough.
         for subnet in network.subnets:
-            if (netaddr.IPSet([subnet.cidr]) &
-                    netaddr.IPSet([new_subnet_cidr])):
+            net = netaddr.IPNetwork(subnet.cidr)
+            if (net.version == new_net.version and
+                    net.first <= new_net.last and new_net.first <= net.last):
                 err_msg = ("Requested subnet with cidr: %s "
                            "for network: %s "
                            "overlaps with subnet: %s)" % (new_subnet_cidr,
@@ -525,7 +778,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         subnet_last_ip = netaddr.IPAddress(subnet.last - 1)
 
         LOG.debug("Performing IP validity checks on allocation pools")
-        ip_sets = []
+        ip_ranges = []
         for ip_pool in ip_pools:
             try:
                 start_ip = netaddr.IPAddress(ip_pool['start'])
@@ -553,30 +806,23 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                     pool=ip_pool,
                     subnet_cidr=subnet_cidr)
             # Valid allocation pool
-            # Create an IPSet for it for easily verifying overlaps
-            ip_sets.append(netaddr.IPSet(netaddr.IPRange(
-                ip_pool['start'],
-                ip_pool['end']).cidrs()))
+            ip_ranges.append((int(start_ip), int(end_ip), ip_pool))
 
         LOG.debug("Checking for overlaps among allocation pools "
                   "and gateway ip")
-        ip_ranges = ip_pools[:]
-        # Treat gw as IPset as well
-        ip_ranges.append(gateway_ip)
-        ip_sets.append(netaddr.IPSet([gateway_ip]))
-        # Use integer cursors as an efficient way for implementing
-        # comparison and avoiding comparing the same pair twice
-        for l_cursor in range(len(ip_sets)):
-            for r_cursor in range(l_cursor + 1, len(ip_sets)):
-                if ip_sets[l_cursor] & ip_sets[r_cursor]:
-                    l_range = ip_ranges[l_cursor]
-                    r_range = ip_ranges[r_cursor]
-                    LOG.error("Found overlapping ranges: %s and %s",
-                              l_range, r_range)
-                    raise q_exc.OverlappingAllocationPools(
-                        pool_1=l_range,
-                        pool_2=r_range,
-                        subnet_cidr=subnet_cidr)
+        # Treat gw as a single address range as well
+        gateway = netaddr.IPAddress(gateway_ip)
+        if gateway.version == subnet.version:
+            ip_ranges.append((int(gateway), int(gateway), gateway_ip))
+        overlap = self._find_overlap(ip_ranges)
+        if overlap:
+            l_range, r_range = overlap
+            LOG.error("Found overlapping ranges: %s and %s",
+                      l_range, r_range)
+            raise q_exc.OverlappingAllocationPools(
+                pool_1=l_range,
+                pool_2=r_range,
+                subnet_cidr=subnet_cidr)
 
     def _allocate_pools_for_subnet(self, context, subnet):
         """Create IP allocation pools for a given subnet
@@ -617,7 +863,9 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                'admin_state_up': network['admin_state_up'],
                'status': network['status'],
                'subnets': [subnet['id']
-                           for subnet in network['subnets']]}
+                           for subnet in network['subnets']],
+               'created_at': network['created_at'],
+               'updated_at': network['updated_at']}
 
         return self._fields(res, fields)
 
@@ -632,7 +880,9 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                      'end': pool['last_ip']}
                                     for pool in subnet['allocation_pools']],
                'gateway_ip': subnet['gateway_ip'],
-               'enable_dhcp': subnet['enable_dhcp']}
+               'enable_dhcp': subnet['enable_dhcp'],
+               'created_at': subnet['created_at'],
+               'updated_at': subnet['updated_at']}
         return self._fields(res, fields)
 
     def _make_port_dict(self, port, fields=None):
@@ -646,7 +896,9 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                "fixed_ips": [{'subnet_id': ip["subnet_id"],
                               'ip_address': ip["ip_address"]}
                              for ip in port["fixed_ips"]],
-               "device_id": port["device_id"]}
+               "device_id": port["device_id"],
+               "created_at": port["created_at"],
+               "updated_at": port["updated_at"]}
         return self._fields(res, fields)
 
     def create_network(self, context, network):
@@ -654,7 +906,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         # NOTE(jkoelker) Get the tenant_id outside of the session to avoid
         #                unneeded db action if the operation raises
         tenant_id = self._get_tenant_id_for_create(context, n)
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             network = models_v2.Network(tenant_id=tenant_id,
                                         id=n.get('id') or utils.str_uuid(),
                                         name=n['name'],
@@ -663,35 +915,111 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             context.session.add(network)
         return self._make_network_dict(network)
 
+    def create_networks_bulk(self, context, networks):
+        if not self._has_native_bulk('network'):
+            return super(QuantumDbPluginV2, self).create_networks_bulk(
+                context, networks)
+        with context.session.begin(subtransactions=True):
+            return [self.create_network(context, item)
+                    for item in networks['networks']]
+
     def update_network(self, context, id, network):
         n = network['network']
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             network = self._get_network(context, id)
             network.update(n)
         return self._make_network_dict(network)
 
     def delete_network(self, context, id):
-        with context.session.begin():
-            network = self._get_network(context, id)
-
-            filter = {'network_id': [id]}
-            ports = self.get_ports(context, filters=filter)
-            if ports:
+        with context.session.begin(subtransactions=True):
+            # NOTE: the lock on the network keeps ports from being
+            #       created on it until it is deleted
+            network = self._get_network(context, id, lock=True)
+
+            if self._exists(context, models_v2.Port.id,
+                            models_v2.Port.network_id == id,
+                            models_v2.Port.tenant_id !=
+                            port_pool.POOL_TENANT_ID):
                 raise q_exc.NetworkInUse(net_id=id)
+            self._drain_port_pool(context, id)
 
-            subnets_qry = context.session.query(models_v2.Subnet)
-            subnets_qry.filter_by(network_id=id).delete()
+            # NOTE: the subnets are deleted one by one, so that the
+            #       listeners of their deletion get called
+            subnet_ids = [subnet['id'] for subnet in network.subnets]
+            for subnet in network.subnets:
+                context.session.delete(subnet)
             context.session.delete(network)
+        for subnet_id in subnet_ids:
+            ipam.get_driver().delete_subnet(context, subnet_id)
+
+    def update_networks_bulk(self, context, ids, network):
+        n = network['network']
+        if (not self._has_native_bulk('network', 'update') or
+                not self._is_column_update(models_v2.Network, n)):
+            return super(QuantumDbPluginV2, self).update_networks_bulk(
+                context, ids, network)
+        return self._update_bulk_native(
+            context, models_v2.Network, ids, n,
+            lambda id: q_exc.NetworkNotFound(net_id=id),
+            self._make_network_dict, joins=('subnets',))
+
+    def delete_networks_bulk(self, context, ids):
+        if not self._has_native_bulk('network', 'delete'):
+            return super(QuantumDbPluginV2, self).delete_networks_bulk(
+                context, ids)
+        errors = {}
+        subnet_ids = []
+        in_use = set()
+        with context.session.begin(subtransactions=True):
+            net_qry = self._model_query(context, models_v2.Network)
+            networks = net_qry.filter(
+                models_v2.Network.id.in_(ids)).with_lockmode('update').options(
+                    orm.subqueryload('subnets')).all()
+            found = set(network['id'] for network in networks)
+            for id in ids:
+                if id not in found:
+                    errors[id] = q_exc.NetworkNotFound(net_id=id)
+            if found:
+                port_qry = context.session.query(models_v2.Port.network_id)
+                in_use = set(row[0] for row in port_qry.filter(
+                    models_v2.Port.network_id.in_(found),
+                    models_v2.Port.tenant_id !=
+                    port_pool.POOL_TENANT_ID).distinct())
+            for network in networks:
+                if network['id'] in in_use:
+                    errors[network['id']] = q_exc.NetworkInUse(
+                        net_id=network['id'])
+                    continue
+                self._drain_port_pool(context, network['id'])
+                # NOTE: the rows are deleted by a single flush, one by one
+                #       so that the listeners of their deletion get called
+                for subnet in network.subnets:
+                    subnet_ids.append(subnet['id'])
+                    context.session.delete(subnet)
+                context.session.delete(network)
+        driver = ipam.get_driver()
+        for subnet_id in subnet_ids:
+            driver.delete_subnet(context, subnet_id)
+        return errors
 
     def get_network(self, context, id, fields=None, verbose=None):
         network = self._get_network(context, id, verbose=verbose)
         return self._make_network_dict(network, fields)
 
-    def get_networks(self, context, filters=None, fields=None, verbose=None):
+    def get_networks(self, context, filters=None, fields=None, verbose=None,
+                     sorts=None, limit=None, marker=None, page_reverse=False,
+                     changes_since=None):
         return self._get_collection(context, models_v2.Network,
                                     self._make_network_dict,
                                     filters=filters, fields=fields,
-                                    verbose=verbose)
+                                    verbose=verbose, joins=('subnets',),
+                                    sorts=sorts, limit=limit, marker=marker,
+                                    page_reverse=page_reverse,
+                                    changes_since=changes_since)
+
+    def get_networks_count(self, context, filters=None):
+        return self._get_collection_count(context, models_v2.Network,
+                                          filters=filters)
 
     def create_subnet(self, context, subnet):
         s = subnet['subnet']
@@ -700,7 +1028,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             s['gateway_ip'] = str(netaddr.IPAddress(net.first + 1))
 
         tenant_id = self._get_tenant_id_for_create(context, s)
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             network = self._get_network(context, s["network_id"])
             self._validate_subnet_cidr(network, s['cidr'])
             subnet = models_v2.Subnet(tenant_id=tenant_id,
@@ -712,45 +1040,141 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                       gateway_ip=s['gateway_ip'],
                                       enable_dhcp=s['enable_dhcp'])
             context.session.add(subnet)
+            # NOTE: keep the collection checked by _validate_subnet_cidr
+            #       current for the next subnet of a bulk create
+            network.subnets.append(subnet)
             pools = self._allocate_pools_for_subnet(context, s)
-            for pool in pools:
-                ip_pool = models_v2.IPAllocationPool(subnet=subnet,
-                                                     first_ip=pool['start'],
-                                                     last_ip=pool['end'])
-                context.session.add(ip_pool)
-                ip_range = models_v2.IPAvailabilityRange(
-                    ipallocationpool=ip_pool,
-                    first_ip=pool['start'],
-                    last_ip=pool['end'])
-                context.session.add(ip_range)
+            ipam.get_driver().create_pools(context, subnet, pools)
+            pooled = port_pool.get_pool(s['network_id']) is not None
+            if pooled:
+                # NOTE: the ports of the pool have no address on the new
+                #       subnet, unlike the ports created from now on
+                self._drain_port_pool(context, s['network_id'])
+        if pooled:
+            port_pool.schedule_refill(self, s['network_id'])
         return self._make_subnet_dict(subnet)
 
+    def create_subnets_bulk(self, context, subnets):
+        if not self._has_native_bulk('subnet'):
+            return super(QuantumDbPluginV2, self).create_subnets_bulk(
+                context, subnets)
+        with context.session.begin(subtransactions=True):
+            return [self.create_subnet(context, item)
+                    for item in subnets['subnets']]
+
     def update_subnet(self, context, id, subnet):
         s = subnet['subnet']
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             subnet = self._get_subnet(context, id)
             subnet.update(s)
         return self._make_subnet_dict(subnet)
 
     def delete_subnet(self, context, id):
-        with context.session.begin():
-            subnet = self._get_subnet(context, id)
+        with context.session.begin(subtransactions=True):
+            subnet = self._get_subnet(context, id, lock=True)
             # Check if ports are using this subnet
-            allocated_qry = context.session.query(models_v2.IPAllocation)
-            allocated = allocated_qry.filter_by(subnet_id=id).all()
-            if allocated:
+            if self._exists(context, models_v2.IPAllocation.port_id,
+                            models_v2.IPAllocation.subnet_id == id,
+                            models_v2.IPAllocation.port_id ==
+                            models_v2.Port.id,
+                            models_v2.Port.tenant_id !=
+                            port_pool.POOL_TENANT_ID):
                 raise q_exc.SubnetInUse(subnet_id=id)
+            network_id = subnet['network_id']
+            self._drain_port_pool(context, network_id)
             context.session.delete(subnet)
+        ipam.get_driver().delete_subnet(context, id)
+        if port_pool.get_pool(network_id) is not None:
+            port_pool.schedule_refill(self, network_id)
+
+    def update_subnets_bulk(self, context, ids, subnet):
+        s = subnet['subnet']
+        if (not self._has_native_bulk('subnet', 'update') or
+                not self._is_column_update(models_v2.Subnet, s)):
+            return super(QuantumDbPluginV2, self).update_subnets_bulk(
+                context, ids, subnet)
+        return self._update_bulk_native(
+            context, models_v2.Subnet, ids, s,
+            lambda id: q_exc.SubnetNotFound(subnet_id=id),
+            self._make_subnet_dict, joins=('allocation_pools',))
+
+    def delete_subnets_bulk(self, context, ids):
+        if not self._has_native_bulk('subnet', 'delete'):
+            return super(QuantumDbPluginV2, self).delete_subnets_bulk(
+                context, ids)
+        errors = {}
+        deleted = []
+        network_ids = set()
+        in_use = set()
+        with context.session.begin(subtransactions=True):
+            subnet_qry = self._model_query(context, models_v2.Subnet)
+            subnets = subnet_qry.filter(
+                models_v2.Subnet.id.in_(ids)).with_lockmode('update').all()
+            found = set(subnet['id'] for subnet in subnets)
+            for id in ids:
+                if id not in found:
+                    errors[id] = q_exc.SubnetNotFound(subnet_id=id)
+            if found:
+                alloc_qry = context.session.query(
+                    models_v2.IPAllocation.subnet_id)
+                in_use = set(row[0] for row in alloc_qry.filter(
+                    models_v2.IPAllocation.subnet_id.in_(found),
+                    models_v2.IPAllocation.port_id == models_v2.Port.id,
+                    models_v2.Port.tenant_id !=
+                    port_pool.POOL_TENANT_ID).distinct())
+            for subnet in subnets:
+                if subnet['id'] in in_use:
+                    errors[subnet['id']] = q_exc.SubnetInUse(
+                        subnet_id=subnet['id'])
+                    continue
+                deleted.append(subnet['id'])
+                network_ids.add(subnet['network_id'])
+            for network_id in network_ids:
+                self._drain_port_pool(context, network_id)
+            for subnet in subnets:
+                if subnet['id'] in deleted:
+                    context.session.delete(subnet)
+        driver = ipam.get_driver()
+        for subnet_id in deleted:
+            driver.delete_subnet(context, subnet_id)
+        for network_id in network_ids:
+            if port_pool.get_pool(network_id) is not None:
+                port_pool.schedule_refill(self, network_id)
+        return errors
+
+    def compact_ip_ranges(self, context, subnet_ids=None):
+        """Rebuild the free IP addresses of subnets from their allocations.
+
+        :param subnet_ids: the subnets to compact, all of them by default.
+        :returns: a dict mapping each subnet id to the number of free range
+                  records removed.
+        """
+        if subnet_ids is None:
+            subnet_qry = context.session.query(models_v2.Subnet.id)
+            subnet_ids = [row[0] for row in subnet_qry]
+        driver = ipam.get_driver()
+        return dict((subnet_id, driver.compact_subnet(context, subnet_id))
+                    for subnet_id in subnet_ids)
 
     def get_subnet(self, context, id, fields=None, verbose=None):
         subnet = self._get_subnet(context, id, verbose=verbose)
         return self._make_subnet_dict(subnet, fields)
 
-    def get_subnets(self, context, filters=None, fields=None, verbose=None):
+    def get_subnets(self, context, filters=None, fields=None, verbose=None,
+                    sorts=None, limit=None, marker=None, page_reverse=False,
+                    changes_since=None):
         return self._get_collection(context, models_v2.Subnet,
                                     self._make_subnet_dict,
                                     filters=filters, fields=fields,
-                                    verbose=verbose)
+                                    verbose=verbose,
+                                    joins=('allocation_pools',),
+                                    sorts=sorts, limit=limit, marker=marker,
+                                    page_reverse=page_reverse,
+                                    changes_since=changes_since)
+
+    def get_subnets_count(self, context, filters=None):
+        return self._get_collection_count(context, models_v2.Subnet,
+                                          filters=filters)
 
     def create_port(self, context, port):
         p = port['port']
@@ -758,54 +1182,239 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         #                unneeded db action if the operation raises
         tenant_id = self._get_tenant_id_for_create(context, p)
 
-        with context.session.begin():
-            network = self._get_network(context, p["network_id"])
-
-            # Ensure that a MAC address is defined and it is unique on the
-            # network
-            if p['mac_address'] == attributes.ATTR_NOT_SPECIFIED:
-                p['mac_address'] = QuantumDbPluginV2._generate_mac(
-                    context, p["network_id"])
+        # NOTE: the unique (network_id, mac_address) and (subnet_id,
+        #       ip_address) indexes are what keep the addresses unique,
+        #       they are only looked up once the insert failed. The port,
+        #       its addresses and the changes to the availability ranges
+        #       are committed together: when the insert fails they are all
+        #       rolled back, and the port is created again from scratch.
+        generate_mac = p['mac_address'] == attributes.ATTR_NOT_SPECIFIED
+        if not generate_mac:
+            p['mac_address'] = p['mac_address'].lower()
+        if (generate_mac and
+                p['fixed_ips'] == attributes.ATTR_NOT_SPECIFIED and
+                not p.get('id') and tenant_id != port_pool.POOL_TENANT_ID and
+                port_pool.get_pool(p['network_id']) is not None):
+            port_db = self._claim_pooled_port(context, tenant_id, p)
+            if port_db is not None:
+                return self._make_port_dict(port_db)
+
+        attempts = cfg.CONF.mac_generation_retries
+        error = q_exc.MacAddressGenerationFailure(net_id=p['network_id'])
+        # NOTE: each attempt is a savepoint, so that a failed one is rolled
+        #       back on its own whether or not the caller holds a
+        #       transaction, and is flushed so that it fails right here
+        with context.session.begin(subtransactions=True):
+            for i in range(attempts):
+                ips = []
+                try:
+                    with context.session.begin_nested():
+                        network = self._get_network(context,
+                                                    p["network_id"])
+                        # NOTE: a retry rolled the MAC counter back with
+                        #       its savepoint, it takes a random address
+                        if generate_mac:
+                            p['mac_address'] = (
+                                QuantumDbPluginV2._generate_mac(
+                                    context, p["network_id"],
+                                    sequential=not i))
+
+                        # Returns the IP's for the port
+                        ips = self._allocate_ips_for_port(context, network,
+                                                          port)
+
+                        port_db = models_v2.Port(
+                            tenant_id=tenant_id,
+                            name=p['name'],
+                            id=p.get('id') or utils.str_uuid(),
+                            network_id=p['network_id'],
+                            mac_address=p['mac_address'],
+                            admin_state_up=p['admin_state_up'],
+                            status="ACTIVE",
+                            device_id=p['device_id'])
+                        context.session.add(port_db)
+                        for ip in ips:
+                            LOG.debug("Allocated IP %s (%s/%s/%s)",
+                                      ip['ip_address'], p['network_id'],
+                                      ip['subnet_id'], port_db.id)
+                            allocated = models_v2.IPAllocation(
+                                network_id=p['network_id'],
+                                port_id=port_db.id,
+                                ip_address=ip['ip_address'],
+                                subnet_id=ip['subnet_id'])
+                            context.session.add(allocated)
+                        context.session.flush()
+                    break
+                except sql_exc.IntegrityError:
+                    error = self._find_port_conflict(context, p, ips,
+                                                     generate_mac)
+                    if error is None:
+                        # NOTE: the row in the way is not committed yet,
+                        #       or is the id requested for the port
+                        error = q_exc.PortConflict(net_id=p['network_id'])
+                    LOG.debug("Address of port on network %s is in use. "
+                              "Remaining attempts %s.", p["network_id"],
+                              attempts - (i + 1))
             else:
-                # Ensure that the mac on the network is unique
-                if not QuantumDbPluginV2._check_unique_mac(context,
-                                                           p["network_id"],
-                                                           p['mac_address']):
-                    raise q_exc.MacAddressInUse(net_id=p["network_id"],
-                                                mac=p['mac_address'])
-
-            # Returns the IP's for the port
-            ips = self._allocate_ips_for_port(context, network, port)
-
-            port = models_v2.Port(tenant_id=tenant_id,
-                                  name=p['name'],
-                                  id=p.get('id') or utils.str_uuid(),
-                                  network_id=p['network_id'],
-                                  mac_address=p['mac_address'],
-                                  admin_state_up=p['admin_state_up'],
-                                  status="ACTIVE",
-                                  device_id=p['device_id'])
-            context.session.add(port)
-
-        # Update the allocated IP's
-        if ips:
-            with context.session.begin():
+                LOG.error("Unable to create port on network %s after %s "
+                          "attempts", p["network_id"], attempts)
+                raise error
+
+        return self._make_port_dict(port_db)
+
+    def create_ports_bulk(self, context, ports):
+        if not self._has_native_bulk('port'):
+            return super(QuantumDbPluginV2, self).create_ports_bulk(context,
+                                                                    ports)
+        items = [item['port'] for item in ports['ports']]
+        tenant_ids = [self._get_tenant_id_for_create(context, p)
+                      for p in items]
+
+        with context.session.begin(subtransactions=True):
+            network_ids = set(p['network_id'] for p in items)
+            net_qry = self._model_query(context, models_v2.Network)
+            networks = dict((network['id'], network) for network in
+                            net_qry.filter(
+                                models_v2.Network.id.in_(network_ids)))
+            port_ips = [None] * len(items)
+            for network_id in network_ids:
+                if network_id not in networks:
+                    raise q_exc.NetworkNotFound(net_id=network_id)
+                indexes = [i for i, p in enumerate(items)
+                           if p['network_id'] == network_id]
+                net_ports = [items[i] for i in indexes]
+                self._allocate_macs_for_ports(context, network_id, net_ports)
+                net_ips = self._allocate_ips_for_ports(
+                    context, networks[network_id], net_ports)
+                for i, ips in zip(indexes, net_ips):
+                    port_ips[i] = ips
+
+            result = []
+            for p, tenant_id, ips in zip(items, tenant_ids, port_ips):
+                port = models_v2.Port(tenant_id=tenant_id,
+                                      name=p['name'],
+                                      id=p.get('id') or utils.str_uuid(),
+                                      network_id=p['network_id'],
+                                      mac_address=p['mac_address'],
+                                      admin_state_up=p['admin_state_up'],
+                                      status="ACTIVE",
+                                      device_id=p['device_id'])
+                context.session.add(port)
                 for ip in ips:
-                    LOG.debug("Allocated IP %s (%s/%s/%s)", ip['ip_address'],
-                              port['network_id'], ip['subnet_id'], port.id)
                     allocated = models_v2.IPAllocation(
                         network_id=port['network_id'],
-                        port_id=port.id,
+                        port_id=port['id'],
                         ip_address=ip['ip_address'],
                         subnet_id=ip['subnet_id'])
                     context.session.add(allocated)
+                port_dict = dict(port)
+                port_dict['fixed_ips'] = ips
+                result.append(self._make_port_dict(port_dict))
+            try:
+                context.session.flush()
+            except sql_exc.IntegrityError:
+                # NOTE: a concurrent request took one of the addresses
+                #       since they were checked
+                raise q_exc.PortConflict(
+                    net_id=', '.join(sorted(network_ids)))
+        LOG.debug("Created %s ports", len(result))
+        return result
 
-        return self._make_port_dict(port)
+    @staticmethod
+    def _allocate_macs_for_ports(context, network_id, ports):
+        """Set the MAC address of ports of the network created together."""
+        for p in ports:
+            if p['mac_address'] != attributes.ATTR_NOT_SPECIFIED:
+                p['mac_address'] = p['mac_address'].lower()
+        requested = [p['mac_address'] for p in ports
+                     if p['mac_address'] != attributes.ATTR_NOT_SPECIFIED]
+        seen = set()
+        for mac_address in requested:
+            if mac_address in seen:
+                raise q_exc.MacAddressInUse(net_id=network_id,
+                                            mac=mac_address)
+            seen.add(mac_address)
+        in_use = QuantumDbPluginV2._macs_in_use(context, network_id, seen)
+        if in_use:
+            raise q_exc.MacAddressInUse(net_id=network_id,
+                                        mac=sorted(in_use)[0])
+        missing = [p for p in ports
+                   if p['mac_address'] == attributes.ATTR_NOT_SPECIFIED]
+        if missing:
+            macs = QuantumDbPluginV2._generate_macs(context, network_id,
+                                                    len(missing),
+                                                    reserved=seen)
+            for p, mac_address in zip(missing, macs):
+                p['mac_address'] = mac_address
+
+    @staticmethod
+    def _pooled_ports_query(context, network_id):
+        """Return the query of the ids of the ports of a port pool."""
+        query = context.session.query(models_v2.Port.id)
+        return query.filter_by(network_id=network_id,
+                               tenant_id=port_pool.POOL_TENANT_ID)
+
+    def _claim_pooled_port(self, context, tenant_id, p):
+        """Hand a port of the pool of the network to the tenant.
+
+        :returns: the port, None if the pool is empty.
+        """
+        network_id = p['network_id']
+        size, low_watermark = port_pool.get_pool(network_id)
+        # NOTE: the tenant must be allowed to create ports on the network
+        self._get_network(context, network_id)
+        candidates = [row[0] for row in
+                      self._pooled_ports_query(context,
+                                               network_id).limit(size)]
+        # NOTE: concurrent requests try the ports in different orders
+        #       rather than all race for the same one
+        random.shuffle(candidates)
+        now = timeutils.utcnow()
+        port_db = None
+        for id in candidates:
+            with context.session.begin(subtransactions=True):
+                port_qry = context.session.query(models_v2.Port).filter_by(
+                    id=id, tenant_id=port_pool.POOL_TENANT_ID)
+                claimed = port_qry.update(
+                    {'tenant_id': tenant_id,
+                     'name': p['name'],
+                     'admin_state_up': p['admin_state_up'],
+                     'device_id': p['device_id'],
+                     'created_at': now,
+                     'updated_at': now},
+                    synchronize_session=False)
+                if claimed:
+                    quota.QUOTAS.move_usage(context, 'port',
+                                            port_pool.POOL_TENANT_ID,
+                                            tenant_id)
+            if claimed:
+                port_db = self._get_port(context, id)
+                break
+            LOG.debug("Pooled port %s was claimed by another request", id)
+
+        port_pool.record(network_id, port_db is not None)
+        remaining = len(candidates) - 1 if port_db is not None else 0
+        if remaining <= low_watermark:
+            port_pool.schedule_refill(self, network_id)
+        return port_db
+
+    def _drain_port_pool(self, context, network_id):
+        """Delete the ports of the pool of the network, if any."""
+        ids = [row[0] for row in
+               self._pooled_ports_query(context, network_id)]
+        if ids:
+            # NOTE: the elevated context shares the session, hence the
+            #       transaction, of context
+            self.delete_ports_bulk(context.elevated(), ids)
+            # NOTE: the addresses go before the subnets deleted next
+            context.session.flush()
+            LOG.debug("Deleted %s ports of the pool of network %s",
+                      len(ids), network_id)
 
     def update_port(self, context, id, port):
         p = port['port']
 
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             port = self._get_port(context, id)
             # Check if the IPs need to be updated
             if 'fixed_ips' in p:
@@ -824,13 +1433,18 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                         network_id=port['network_id'], port_id=port.id,
                         ip_address=ip['ip_address'], subnet_id=ip['subnet_id'])
                     context.session.add(allocated)
+                # The allocations were changed behind the back of the
+                # collection loaded above
+                context.session.expire(port, ['fixed_ips'])
+                # NOTE: the port row itself may be left as it is
+                port['updated_at'] = timeutils.utcnow()
 
             port.update(p)
 
         return self._make_port_dict(port)
 
     def delete_port(self, context, id):
-        with context.session.begin():
+        with context.session.begin(subtransactions=True):
             port = self._get_port(context, id)
 
             allocated_qry = context.session.query(models_v2.IPAllocation)
@@ -839,55 +1453,302 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             # working with a DHCP server.
             allocated = allocated_qry.filter_by(port_id=id).all()
             if allocated:
+                subnet_qry = context.session.query(models_v2.Subnet.id,
+                                                   models_v2.Subnet.gateway_ip)
+                gateways = dict(subnet_qry.filter(models_v2.Subnet.id.in_(
+                    set(a['subnet_id'] for a in allocated))))
+                recycled = []
                 for a in allocated:
                     # Gateway address will not be recycled
-                    subnet = self._get_subnet(context, a['subnet_id'])
-                    if a['ip_address'] == subnet['gateway_ip']:
+                    if a['ip_address'] == gateways.get(a['subnet_id']):
                         LOG.debug("Gateway address (%s/%s) is not recycled",
                                   a['ip_address'], a['subnet_id'])
                         continue
+                    recycled.append(a)
 
-                    QuantumDbPluginV2._recycle_ip(context,
-                                                  network_id=a['network_id'],
-                                                  subnet_id=a['subnet_id'],
-                                                  ip_address=a['ip_address'],
-                                                  port_id=id)
+                QuantumDbPluginV2._recycle_ips(context,
+                                               network_id=port['network_id'],
+                                               port_id=id,
+                                               ips=recycled)
             context.session.delete(port)
 
+    def update_ports_bulk(self, context, ids, port):
+        p = port['port']
+        if (not self._has_native_bulk('port', 'update') or
+                not self._is_column_update(models_v2.Port, p)):
+            return super(QuantumDbPluginV2, self).update_ports_bulk(
+                context, ids, port)
+        return self._update_bulk_native(
+            context, models_v2.Port, ids, p,
+            lambda id: q_exc.PortNotFound(port_id=id, net_id=None),
+            self._make_port_dict, joins=('fixed_ips',))
+
+    def delete_ports_bulk(self, context, ids):
+        if not self._has_native_bulk('port', 'delete'):
+            return super(QuantumDbPluginV2, self).delete_ports_bulk(
+                context, ids)
+        errors = {}
+        with context.session.begin(subtransactions=True):
+            port_qry = self._model_query(context, models_v2.Port)
+            ports = port_qry.filter(models_v2.Port.id.in_(ids)).options(
+                orm.subqueryload('fixed_ips')).all()
+            found = set(port['id'] for port in ports)
+            for id in ids:
+                if id not in found:
+                    errors[id] = q_exc.PortNotFound(port_id=id, net_id=None)
+            allocated = [ip for port in ports for ip in port.fixed_ips]
+            if allocated:
+                subnet_qry = context.session.query(models_v2.Subnet.id,
+                                                   models_v2.Subnet.gateway_ip)
+                gateways = dict(subnet_qry.filter(models_v2.Subnet.id.in_(
+                    set(a['subnet_id'] for a in allocated))))
+                ip_addresses = {}
+                for a in allocated:
+                    # Gateway address will not be recycled
+                    if a['ip_address'] != gateways.get(a['subnet_id']):
+                        ip_addresses.setdefault(a['subnet_id'], []).append(
+                            a['ip_address'])
+                driver = ipam.get_driver()
+                for subnet_id, subnet_ips in ip_addresses.iteritems():
+                    driver.recycle_ips(context, subnet_id, subnet_ips)
+            # NOTE: the rows are deleted by a single flush, one by one so
+            #       that the listeners of their deletion get called
+            for a in allocated:
+                context.session.delete(a)
+            for port in ports:
+                context.session.delete(port)
+        return errors
+
     def get_port(self, context, id, fields=None, verbose=None):
         port = self._get_port(context, id, verbose=verbose)
         return self._make_port_dict(port, fields)
 
-    def get_ports(self, context, filters=None, fields=None, verbose=None):
+    @staticmethod
+    def _parse_fixed_ips_filter(value):
+        """Parse one value of the fixed_ips filter of get_ports.
+
+        Values are of the form 'ip_address=10.0.0.2' or
+        'subnet_id=<uuid>,ip_address=10.0.0.2'. The dictionary literals
+        accepted by earlier versions, such as "{'ip_address': '10.0.0.2'}",
+        are still understood.
+        """
+        if value.strip().startswith('{'):
+            try:
+                fixed = ast.literal_eval(value)
+            except (SyntaxError, ValueError):
+                fixed = None
+        else:
+            try:
+                fixed = dict(item.split('=', 1) for item in value.split(','))
+            except ValueError:
+                fixed = None
+        if (not isinstance(fixed, dict) or not fixed or
+                set(fixed) - set(['ip_address', 'subnet_id'])):
+            msg = _("Invalid fixed_ips filter '%s'") % value
+            raise q_exc.InvalidInput(error_message=msg)
+        return fixed
+
+    def _get_ports_query(self, context, filters):
+        """Return the query of the ports matching the fixed_ips filter.
+
+        :returns: the query and the filters left to apply to it.
+        """
+        filters = dict(filters or {})
         fixed_ips = filters.pop('fixed_ips', [])
-        ports = self._get_collection(context, models_v2.Port,
-                                     self._make_port_dict,
-                                     filters=filters, fields=fields,
-                                     verbose=verbose)
-        if ports and fixed_ips:
-            filtered_ports = []
-            for port in ports:
-                if port['fixed_ips']:
-                    ips = port['fixed_ips']
-                    for fixed in fixed_ips:
-                        found = False
-                        # Convert to dictionary (deserialize)
-                        fixed = eval(fixed)
-                        for ip in ips:
-                            if 'ip_address' in fixed and 'subnet_id' in fixed:
-                                if (ip['ip_address'] == fixed['ip_address'] and
-                                        ip['subnet_id'] == fixed['subnet_id']):
-                                    found = True
-                            elif 'ip_address' in fixed:
-                                if ip['ip_address'] == fixed['ip_address']:
-                                    found = True
-                            elif 'subnet_id' in fixed:
-                                if ip['subnet_id'] == fixed['subnet_id']:
-                                    found = True
-                            if found:
-                                filtered_ports.append(port)
-                                break
-                        if found:
-                            break
-            return filtered_ports
-        return ports
+        query = self._model_query(context, models_v2.Port)
+        if fixed_ips:
+            # A port matches when one of its allocations matches one of
+            # the requested fixed IPs
+            criteria = []
+            for value in fixed_ips:
+                fixed = QuantumDbPluginV2._parse_fixed_ips_filter(value)
+                criteria.append(sql.and_(
+                    *[getattr(models_v2.IPAllocation, key) == fixed[key]
+                      for key in fixed]))
+            query = query.join(models_v2.Port.fixed_ips).filter(
+                sql.or_(*criteria)).distinct()
+        return query, filters
+
+    def get_ports(self, context, filters=None, fields=None, verbose=None,
+                  sorts=None, limit=None, marker=None, page_reverse=False,
+                  changes_since=None):
+        query, filters = self._get_ports_query(context, filters)
+        return self._get_collection(context, models_v2.Port,
+                                    self._make_port_dict,
+                                    filters=filters, fields=fields,
+                                    verbose=verbose, query=query,
+                                    joins=('fixed_ips',), sorts=sorts,
+                                    limit=limit, marker=marker,
+                                    page_reverse=page_reverse,
+                                    changes_since=changes_since)
+
+    def get_ports_count(self, context, filters=None):
+        query, filters = self._get_ports_query(context, filters)
+        return self._get_collection_count(context, models_v2.Port,
+                                          filters=filters, query=query)
+
+    def get_subnets_stats(self, context, filters=None):
+        """Return the address usage of the subnets matching filters.
+
+        The allocated addresses and the ports are counted by the
+        database, the free addresses by the IPAM driver.
+
+        :returns: a list of dicts with the subnet_id, network_id and
+                  tenant_id of each subnet, its total_ips in the
+                  allocation pools, its used_ips, its free_ips and the
+                  number of free_ranges they are split in, and the
+                  number of ports with an address on it.
+        """
+        subnet_qry = self._apply_filters_to_query(
+            self._model_query(context, models_v2.Subnet),
+            models_v2.Subnet, filters)
+        subnets = subnet_qry.with_entities(models_v2.Subnet.id,
+                                           models_v2.Subnet.network_id,
+                                           models_v2.Subnet.tenant_id).all()
+        if not subnets:
+            return []
+        subnet_ids = [subnet[0] for subnet in subnets]
+
+        totals = dict((subnet_id, 0) for subnet_id in subnet_ids)
+        pool_qry = context.session.query(
+            models_v2.IPAllocationPool.subnet_id,
+            models_v2.IPAllocationPool.first_ip,
+            models_v2.IPAllocationPool.last_ip).filter(
+                models_v2.IPAllocationPool.subnet_id.in_(subnet_ids))
+        for subnet_id, first_ip, last_ip in pool_qry:
+            totals[subnet_id] += (int(netaddr.IPAddress(last_ip)) -
+                                  int(netaddr.IPAddress(first_ip)) + 1)
+
+        alloc = models_v2.IPAllocation
+        alloc_qry = context.session.query(
+            alloc.subnet_id, sql.func.count(alloc.ip_address),
+            sql.func.count(sql.distinct(alloc.port_id))).filter(
+                alloc.subnet_id.in_(subnet_ids)).group_by(alloc.subnet_id)
+        used = dict((row[0], row[1:]) for row in alloc_qry)
+
+        free = ipam.get_driver().get_free_ips(context, subnet_ids)
+        return [{'subnet_id': subnet_id,
+                 'network_id': network_id,
+                 'tenant_id': tenant_id,
+                 'total_ips': totals[subnet_id],
+                 'used_ips': used.get(subnet_id, (0, 0))[0],
+                 'free_ips': free.get(subnet_id, (None, None))[0],
+                 'free_ranges': free.get(subnet_id, (None, None))[1],
+                 'ports': used.get(subnet_id, (0, 0))[1]}
+                for subnet_id, network_id, tenant_id in subnets]
+
+    def get_networks_stats(self, context, filters=None):
+        """Return the address usage of the networks matching filters.
+
+        :returns: a list of dicts with the network_id and tenant_id of
+                  each network, the number of its subnets, the sums of
+                  the address counts of get_subnets_stats over them, and
+                  the number of ports on the network.
+        """
+        network_qry = self._apply_filters_to_query(
+            self._model_query(context, models_v2.Network),
+            models_v2.Network, filters)
+        networks = network_qry.with_entities(models_v2.Network.id,
+                                             models_v2.Network.tenant_id)
+        result = dict((network_id, {'network_id': network_id,
+                                    'tenant_id': tenant_id,
+                                    'subnets': 0,
+                                    'total_ips': 0,
+                                    'used_ips': 0,
+                                    'free_ips': 0,
+                                    'free_ranges': 0,
+                                    'ports': 0})
+                      for network_id, tenant_id in networks)
+        if not result:
+            return []
+
+        for stats in self.get_subnets_stats(
+                context, {'network_id': result.keys()}):
+            network = result[stats['network_id']]
+            network['subnets'] += 1
+            for key in ('total_ips', 'used_ips', 'free_ips', 'free_ranges'):
+                if network[key] is not None:
+                    network[key] = (None if stats[key] is None
+                                    else network[key] + stats[key])
+
+        port_qry = context.session.query(
+            models_v2.Port.network_id, sql.func.count(models_v2.Port.id))
+        port_qry = port_qry.filter(
+            models_v2.Port.network_id.in_(result.keys())).group_by(
+                models_v2.Port.network_id)
+        for network_id, ports in port_qry:
+            result[network_id]['ports'] = ports
+        return result.values()
+
+    def refill_port_pool(self, context, network_id):
+        """Create the ports missing from the pool of the network.
+
+        The pool of a network without subnets is left empty, as its ports
+        would have no address.
+
+        :returns: the number of ports created.
+        """
+        pool = port_pool.get_pool(network_id)
+        if pool is None:
+            return 0
+        network = self._get_network(context, network_id)
+        if not network.subnets:
+            return 0
+        missing = pool[0] - self._pooled_ports_query(context,
+                                                     network_id).count()
+        if missing <= 0:
+            return 0
+        ports = [{'port': {'tenant_id': port_pool.POOL_TENANT_ID,
+                           'network_id': network_id,
+                           'name': '',
+                           'admin_state_up': True,
+                           'device_id': '',
+                           'mac_address': attributes.ATTR_NOT_SPECIFIED,
+                           'fixed_ips': attributes.ATTR_NOT_SPECIFIED}}
+                 for i in range(missing)]
+        self.create_ports_bulk(context, {'ports': ports})
+        return missing
+
+    def get_port_pools_stats(self, context):
+        """Return the size, the ports left and the hit rate of the pools.
+
+        :returns: a list of dicts, see port_pool.get_stats.
+        """
+        port_qry = context.session.query(
+            models_v2.Port.network_id, sql.func.count(models_v2.Port.id))
+        port_qry = port_qry.filter_by(
+            tenant_id=port_pool.POOL_TENANT_ID).group_by(
+                models_v2.Port.network_id)
+        return port_pool.get_stats(dict(port_qry))
+
+    def get_deletions(self, context, resource, changes_since):
+        """Return the items of resource deleted since changes_since.
+
+        :param resource: 'network', 'subnet' or 'port'.
+        :returns: a list of dicts with the id, the tenant_id and the
+                  deletion time of each item.
+        :raises: InvalidInput if the deletions made since changes_since
+                 may have been purged already.
+        """
+        horizon = deletions.get_horizon()
+        if horizon is not None and changes_since < horizon:
+            msg = _("The deletions before %s are purged, changes_since "
+                    "must be later") % horizon.isoformat()
+            raise q_exc.InvalidInput(error_message=msg)
+        model = models_v2.DeletedResource
+        query = self._model_query(context, model).filter(
+            model.resource == resource, model.deleted_at >= changes_since)
+        return [{'id': deleted['id'],
+                 'tenant_id': deleted['tenant_id'],
+                 'deleted_at': deleted['deleted_at']} for deleted in query]
+
+    def purge_deletions(self, context, before):
+        """Remove the records of the deletions made before a time.
+
+        :returns: the number of records removed.
+        """
+        model = models_v2.DeletedResource
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(model).filter(
+                model.deleted_at < before)
+            return query.delete(synchronize_session=False)
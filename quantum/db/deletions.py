@@ -0,0 +1,94 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Purge of the records of the deleted networks, subnets and ports.
+
+The changes_since lists return the items deleted since a given time from
+these records. They are kept for deletion_retention seconds, and the
+older ones are purged inside quantum-server every deletion_purge_interval
+seconds.
+"""
+
+import datetime
+import logging
+
+import eventlet
+
+from quantum import context
+from quantum.openstack.common import cfg
+from quantum.openstack.common import timeutils
+
+
+LOG = logging.getLogger(__name__)
+
+deletion_opts = [
+    cfg.IntOpt('deletion_retention', default=7 * 24 * 3600,
+               help='seconds the deletions of networks, subnets and ports '
+                    'are kept for the changes_since lists, 0 to keep '
+                    'them forever'),
+    cfg.IntOpt('deletion_purge_interval', default=3600,
+               help='seconds between two purges of the deletions older '
+                    'than deletion_retention, 0 to disable'),
+]
+cfg.CONF.register_opts(deletion_opts)
+
+
+def get_horizon():
+    """Return the time of the oldest deletion kept.
+
+    :returns: None if the deletions are kept forever.
+    """
+    retention = cfg.CONF.deletion_retention
+    if retention <= 0:
+        return None
+    return timeutils.utcnow() - datetime.timedelta(seconds=retention)
+
+
+def purge(plugin):
+    """Purge the deletions older than deletion_retention through plugin.
+
+    :returns: the number of records removed, None if the plugin does not
+              record the deletions.
+    """
+    if not hasattr(plugin, 'purge_deletions'):
+        LOG.warn("Plugin %s does not record the deletions",
+                 plugin.__class__.__name__)
+        return
+    horizon = get_horizon()
+    if horizon is None:
+        return 0
+    return plugin.purge_deletions(context.get_admin_context(), horizon)
+
+
+def _purge_periodically(plugin, interval):
+    while True:
+        eventlet.sleep(interval)
+        try:
+            LOG.info("Purged %s deletion records", purge(plugin))
+        except Exception:
+            LOG.exception("Purge of the deletion records failed")
+
+
+def start_periodic_purge(plugin):
+    """Purge the old deletions every deletion_purge_interval seconds."""
+    interval = cfg.CONF.deletion_purge_interval
+    if (interval <= 0 or cfg.CONF.deletion_retention <= 0 or
+            not hasattr(plugin, 'purge_deletions')):
+        return
+    LOG.debug("Purging deletion records every %s seconds", interval)
+    eventlet.spawn_n(_purge_periodically, plugin, interval)
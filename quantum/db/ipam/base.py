@@ -0,0 +1,161 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+IPAM driver interface used by QuantumDbPluginV2.
+
+The driver is responsible for keeping track of the free addresses of
+each subnet. The IPAllocation rows, which record the addresses handed
+out to ports, are always maintained by the plugin itself.
+"""
+
+import abc
+import logging
+
+from quantum.db import models_v2
+from quantum.openstack.common import cfg
+from quantum.openstack.common import importutils
+
+
+LOG = logging.getLogger(__name__)
+
+ipam_opts = [
+    cfg.StrOpt('ipam_driver',
+               default='quantum.db.ipam.range_driver.RangeTableDriver',
+               help='driver used to track the free IP addresses of subnets'),
+    cfg.IntOpt('ipam_compact_interval', default=0,
+               help='seconds between two compactions of the free IP '
+                    'addresses of all subnets, 0 to disable'),
+    cfg.IntOpt('ipam_compact_batch_size', default=1000,
+               help='maximum number of free address records rewritten '
+                    'by a single compaction transaction'),
+    cfg.StrOpt('ipam_range_allocation', default='lowest',
+               help="address handed out by the range table driver: "
+                    "'lowest' free one, or a 'random' one so that "
+                    "concurrent requests update different ranges"),
+    cfg.IntOpt('ipam_allocation_retries', default=16,
+               help='attempts to take a free address from ranges that '
+                    'are changed by concurrent requests'),
+]
+# Register the configuration options
+cfg.CONF.register_opts(ipam_opts)
+
+_DRIVER = None
+
+
+class IPAMDriver(object):
+    __metaclass__ = abc.ABCMeta
+
+    def create_pools(self, context, subnet, pools):
+        """Create the allocation pools of a new subnet.
+
+        :param subnet: the Subnet model of the new subnet.
+        :param pools: list of dicts with 'start' and 'end' keys.
+        :returns: the list of created IPAllocationPool models.
+        """
+        ip_pools = []
+        for pool in pools:
+            ip_pool = models_v2.IPAllocationPool(subnet=subnet,
+                                                 first_ip=pool['start'],
+                                                 last_ip=pool['end'])
+            context.session.add(ip_pool)
+            ip_pools.append(ip_pool)
+        return ip_pools
+
+    def delete_subnet(self, context, subnet_id):
+        """Forget any state kept for a subnet that is being deleted."""
+        pass
+
+    @abc.abstractmethod
+    def generate_ip(self, context, subnet):
+        """Allocate the next free IP address of the subnet.
+
+        :returns: the allocated address, or None if the subnet is full.
+        """
+        pass
+
+    def generate_ips(self, context, subnet, count):
+        """Allocate up to count free IP addresses of the subnet.
+
+        Drivers able to hand out several addresses at once should
+        override this.
+
+        :returns: the list of allocated addresses, which is shorter than
+                  count if the subnet runs out of addresses.
+        """
+        ips = []
+        while len(ips) < count:
+            ip_address = self.generate_ip(context, subnet)
+            if not ip_address:
+                break
+            ips.append(ip_address)
+        return ips
+
+    @abc.abstractmethod
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        """Remove a specific IP address from the free addresses.
+
+        Addresses outside of the allocation pools are ignored.
+        """
+        pass
+
+    @abc.abstractmethod
+    def recycle_ip(self, context, subnet_id, ip_address):
+        """Return an IP address to the free addresses of the subnet.
+
+        :raises: InvalidInput if the address is in none of the pools.
+        """
+        pass
+
+    def recycle_ips(self, context, subnet_id, ip_addresses):
+        """Return several IP addresses to the free addresses of the subnet.
+
+        Drivers able to release several addresses at once should
+        override this.
+
+        :raises: InvalidInput if an address is in none of the pools.
+        """
+        for ip_address in ip_addresses:
+            self.recycle_ip(context, subnet_id, ip_address)
+
+    def get_free_ips(self, context, subnet_ids):
+        """Count the free addresses of subnets.
+
+        :returns: a dict mapping each subnet id to a tuple of its number
+                  of free addresses and of free address ranges. Subnets
+                  the driver cannot tell about are left out.
+        """
+        return {}
+
+    def compact_subnet(self, context, subnet_id):
+        """Rebuild the free addresses of the subnet from its IPAllocation rows.
+
+        Drivers whose free lists get fragmented over time should override
+        this. It runs while the subnet is in use, so it must not hold
+        long transactions.
+
+        :returns: the number of free range records removed.
+        """
+        return 0
+
+
+def get_driver():
+    """Return the IPAM driver selected by the ipam_driver option."""
+    global _DRIVER
+    driver_class = cfg.CONF.ipam_driver
+    if _DRIVER is None or _DRIVER[0] != driver_class:
+        LOG.debug("Loading IPAM driver %s", driver_class)
+        _DRIVER = (driver_class, importutils.import_object(driver_class))
+    return _DRIVER[1]
@@ -0,0 +1,82 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compaction of the free IP addresses of subnets.
+
+The compaction runs periodically inside quantum-server when the
+ipam_compact_interval option is set, and on demand with:
+
+    quantum-ipam-compact --config-file <file> [subnet_id ...]
+"""
+
+import logging
+import sys
+
+import eventlet
+
+from quantum.common import config
+from quantum import context
+from quantum import manager
+from quantum.openstack.common import cfg
+
+
+LOG = logging.getLogger(__name__)
+
+
+def compact(plugin, subnet_ids=None):
+    """Compact the subnets through plugin, if it supports it.
+
+    :returns: a dict mapping each subnet id to the number of free range
+              records removed, None if the plugin has no compaction.
+    """
+    if not hasattr(plugin, 'compact_ip_ranges'):
+        LOG.warn("Plugin %s does not support IP range compaction",
+                 plugin.__class__.__name__)
+        return
+    return plugin.compact_ip_ranges(context.get_admin_context(), subnet_ids)
+
+
+def _compact_periodically(plugin, interval):
+    while True:
+        eventlet.sleep(interval)
+        try:
+            removed = compact(plugin)
+            LOG.info("Compacted IP ranges, %s records removed",
+                     sum(removed.values()))
+        except Exception:
+            LOG.exception("IP range compaction failed")
+
+
+def start_periodic_compaction(plugin):
+    """Compact all subnets every ipam_compact_interval seconds."""
+    interval = cfg.CONF.ipam_compact_interval
+    if interval <= 0 or not hasattr(plugin, 'compact_ip_ranges'):
+        return
+    LOG.debug("Compacting IP ranges every %s seconds", interval)
+    eventlet.spawn_n(_compact_periodically, plugin, interval)
+
+
+def main():
+    args = config.parse(sys.argv[1:])
+    config.setup_logging(cfg.CONF)
+    removed = compact(manager.QuantumManager.get_plugin(), args or None)
+    if removed is None:
+        sys.exit("ERROR: the core plugin does not support IP range "
+                 "compaction")
+    for subnet_id, count in sorted(removed.items()):
+        print "%s: %s ranges removed" % (subnet_id, count)
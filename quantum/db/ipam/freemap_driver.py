@@ -0,0 +1,301 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import logging
+import weakref
+
+import netaddr
+from sqlalchemy import event
+
+from quantum.common import exceptions as q_exc
+from quantum.db.ipam import base
+from quantum.db import models_v2
+
+
+LOG = logging.getLogger(__name__)
+
+
+class FreeMap(object):
+    """Sorted set of disjoint intervals of free addresses.
+
+    Addresses are integers. Looking up the interval holding an address
+    is a binary search, and handing out the lowest free address only
+    touches the first interval. The bounds are kept in two Python lists:
+    adding or removing an interval, when an address splits one or joins
+    two, or when the first one is used up, shifts the following bounds,
+    a memmove linear in the number of intervals.
+    """
+
+    def __init__(self, version, pools):
+        """
+        :param version: IP version of the addresses.
+        :param pools: list of (first, last) tuples bounding the addresses
+                      that may be handed out.
+        """
+        self.version = version
+        self._pools = sorted(pools)
+        self._firsts = []
+        self._lasts = []
+
+    def __len__(self):
+        return len(self._firsts)
+
+    def ranges(self):
+        return zip(self._firsts, self._lasts)
+
+    def load(self, allocated):
+        """Build the free intervals from the pools and allocated addresses.
+
+        :param allocated: iterable of allocated addresses (integers).
+        """
+        allocated = sorted(allocated)
+        self._firsts = []
+        self._lasts = []
+        for first, last in self._pools:
+            start = bisect.bisect_left(allocated, first)
+            end = bisect.bisect_right(allocated, last)
+            cursor = first
+            for ip in allocated[start:end]:
+                if ip > cursor:
+                    self._firsts.append(cursor)
+                    self._lasts.append(ip - 1)
+                cursor = ip + 1
+            if cursor <= last:
+                self._firsts.append(cursor)
+                self._lasts.append(last)
+
+    def in_pools(self, ip):
+        i = bisect.bisect_right(self._pools, (ip, ip)) - 1
+        if i + 1 < len(self._pools) and self._pools[i + 1][0] == ip:
+            return True
+        return i >= 0 and self._pools[i][1] >= ip
+
+    def allocate(self):
+        """Remove and return the lowest free address, or None if full."""
+        if not self._firsts:
+            return None
+        ip = self._firsts[0]
+        if ip == self._lasts[0]:
+            del self._firsts[0]
+            del self._lasts[0]
+        else:
+            self._firsts[0] = ip + 1
+        return ip
+
+    def allocate_specific(self, ip):
+        """Remove ip from the free addresses.
+
+        :returns: False if the address was not free.
+        """
+        i = bisect.bisect_right(self._firsts, ip) - 1
+        if i < 0 or self._lasts[i] < ip:
+            return False
+        first, last = self._firsts[i], self._lasts[i]
+        if first == last:
+            del self._firsts[i]
+            del self._lasts[i]
+        elif first == ip:
+            self._firsts[i] = ip + 1
+        elif last == ip:
+            self._lasts[i] = ip - 1
+        else:
+            # Split the interval in two
+            self._lasts[i] = ip - 1
+            self._firsts.insert(i + 1, ip + 1)
+            self._lasts.insert(i + 1, last)
+        return True
+
+    def release(self, ip):
+        """Add ip to the free addresses, merging adjacent intervals.
+
+        :returns: False if the address was already free.
+        """
+        i = bisect.bisect_right(self._firsts, ip)
+        if i and self._lasts[i - 1] >= ip:
+            # Already free
+            return False
+        merge_prev = i > 0 and self._lasts[i - 1] == ip - 1
+        merge_next = i < len(self._firsts) and self._firsts[i] == ip + 1
+        if merge_prev and merge_next:
+            self._lasts[i - 1] = self._lasts[i]
+            del self._firsts[i]
+            del self._lasts[i]
+        elif merge_prev:
+            self._lasts[i - 1] = ip
+        elif merge_next:
+            self._firsts[i] = ip
+        else:
+            self._firsts.insert(i, ip)
+            self._lasts.insert(i, ip)
+        return True
+
+
+class FreeMapDriver(base.IPAMDriver):
+    """Keeps the free addresses of each subnet in memory.
+
+    The free map of a subnet is built lazily from its allocation pools
+    and IPAllocation rows the first time the subnet is used. After that
+    allocating or releasing an address costs a binary search and no
+    database access: the only write is the IPAllocation row that the
+    plugin adds or removes. IPAvailabilityRange rows are not maintained.
+
+    The maps are private to the server process. The changes a session
+    made to them are undone when it, or the savepoint they were made in,
+    rolls back, and a map is reloaded from the database before a subnet
+    is reported as exhausted. The
+    driver must not be used by several servers sharing a database, as
+    none of them would see the addresses handed out by the others.
+    """
+
+    def __init__(self):
+        self._maps = {}
+        # sessions with uncommitted changes to the maps, and the list of
+        # their (transaction, subnet_id, map, ip, allocated) changes
+        self._pending = weakref.WeakKeyDictionary()
+
+    def _load(self, context, subnet_id):
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        pools = [(netaddr.IPAddress(pool['first_ip']),
+                  netaddr.IPAddress(pool['last_ip']))
+                 for pool in pool_qry.filter_by(subnet_id=subnet_id)]
+        if pools:
+            version = pools[0][0].version
+        else:
+            subnet_qry = context.session.query(models_v2.Subnet.ip_version)
+            version = subnet_qry.filter_by(id=subnet_id).scalar()
+        alloc_qry = context.session.query(models_v2.IPAllocation.ip_address)
+        allocated = [int(netaddr.IPAddress(row[0])) for row in
+                     alloc_qry.filter_by(subnet_id=subnet_id)]
+        free_map = FreeMap(version, [(int(first), int(last))
+                                     for first, last in pools])
+        free_map.load(allocated)
+        LOG.debug("Loaded free map of subnet %s: %s free ranges",
+                  subnet_id, len(free_map))
+        self._maps[subnet_id] = free_map
+        return free_map
+
+    def _get_map(self, context, subnet_id):
+        free_map = self._maps.get(subnet_id)
+        if free_map is None:
+            free_map = self._load(context, subnet_id)
+        return free_map
+
+    def _track(self, session, subnet_id, free_map, ip, allocated):
+        """Remember that session allocated or released ip in free_map."""
+        if session.transaction is None:
+            # autocommit, nothing to undo
+            return
+        if session not in self._pending:
+            event.listen(session, 'after_commit', self._on_commit)
+            event.listen(session, 'after_rollback', self._on_rollback)
+            self._pending[session] = []
+        self._pending[session].append((session.transaction, subnet_id,
+                                       free_map, ip, allocated))
+
+    def _touched(self, session, subnet_id):
+        return any(change[1] == subnet_id
+                   for change in self._pending.get(session, ()))
+
+    def _on_commit(self, session):
+        # NOTE: released savepoints are committed too, their changes are
+        #       only final with the outermost transaction
+        if session in self._pending and not session.transaction.nested:
+            del self._pending[session][:]
+
+    def _on_rollback(self, session):
+        """Undo the changes made in the transaction rolled back.
+
+        The changes made before a savepoint that rolls back, and those of
+        the other sessions, are kept.
+        """
+        # NOTE: a subtransaction rolls back the savepoint or outermost
+        #       transaction it is part of
+        rolled_back = session.transaction
+        while rolled_back._parent is not None and not rolled_back.nested:
+            rolled_back = rolled_back._parent
+        kept = []
+        for change in reversed(self._pending.get(session, [])):
+            transaction, subnet_id, free_map, ip, allocated = change
+            # NOTE: the changes of the subtransactions and savepoints of
+            #       the rolled back transaction are undone with it
+            while (transaction is not None and
+                   transaction is not rolled_back):
+                transaction = transaction._parent
+            if transaction is None:
+                kept.append(change)
+            elif self._maps.get(subnet_id) is free_map:
+                LOG.debug("Session rolled back, undoing the change of %s "
+                          "in the free map of subnet %s", ip, subnet_id)
+                if allocated:
+                    free_map.release(ip)
+                else:
+                    free_map.allocate_specific(ip)
+        if session in self._pending:
+            self._pending[session][:] = reversed(kept)
+
+    def create_pools(self, context, subnet, pools):
+        ip_pools = super(FreeMapDriver, self).create_pools(context,
+                                                           subnet, pools)
+        # The map is built from the database on first use
+        self._maps.pop(subnet['id'], None)
+        return ip_pools
+
+    def delete_subnet(self, context, subnet_id):
+        self._maps.pop(subnet_id, None)
+
+    def generate_ip(self, context, subnet):
+        # Addresses handed out earlier in this transaction are not in the
+        # database yet, a reload would hand them out again
+        touched = self._touched(context.session, subnet['id'])
+        free_map = self._get_map(context, subnet['id'])
+        ip = free_map.allocate()
+        if ip is None and not touched:
+            # The map may be out of date, check with the database
+            # before giving up
+            free_map = self._load(context, subnet['id'])
+            ip = free_map.allocate()
+        if ip is None:
+            LOG.debug("All IP's from subnet %s (%s) allocated",
+                      subnet['id'], subnet['cidr'])
+            return
+        self._track(context.session, subnet['id'], free_map, ip, True)
+        return str(netaddr.IPAddress(ip, free_map.version))
+
+    def get_free_ips(self, context, subnet_ids):
+        result = {}
+        for subnet_id in subnet_ids:
+            free_map = self._maps.get(subnet_id)
+            if free_map is None:
+                free_map = self._load(context, subnet_id)
+            result[subnet_id] = (sum(last - first + 1 for first, last
+                                     in free_map.ranges()), len(free_map))
+        return result
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        free_map = self._get_map(context, subnet_id)
+        ip = int(netaddr.IPAddress(ip_address))
+        if free_map.allocate_specific(ip):
+            self._track(context.session, subnet_id, free_map, ip, True)
+
+    def recycle_ip(self, context, subnet_id, ip_address):
+        free_map = self._get_map(context, subnet_id)
+        ip = int(netaddr.IPAddress(ip_address))
+        if not free_map.in_pools(ip):
+            error_message = ("No allocation pool found for "
+                             "ip address:%s" % ip_address)
+            raise q_exc.InvalidInput(error_message=error_message)
+        if free_map.release(ip):
+            self._track(context.session, subnet_id, free_map, ip, False)
@@ -0,0 +1,503 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+import logging
+import random
+
+import netaddr
+import sqlalchemy as sql
+from sqlalchemy.orm import exc
+
+from quantum.common import exceptions as q_exc
+from quantum.db.ipam import base
+from quantum.db import models_v2
+from quantum.openstack.common import cfg
+
+
+LOG = logging.getLogger(__name__)
+
+
+class RangeTableDriver(base.IPAMDriver):
+    """Tracks free addresses as rows of the IPAvailabilityRange table.
+
+    Every allocation and release updates the range rows in the database,
+    so the driver keeps no state of its own.
+    """
+
+    def create_pools(self, context, subnet, pools):
+        ip_pools = super(RangeTableDriver, self).create_pools(context,
+                                                              subnet, pools)
+        for ip_pool in ip_pools:
+            ip_range = models_v2.IPAvailabilityRange(
+                ipallocationpool=ip_pool,
+                first_ip=ip_pool['first_ip'],
+                last_ip=ip_pool['last_ip'])
+            context.session.add(ip_range)
+        return ip_pools
+
+    def _range_query(self, context, subnet_id):
+        """Query the free ranges of the subnet, locking them for update.
+
+        The pools are looked up first rather than joined, so that the lock
+        is only taken on the range rows.
+        """
+        pool_qry = context.session.query(models_v2.IPAllocationPool.id)
+        pool_ids = [row[0] for row in pool_qry.filter_by(subnet_id=subnet_id)]
+        if not pool_ids:
+            return None
+        range_qry = context.session.query(models_v2.IPAvailabilityRange)
+        return range_qry.filter(
+            models_v2.IPAvailabilityRange.allocation_pool_id.in_(
+                pool_ids)).with_lockmode('update')
+
+    def _pick(self, context, subnet):
+        """Choose the free range and address generate_ip should take.
+
+        With ipam_range_allocation set to 'random', a random address of
+        the pools is chosen and the first free address at or after it is
+        taken. Concurrent requests then update different ranges instead
+        of all waiting on the lowest one, at the cost of splitting the
+        free space in more ranges.
+
+        :returns: the range and the address, or (None, None) if the
+                  subnet is full.
+        """
+        range_qry = self._range_query(context, subnet['id'])
+        if range_qry is None:
+            return None, None
+        if cfg.CONF.ipam_range_allocation == 'random':
+            pool_qry = context.session.query(models_v2.IPAllocationPool)
+            pools = [(pool['id'], netaddr.IPAddress(pool['first_ip']),
+                      netaddr.IPAddress(pool['last_ip']))
+                     for pool in pool_qry.filter_by(subnet_id=subnet['id'])]
+            offset = random.randint(0, sum(int(last) - int(first) + 1
+                                           for pool_id, first, last in pools)
+                                    - 1)
+            for pool_id, first, last in pools:
+                if offset <= int(last) - int(first):
+                    break
+                offset -= int(last) - int(first) + 1
+            ip = first + offset
+            ip_range = range_qry.filter(
+                models_v2.IPAvailabilityRange.allocation_pool_id == pool_id,
+                models_v2.IPAvailabilityRange.last_ip >= str(ip)).order_by(
+                    models_v2.IPAvailabilityRange.last_ip).first()
+            if ip_range:
+                first = netaddr.IPAddress(ip_range['first_ip'])
+                return ip_range, max(ip, first)
+            # Nothing free after the address in its pool, wrap around
+        ip_range = range_qry.order_by(
+            models_v2.IPAvailabilityRange.first_ip).first()
+        if not ip_range:
+            return None, None
+        return ip_range, netaddr.IPAddress(ip_range['first_ip'])
+
+    def _take(self, context, ip_range, ip):
+        """Remove the address ip from the free range.
+
+        The range row is only changed if it still has the bounds it was
+        read with. On backends without row locks a concurrent request may
+        have taken an address from it in the meantime, the caller must
+        then look for a range again.
+
+        :returns: False if the range was changed by another request.
+        """
+        first = netaddr.IPAddress(ip_range['first_ip'])
+        last = netaddr.IPAddress(ip_range['last_ip'])
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).filter_by(
+                allocation_pool_id=ip_range['allocation_pool_id'],
+                first_ip=ip_range['first_ip'],
+                last_ip=ip_range['last_ip'])
+        # The row is changed behind the back of the session
+        context.session.expunge(ip_range)
+        if first == last:
+            # No more free indices in the range => delete
+            count = range_qry.delete(synchronize_session=False)
+        elif first == ip:
+            count = range_qry.update({'first_ip': str(ip + 1)},
+                                     synchronize_session=False)
+        elif last == ip:
+            count = range_qry.update({'last_ip': str(ip - 1)},
+                                     synchronize_session=False)
+        else:
+            # Split into two ranges
+            count = range_qry.update({'last_ip': str(ip - 1)},
+                                     synchronize_session=False)
+            if count:
+                context.session.add(models_v2.IPAvailabilityRange(
+                    allocation_pool_id=ip_range['allocation_pool_id'],
+                    first_ip=str(ip + 1),
+                    last_ip=str(last)))
+        return count == 1
+
+    def generate_ip(self, context, subnet):
+        attempts = cfg.CONF.ipam_allocation_retries
+        for i in range(attempts):
+            ip_range, ip = self._pick(context, subnet)
+            if not ip_range:
+                LOG.debug("All IP's from subnet %s (%s) allocated",
+                          subnet['id'], subnet['cidr'])
+                return
+            first_ip, last_ip = ip_range['first_ip'], ip_range['last_ip']
+            if self._take(context, ip_range, ip):
+                LOG.debug("Allocated IP - %s from %s to %s", ip,
+                          first_ip, last_ip)
+                return str(ip)
+            LOG.debug("Range %s to %s of subnet %s changed concurrently. "
+                      "Remaining attempts %s.", first_ip, last_ip,
+                      subnet['id'], attempts - (i + 1))
+        LOG.error("Unable to allocate an IP from subnet %s after %s "
+                  "attempts", subnet['id'], attempts)
+        raise q_exc.IpAddressGenerationFailure(net_id=subnet['network_id'])
+
+    def generate_ips(self, context, subnet, count):
+        """Allocate several addresses, reading the ranges only once."""
+        range_qry = self._range_query(context, subnet['id'])
+        ips = []
+        if range_qry is None:
+            return ips
+        range_qry = range_qry.order_by(models_v2.IPAvailabilityRange.first_ip)
+        for range in range_qry:
+            first = netaddr.IPAddress(range['first_ip'])
+            last = netaddr.IPAddress(range['last_ip'])
+            taken = min(count - len(ips), int(last) - int(first) + 1)
+            ips.extend(str(first + i) for i in xrange(taken))
+            if int(first) + taken > int(last):
+                context.session.delete(range)
+            else:
+                range['first_ip'] = str(first + taken)
+            if len(ips) == count:
+                break
+        LOG.debug("Allocated %s IP's from subnet %s (%s)", len(ips),
+                  subnet['id'], subnet['cidr'])
+        return ips
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        """Allocate a specific IP address on the subnet.
+
+        The availability range holding the address is looked up directly
+        through the (indexed) range boundaries.
+        """
+        ip = netaddr.IPAddress(ip_address)
+        for i in range(cfg.CONF.ipam_allocation_retries):
+            range_qry = self._range_query(context, subnet_id)
+            if range_qry is None:
+                return
+            ip_range = range_qry.filter(
+                models_v2.IPAvailabilityRange.first_ip <= ip_address,
+                models_v2.IPAvailabilityRange.last_ip >= ip_address).first()
+            if not ip_range or self._take(context, ip_range, ip):
+                return
+            LOG.debug("Range holding %s changed concurrently, retrying",
+                      ip_address)
+        subnet_qry = context.session.query(models_v2.Subnet.network_id)
+        raise q_exc.IpAddressInUse(
+            net_id=subnet_qry.filter_by(id=subnet_id).scalar(),
+            ip_address=ip_address)
+
+    def recycle_ip(self, context, subnet_id, ip_address):
+        # Find the allocation pool for the IP to recycle
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        allocation_pool = pool_qry.filter(
+            models_v2.IPAllocationPool.subnet_id == subnet_id,
+            models_v2.IPAllocationPool.first_ip <= ip_address,
+            models_v2.IPAllocationPool.last_ip >= ip_address).first()
+        if not allocation_pool:
+            error_message = ("No allocation pool found for "
+                             "ip address:%s" % ip_address)
+            raise q_exc.InvalidInput(error_message=error_message)
+        pool_id = allocation_pool['id']
+        # Two requests will be done on the database. The first will be to
+        # search if an entry starts with ip_address + 1 (r1). The second
+        # will be to see if an entry ends with ip_address -1 (r2).
+        # If 1 of the above holds true then the specific entry will be
+        # modified. If both hold true then the two ranges will be merged.
+        # If there are no entries then a single entry will be added.
+        range_qry = context.session.query(models_v2.IPAvailabilityRange)
+        ip_first = str(netaddr.IPAddress(ip_address) + 1)
+        ip_last = str(netaddr.IPAddress(ip_address) - 1)
+        LOG.debug("Recycle %s", ip_address)
+        try:
+            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     first_ip=ip_first).one()
+            LOG.debug("Recycle: first match for %s-%s", r1['first_ip'],
+                      r1['last_ip'])
+        except exc.NoResultFound:
+            r1 = []
+        try:
+            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     last_ip=ip_last).one()
+            LOG.debug("Recycle: last match for %s-%s", r2['first_ip'],
+                      r2['last_ip'])
+        except exc.NoResultFound:
+            r2 = []
+
+        if r1 and r2:
+            # Merge the two ranges
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=r2['first_ip'],
+                last_ip=r1['last_ip'])
+            context.session.add(ip_range)
+            LOG.debug("Recycle: merged %s-%s and %s-%s", r2['first_ip'],
+                      r2['last_ip'], r1['first_ip'], r1['last_ip'])
+            context.session.delete(r1)
+            context.session.delete(r2)
+        elif r1:
+            # Update the range with matched first IP
+            r1['first_ip'] = ip_address
+            LOG.debug("Recycle: updated first %s-%s", r1['first_ip'],
+                      r1['last_ip'])
+        elif r2:
+            # Update the range with matched last IP
+            r2['last_ip'] = ip_address
+            LOG.debug("Recycle: updated last %s-%s", r2['first_ip'],
+                      r2['last_ip'])
+        else:
+            # Create a new range
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=ip_address,
+                last_ip=ip_address)
+            context.session.add(ip_range)
+            LOG.debug("Recycle: created new %s-%s", ip_address, ip_address)
+
+    def recycle_ips(self, context, subnet_id, ip_addresses):
+        """Return several addresses in a single pass.
+
+        The addresses are sorted and grouped in runs of consecutive
+        addresses of the same pool. Each pool then reads the ranges
+        around its runs once, and merges them with the runs.
+        """
+        ips = sorted(int(netaddr.IPAddress(ip)) for ip in ip_addresses)
+        if not ips:
+            return
+        version = netaddr.IPAddress(ip_addresses[0]).version
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        pools = [(int(netaddr.IPAddress(pool['first_ip'])),
+                  int(netaddr.IPAddress(pool['last_ip'])), pool['id'])
+                 for pool in pool_qry.filter_by(subnet_id=subnet_id)]
+        pools.sort()
+        runs = dict((pool_id, []) for first, last, pool_id in pools)
+        i = 0
+        for ip in ips:
+            while i < len(pools) and pools[i][1] < ip:
+                i += 1
+            if i == len(pools) or pools[i][0] > ip:
+                error_message = ("No allocation pool found for "
+                                 "ip address:%s" %
+                                 netaddr.IPAddress(ip, version))
+                raise q_exc.InvalidInput(error_message=error_message)
+            pool_runs = runs[pools[i][2]]
+            if pool_runs and pool_runs[-1][1] + 1 >= ip:
+                pool_runs[-1][1] = ip
+            else:
+                pool_runs.append([ip, ip])
+        LOG.debug("Recycle %s IP's of subnet %s", len(ips), subnet_id)
+
+        for pool_first, pool_last, pool_id in pools:
+            pool_runs = runs[pool_id]
+            if not pool_runs:
+                continue
+            # The ranges right next to the runs are merged with them
+            low = max(pool_runs[0][0] - 1, pool_first)
+            high = min(pool_runs[-1][1] + 1, pool_last)
+            range_qry = context.session.query(
+                models_v2.IPAvailabilityRange).filter(
+                    models_v2.IPAvailabilityRange.allocation_pool_id ==
+                    pool_id,
+                    models_v2.IPAvailabilityRange.last_ip >=
+                    str(netaddr.IPAddress(low, version)),
+                    models_v2.IPAvailabilityRange.first_ip <=
+                    str(netaddr.IPAddress(high, version)))
+            ranges = range_qry.with_lockmode('update').all()
+            intervals = sorted(
+                [(int(netaddr.IPAddress(ip_range['first_ip'])),
+                  int(netaddr.IPAddress(ip_range['last_ip'])))
+                 for ip_range in ranges] +
+                [(first, last) for first, last in pool_runs])
+            merged = []
+            for first, last in intervals:
+                if merged and merged[-1][1] + 1 >= first:
+                    merged[-1][1] = max(merged[-1][1], last)
+                else:
+                    merged.append([first, last])
+            free = set((str(netaddr.IPAddress(first, version)),
+                        str(netaddr.IPAddress(last, version)))
+                       for first, last in merged)
+            current = set()
+            for ip_range in ranges:
+                bounds = (ip_range['first_ip'], ip_range['last_ip'])
+                current.add(bounds)
+                if bounds not in free:
+                    context.session.delete(ip_range)
+            for first_ip, last_ip in free - current:
+                context.session.add(models_v2.IPAvailabilityRange(
+                    allocation_pool_id=pool_id,
+                    first_ip=first_ip,
+                    last_ip=last_ip))
+            LOG.debug("Recycle: replaced %s ranges of pool %s by %s",
+                      len(current - free), pool_id, len(free - current))
+
+    def get_free_ips(self, context, subnet_ids):
+        # NOTE: the bounds are read as the hex strings stored, which
+        #       saves building an IPAddress per range
+        pools = models_v2.IPAllocationPool
+        ranges = models_v2.IPAvailabilityRange
+        range_qry = context.session.query(
+            pools.subnet_id, sql.type_coerce(ranges.first_ip, sql.String),
+            sql.type_coerce(ranges.last_ip, sql.String))
+        range_qry = range_qry.join(ranges.ipallocationpool).filter(
+            pools.subnet_id.in_(subnet_ids))
+        result = dict((subnet_id, (0, 0)) for subnet_id in subnet_ids)
+        for subnet_id, first_ip, last_ip in range_qry:
+            free, count = result[subnet_id]
+            result[subnet_id] = (free + int(last_ip, 16) - int(first_ip, 16)
+                                 + 1, count + 1)
+        return result
+
+    def compact_subnet(self, context, subnet_id):
+        """Rebuild the ranges of the subnet as the minimal set of intervals.
+
+        recycle_ip only merges a released address with the ranges right
+        next to it, so the ranges of a busy subnet end up split into many
+        rows. Each pool is rebuilt from its first address onwards, one
+        window of at most ipam_compact_batch_size ranges per transaction.
+        """
+        # NOTE: the allocations of the subnet are read once, the windows
+        #       only read again the addresses they would free
+        alloc_qry = context.session.query(models_v2.IPAllocation)
+        alloc_qry = alloc_qry.filter_by(subnet_id=subnet_id)
+        with context.session.begin(subtransactions=True):
+            # NOTE: rows written before ip_key existed get it here
+            for allocation in alloc_qry.filter_by(ip_key=None):
+                allocation.ip_key = allocation.ip_address
+        allocated = sorted(netaddr.IPAddress(row[0]) for row in
+                           alloc_qry.with_entities(
+                               models_v2.IPAllocation.ip_address))
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        removed = 0
+        for pool in pool_qry.filter_by(subnet_id=subnet_id).all():
+            first = netaddr.IPAddress(pool['first_ip'])
+            while first is not None:
+                with context.session.begin(subtransactions=True):
+                    first, count = self._compact_window(context, pool,
+                                                        first, allocated)
+                removed += count
+        LOG.debug("Compacted subnet %s: %s ranges removed", subnet_id,
+                  removed)
+        return removed
+
+    @staticmethod
+    def _missing(addresses, first, last):
+        """Return the intervals of [first, last] holding none of addresses.
+
+        :param addresses: sorted list of addresses.
+        """
+        start = bisect.bisect_left(addresses, first)
+        end = bisect.bisect_right(addresses, last)
+        if end - start == int(last) - int(first) + 1:
+            return []
+        intervals = []
+        cursor = first
+        for ip in addresses[start:end]:
+            if ip > cursor:
+                intervals.append((cursor, ip - 1))
+            cursor = ip + 1
+        if cursor <= last:
+            intervals.append((cursor, last))
+        return intervals
+
+    def _compact_window(self, context, pool, first, allocated):
+        """Rebuild the ranges of pool starting at address first.
+
+        allocated is the sorted list of the addresses of the subnet read
+        before the compaction started. Once the ranges of the window are
+        locked, the addresses in none of them are allocated, unless they
+        leaked: the intervals between the ranges missing from allocated,
+        which may have been taken since it was read, are looked up again
+        with range queries. The last free interval of a window is rebuilt
+        again by the next one, so that it is merged with the ranges that
+        follow it.
+
+        :returns: the first address of the next window, or None once the
+                  end of the pool is reached, and the number of ranges
+                  removed.
+        """
+        # A window must get past the interval carried over from the
+        # previous one
+        batch_size = max(cfg.CONF.ipam_compact_batch_size, 2)
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).filter(
+                models_v2.IPAvailabilityRange.allocation_pool_id ==
+                pool['id'],
+                models_v2.IPAvailabilityRange.first_ip >= str(first)).order_by(
+                    models_v2.IPAvailabilityRange.first_ip).limit(batch_size)
+        ranges = range_qry.with_lockmode('update').all()
+        last = netaddr.IPAddress(pool['last_ip'])
+        next_first = None
+        if len(ranges) == batch_size:
+            window_last = netaddr.IPAddress(ranges[-1]['last_ip'])
+            if window_last < last:
+                last = window_last
+                next_first = last + 1
+
+        bounds = [(netaddr.IPAddress(r['first_ip']),
+                   netaddr.IPAddress(r['last_ip'])) for r in ranges]
+        unknown = []
+        cursor = first
+        for range_first, range_last in bounds + [(last + 1, last)]:
+            if cursor < range_first:
+                unknown.extend(self._missing(allocated, cursor,
+                                             range_first - 1))
+            cursor = max(cursor, range_last + 1)
+        ip_key = models_v2.IPAllocation.ip_key
+        alloc_qry = context.session.query(
+            models_v2.IPAllocation.ip_address).filter(
+                models_v2.IPAllocation.subnet_id == pool['subnet_id'])
+        taken = []
+        for i in range(0, len(unknown), batch_size):
+            criteria = [ip_key.between(str(unknown_first), str(unknown_last))
+                        for unknown_first, unknown_last
+                        in unknown[i:i + batch_size]]
+            taken.extend(netaddr.IPAddress(row[0]) for row in
+                         alloc_qry.filter(sql.or_(*criteria)))
+        taken.sort()
+        leaked = []
+        for unknown_first, unknown_last in unknown:
+            leaked.extend(self._missing(taken, unknown_first, unknown_last))
+
+        free = []
+        for free_first, free_last in sorted(bounds + leaked):
+            if free and free_first == netaddr.IPAddress(free[-1][1]) + 1:
+                free[-1] = (free[-1][0], str(free_last))
+            else:
+                free.append((str(free_first), str(free_last)))
+        if free and free[-1][1] == str(last) and next_first is not None:
+            next_first = netaddr.IPAddress(free[-1][0])
+
+        if free != [(r['first_ip'], r['last_ip']) for r in ranges]:
+            for ip_range in ranges:
+                context.session.delete(ip_range)
+            context.session.flush()
+            for free_first, free_last in free:
+                ip_range = models_v2.IPAvailabilityRange(
+                    allocation_pool_id=pool['id'],
+                    first_ip=free_first,
+                    last_ip=free_last)
+                context.session.add(ip_range)
+        return next_first, len(ranges) - len(free)
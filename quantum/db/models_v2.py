@@ -13,17 +13,49 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import netaddr
 import sqlalchemy as sa
+from sqlalchemy import event
 from sqlalchemy import orm
 
 from quantum.common import utils
 from quantum.db import model_base
+from quantum.openstack.common import timeutils
+
+
+class IPAddressType(sa.types.TypeDecorator):
+    """Stores an IP address so that it sorts in numeric order.
+
+    Addresses are kept as fixed width, zero padded hex strings (8 digits
+    for IPv4 and 32 digits for IPv6). The database ordering is then the
+    same as the numeric ordering, which allows range lookups such as
+    'first_ip <= ip AND last_ip >= ip' to be answered by an index. A
+    BIGINT column would not be able to hold an IPv6 address.
+
+    The python side value is the usual string representation.
+    """
+    impl = sa.String(32)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        ip = netaddr.IPAddress(value)
+        if ip.version == 4:
+            return '%08x' % int(ip)
+        return '%032x' % int(ip)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        version = 4 if len(value) == 8 else 6
+        return str(netaddr.IPAddress(int(value, 16), version))
 
 
 class HasTenant(object):
     """Tenant mixin, add to subclasses that have a tenant."""
     # NOTE(jkoelker) tenant_id is just a free form string ;(
-    tenant_id = sa.Column(sa.String(255))
+    # NOTE: every query of a non admin context filters on it
+    tenant_id = sa.Column(sa.String(255), index=True)
 
 
 class HasId(object):
@@ -31,6 +63,15 @@ class HasId(object):
     id = sa.Column(sa.String(36), primary_key=True, default=utils.str_uuid)
 
 
+class HasTimestamps(object):
+    """Timestamps mixin, add to subclasses listed with changes_since."""
+    created_at = sa.Column(sa.DateTime, default=timeutils.utcnow)
+    # NOTE: set on creation too, so that new rows are found by the
+    #       changes_since queries
+    updated_at = sa.Column(sa.DateTime, default=timeutils.utcnow,
+                           onupdate=timeutils.utcnow, index=True)
+
+
 class IPAvailabilityRange(model_base.BASEV2):
     """Internal representation of available IPs for Quantum subnets.
 
@@ -42,14 +83,20 @@ class IPAvailabilityRange(model_base.BASEV2):
     the same as the last_ip. When adjacent ips are recycled the ranges
     will be merged.
 
+    The address columns use IPAddressType so that the range containing
+    a given address can be found with an indexed query.
+
     """
+    __table_args__ = (sa.Index('ix_ipavailabilityranges_pool_id_last_ip',
+                               'allocation_pool_id', 'last_ip'),)
+
     allocation_pool_id = sa.Column(sa.String(36),
                                    sa.ForeignKey('ipallocationpools.id',
                                                  ondelete="CASCADE"),
                                    nullable=True,
                                    primary_key=True)
-    first_ip = sa.Column(sa.String(64), nullable=False, primary_key=True)
-    last_ip = sa.Column(sa.String(64), nullable=False, primary_key=True)
+    first_ip = sa.Column(IPAddressType, nullable=False, primary_key=True)
+    last_ip = sa.Column(IPAddressType, nullable=False, primary_key=True)
 
     def __repr__(self):
         return "%s - %s" % (self.first_ip, self.last_ip)
@@ -57,12 +104,14 @@ class IPAvailabilityRange(model_base.BASEV2):
 
 class IPAllocationPool(model_base.BASEV2, HasId):
     """Representation of an allocation pool in a Quantum subnet."""
+    __table_args__ = (sa.Index('ix_ipallocationpools_subnet_id_first_ip',
+                               'subnet_id', 'first_ip'),)
 
     subnet_id = sa.Column(sa.String(36), sa.ForeignKey('subnets.id',
                                                        ondelete="CASCADE"),
                           nullable=True)
-    first_ip = sa.Column(sa.String(64), nullable=False)
-    last_ip = sa.Column(sa.String(64), nullable=False)
+    first_ip = sa.Column(IPAddressType, nullable=False)
+    last_ip = sa.Column(IPAddressType, nullable=False)
     available_ranges = orm.relationship(IPAvailabilityRange,
                                         backref='ipallocationpool',
                                         lazy="dynamic")
@@ -74,6 +123,12 @@ class IPAllocationPool(model_base.BASEV2, HasId):
 class IPAllocation(model_base.BASEV2):
     """Internal representation of allocated IP addresses in a Quantum subnet.
     """
+    # NOTE: lookups by port_id and by subnet_id are served by the primary
+    #       key and by the unique index
+    __table_args__ = (sa.UniqueConstraint('subnet_id', 'ip_address'),
+                      sa.Index('ix_ipallocations_subnet_id_ip_key',
+                               'subnet_id', 'ip_key'))
+
     port_id = sa.Column(sa.String(36), sa.ForeignKey('ports.id',
                                                      ondelete="CASCADE"),
                         nullable=False, primary_key=True)
@@ -84,34 +139,47 @@ class IPAllocation(model_base.BASEV2):
     network_id = sa.Column(sa.String(36), sa.ForeignKey("networks.id",
                                                         ondelete="CASCADE"),
                            nullable=False, primary_key=True)
+    # NOTE: ip_address again, sorting in numeric order for the range
+    #       lookups. ip_address keeps its format, the DHCP agent reads it.
+    ip_key = sa.Column(IPAddressType)
+
+
+def _set_ip_key(mapper, connection, target):
+    target.ip_key = target.ip_address
+
+
+event.listen(IPAllocation, 'before_insert', _set_ip_key)
 
 
-class Port(model_base.BASEV2, HasId, HasTenant):
+class Port(model_base.BASEV2, HasId, HasTenant, HasTimestamps):
     """Represents a port on a quantum v2 network."""
+    # NOTE: the unique index also serves lookups by network_id
+    __table_args__ = (sa.UniqueConstraint('network_id', 'mac_address'),)
+
     name = sa.Column(sa.String(255))
     network_id = sa.Column(sa.String(36), sa.ForeignKey("networks.id"),
                            nullable=False)
-    fixed_ips = orm.relationship(IPAllocation, backref='ports', lazy="dynamic")
+    fixed_ips = orm.relationship(IPAllocation, backref='ports')
     mac_address = sa.Column(sa.String(32), nullable=False)
     admin_state_up = sa.Column(sa.Boolean(), nullable=False)
     status = sa.Column(sa.String(16), nullable=False)
-    device_id = sa.Column(sa.String(255), nullable=False)
+    device_id = sa.Column(sa.String(255), nullable=False, index=True)
 
 
-class Subnet(model_base.BASEV2, HasId, HasTenant):
+class Subnet(model_base.BASEV2, HasId, HasTenant, HasTimestamps):
     """Represents a quantum subnet.
 
     When a subnet is created the first and last entries will be created. These
     are used for the IP allocation.
     """
     name = sa.Column(sa.String(255))
-    network_id = sa.Column(sa.String(36), sa.ForeignKey('networks.id'))
+    network_id = sa.Column(sa.String(36), sa.ForeignKey('networks.id'),
+                           index=True)
     ip_version = sa.Column(sa.Integer, nullable=False)
     cidr = sa.Column(sa.String(64), nullable=False)
     gateway_ip = sa.Column(sa.String(64))
     allocation_pools = orm.relationship(IPAllocationPool,
-                                        backref='subnet',
-                                        lazy="dynamic")
+                                        backref='subnet')
     enable_dhcp = sa.Column(sa.Boolean())
 
     #TODO(danwent):
@@ -119,10 +187,62 @@ class Subnet(model_base.BASEV2, HasId, HasTenant):
     # - additional_routes
 
 
-class Network(model_base.BASEV2, HasId, HasTenant):
+class Network(model_base.BASEV2, HasId, HasTenant, HasTimestamps):
     """Represents a v2 quantum network."""
     name = sa.Column(sa.String(255))
     ports = orm.relationship(Port, backref='networks')
     subnets = orm.relationship(Subnet, backref='networks')
     status = sa.Column(sa.String(16))
     admin_state_up = sa.Column(sa.Boolean)
+
+
+class MacAddressCounter(model_base.BASEV2):
+    """Next MAC address of a network for the sequential generation.
+
+    next_value counts the octets of the addresses that base_mac, whose
+    fixed octets are the prefix, leaves free.
+    """
+    network_id = sa.Column(sa.String(36), sa.ForeignKey('networks.id',
+                                                        ondelete="CASCADE"),
+                           primary_key=True)
+    prefix = sa.Column(sa.String(32), primary_key=True)
+    next_value = sa.Column(sa.BigInteger, nullable=False)
+
+
+class DeletedResource(model_base.BASEV2, HasTenant):
+    """Represents the deletion of a network, subnet or port.
+
+    The rows are written by the deletions of the plugin, and let the
+    changes_since lists return the items deleted since a given time. They
+    are purged once older than deletion_retention.
+    """
+    __table_args__ = (sa.Index('ix_deletedresources_resource_deleted_at',
+                               'resource', 'deleted_at'),)
+
+    id = sa.Column(sa.String(36), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    # NOTE: the purge of the old rows filters on deleted_at alone
+    deleted_at = sa.Column(sa.DateTime, nullable=False, index=True)
+
+
+def _record_deletion(resource):
+    """Return a listener recording the deletion of an item of resource.
+
+    The listener runs in the flush that deletes the item, so the record
+    is committed with the deletion. An item created again with the same
+    id and deleted again replaces its previous record.
+    """
+    def listener(mapper, connection, target):
+        deleted = DeletedResource.__table__
+        connection.execute(deleted.delete().where(
+            sa.and_(deleted.c.id == target['id'],
+                    deleted.c.resource == resource)))
+        connection.execute(deleted.insert().values(
+            id=target['id'], resource=resource,
+            tenant_id=target['tenant_id'], deleted_at=timeutils.utcnow()))
+    return listener
+
+
+for _resource, _model in (('network', Network), ('subnet', Subnet),
+                          ('port', Port)):
+    event.listen(_model, 'after_delete', _record_deletion(_resource))
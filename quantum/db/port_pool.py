@@ -0,0 +1,163 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pools of ports created in advance on the networks listed in port_pools.
+
+A port created without a MAC address nor fixed IPs on one of these
+networks is a port of the pool handed to the tenant by a single UPDATE,
+instead of a new port whose addresses are generated. The ports of a pool
+belong to POOL_TENANT_ID until then. A pool is refilled in the
+background once it holds no more ports than its low watermark.
+"""
+
+import logging
+
+import eventlet
+
+from quantum.common import exceptions as q_exc
+from quantum import context
+from quantum.openstack.common import cfg
+
+
+LOG = logging.getLogger(__name__)
+
+port_pool_opts = [
+    cfg.ListOpt('port_pools', default=[],
+                help='<network_id>:<size>[:<low_watermark>] of the '
+                     'networks keeping ports created in advance'),
+]
+cfg.CONF.register_opts(port_pool_opts)
+
+# Owner of the ports of the pools, no tenant sees them
+POOL_TENANT_ID = 'quantum-port-pool'
+
+# Port creations served from the pool of each network or not
+_COUNTERS = {}
+# Networks whose pool is being refilled
+_REFILLING = set()
+
+
+def get_pools():
+    """Return the (size, low_watermark) of the pool of each network.
+
+    The low watermark defaults to half the size of the pool.
+    """
+    pools = {}
+    for entry in cfg.CONF.port_pools:
+        values = [value.strip() for value in entry.split(':')]
+        try:
+            network_id = values[0]
+            size = int(values[1])
+            low_watermark = size // 2
+            if len(values) > 2:
+                low_watermark = int(values[2])
+            if (len(values) > 3 or not network_id or size < 1 or
+                    not 0 <= low_watermark < size):
+                raise ValueError()
+        except (IndexError, ValueError):
+            LOG.error("Invalid port_pools entry '%s'", entry)
+            continue
+        pools[network_id] = (size, low_watermark)
+    return pools
+
+
+def get_pool(network_id):
+    """Return the (size, low_watermark) of the pool of the network.
+
+    :returns: None if the network has no pool.
+    """
+    return get_pools().get(network_id)
+
+
+def record(network_id, hit):
+    """Count a port creation served from the pool of the network or not."""
+    counters = _COUNTERS.setdefault(network_id, {'hits': 0, 'misses': 0})
+    counters['hits' if hit else 'misses'] += 1
+
+
+def reset_stats():
+    _COUNTERS.clear()
+
+
+def get_stats(available):
+    """Return the usage of the pools.
+
+    :param available: the number of ports in the pool of each network.
+    """
+    stats = []
+    for network_id, (size, low_watermark) in sorted(get_pools().items()):
+        counters = _COUNTERS.get(network_id, {'hits': 0, 'misses': 0})
+        requests = counters['hits'] + counters['misses']
+        hit_rate = None
+        if requests:
+            hit_rate = float(counters['hits']) / requests
+        stats.append({'network_id': network_id,
+                      'size': size,
+                      'low_watermark': low_watermark,
+                      'available': available.get(network_id, 0),
+                      'hits': counters['hits'],
+                      'misses': counters['misses'],
+                      'hit_rate': hit_rate})
+    return stats
+
+
+def refill(plugin, network_id):
+    """Create the ports missing from the pool of the network.
+
+    :returns: the number of ports created.
+    """
+    if network_id in _REFILLING:
+        return 0
+    _REFILLING.add(network_id)
+    try:
+        created = plugin.refill_port_pool(context.get_admin_context(),
+                                          network_id)
+        LOG.debug("Added %s ports to the pool of network %s", created,
+                  network_id)
+        return created
+    finally:
+        _REFILLING.discard(network_id)
+
+
+def _refill_in_background(plugin, network_id):
+    try:
+        refill(plugin, network_id)
+    except q_exc.NetworkNotFound:
+        LOG.warn("Network %s of port_pools does not exist", network_id)
+    except Exception:
+        LOG.exception("Refill of the port pool of network %s failed",
+                      network_id)
+
+
+def schedule_refill(plugin, network_id):
+    """Refill the pool of the network in a green thread."""
+    if network_id not in _REFILLING:
+        eventlet.spawn_n(_refill_in_background, plugin, network_id)
+
+
+def start_port_pools(plugin):
+    """Fill the pools of port_pools, if the plugin supports them."""
+    pools = get_pools()
+    if not pools:
+        return
+    if not hasattr(plugin, 'refill_port_pool'):
+        LOG.warn("Plugin %s does not support port pools",
+                 plugin.__class__.__name__)
+        return
+    for network_id in pools:
+        schedule_refill(plugin, network_id)
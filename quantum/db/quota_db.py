@@ -0,0 +1,243 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy import exc as sql_exc
+
+from quantum.common import exceptions
+from quantum.db import api as db
+from quantum.db import model_base
+from quantum.db import models_v2
+from quantum.openstack.common import excutils
+from quantum import quota
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Quota(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
+    """Represent the limit of a resource for a tenant.
+
+    It overrides the default limit given by the configuration.
+    """
+    resource = sa.Column(sa.String(255), nullable=False)
+    limit = sa.Column(sa.Integer, nullable=False)
+
+
+class QuotaUsage(model_base.BASEV2):
+    """Represent the usage of a resource by a tenant.
+
+    in_use is the number of items of the tenant, reserved the number of
+    items about to be created by requests in progress.
+    """
+    tenant_id = sa.Column(sa.String(255), primary_key=True)
+    resource = sa.Column(sa.String(255), primary_key=True)
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    reserved = sa.Column(sa.Integer, nullable=False, default=0)
+
+
+# The models of the resources whose usage is tracked
+TRACKED_MODELS = {'network': models_v2.Network,
+                  'subnet': models_v2.Subnet,
+                  'port': models_v2.Port}
+
+
+def _usage_filter(tenant_id, resource):
+    usage = QuotaUsage.__table__
+    return sa.and_(usage.c.tenant_id == tenant_id,
+                   usage.c.resource == resource)
+
+
+def _track_usage(resource, delta):
+    """Return a listener changing the usage of resource by delta.
+
+    The listener runs in the flush that inserts or deletes the item, so
+    the usage is updated in the transaction of the change. The usage of
+    a tenant without a QuotaUsage row is left alone, it is counted on the
+    first reservation.
+    """
+    def listener(mapper, connection, target):
+        if not isinstance(quota.QUOTAS.get_driver(), DbQuotaDriver):
+            return
+        usage = QuotaUsage.__table__
+        connection.execute(usage.update().where(
+            _usage_filter(target['tenant_id'], resource)).values(
+                in_use=usage.c.in_use + delta))
+    return listener
+
+
+for _resource, _model in TRACKED_MODELS.items():
+    event.listen(_model, 'after_insert', _track_usage(_resource, 1))
+    event.listen(_model, 'after_delete', _track_usage(_resource, -1))
+
+
+class DbQuotaDriver(quota.ConfDriver):
+    """Driver keeping per-tenant limits and the usage in the database.
+
+    Tenants without a limit of their own get the configured default. The
+    usage of a tenant is counted on its first reservation, and then kept
+    up to date by the creations and deletions of the plugin. A
+    reservation takes the quota of a whole request with a single UPDATE,
+    which matches no row when the quota would be exceeded.
+    """
+
+    def __init__(self):
+        # The tables of the plugin may have been created before this
+        # module was imported
+        db.register_models(model_base.BASEV2)
+
+    def _get_quotas(self, context, resources, keys, tenant_id=None):
+        """Return the limits of tenant_id, the one of context by default."""
+        quotas = super(DbQuotaDriver, self)._get_quotas(context, resources,
+                                                        keys)
+        if tenant_id is None:
+            tenant_id = context.tenant_id
+        quota_qry = context.session.query(Quota)
+        for tenant_quota in quota_qry.filter_by(tenant_id=tenant_id):
+            if tenant_quota['resource'] in quotas:
+                quotas[tenant_quota['resource']] = tenant_quota['limit']
+        return quotas
+
+    def get_tenant_quotas(self, context, resources, tenant_id):
+        return self._get_quotas(context, resources, resources.keys(),
+                                tenant_id)
+
+    def update_quota_limit(self, context, tenant_id, resource, limit):
+        with context.session.begin(subtransactions=True):
+            quota_qry = context.session.query(Quota)
+            tenant_quota = quota_qry.filter_by(tenant_id=tenant_id,
+                                               resource=resource).first()
+            if tenant_quota:
+                tenant_quota['limit'] = limit
+            else:
+                context.session.add(Quota(tenant_id=tenant_id,
+                                          resource=resource,
+                                          limit=limit))
+
+    def delete_tenant_quota(self, context, tenant_id):
+        """Give the default limits back to tenant_id."""
+        with context.session.begin(subtransactions=True):
+            quota_qry = context.session.query(Quota)
+            quota_qry.filter_by(tenant_id=tenant_id).delete()
+
+    def _reserve(self, context, tenant_id, resource, delta, limit):
+        usage = QuotaUsage.__table__
+        result = context.session.execute(usage.update().where(sa.and_(
+            _usage_filter(tenant_id, resource),
+            usage.c.in_use + usage.c.reserved + delta <= limit)).values(
+                reserved=usage.c.reserved + delta))
+        return result.rowcount == 1
+
+    def _create_usage(self, context, resource, tenant_id, plugin):
+        in_use = quota.count_usage(context, resource, plugin, tenant_id)
+        try:
+            with context.session.begin(subtransactions=True):
+                context.session.add(QuotaUsage(tenant_id=tenant_id,
+                                               resource=resource.name,
+                                               in_use=in_use,
+                                               reserved=0))
+        except sql_exc.IntegrityError:
+            LOG.debug("Usage of %s by %s created concurrently",
+                      resource.name, tenant_id)
+
+    def make_reservation(self, context, resources, tenant_id, deltas,
+                         plugin):
+        """Reserve deltas for tenant_id, or raise OverQuota."""
+        quotas = self._get_quotas(context, resources, deltas.keys(),
+                                  tenant_id)
+        reserved = {}
+        try:
+            for key, delta in deltas.items():
+                if quotas[key] < 0:
+                    continue
+                if not self._reserve(context, tenant_id, key, delta,
+                                     quotas[key]):
+                    usage_qry = context.session.query(QuotaUsage)
+                    if usage_qry.filter_by(tenant_id=tenant_id,
+                                           resource=key).first():
+                        raise exceptions.OverQuota(overs=[key],
+                                                   quotas=quotas,
+                                                   usages={})
+                    self._create_usage(context, resources[key], tenant_id,
+                                       plugin)
+                    if not self._reserve(context, tenant_id, key, delta,
+                                         quotas[key]):
+                        raise exceptions.OverQuota(overs=[key],
+                                                   quotas=quotas,
+                                                   usages={})
+                reserved[key] = delta
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                self.release_reservation(context, (tenant_id, reserved))
+        return tenant_id, reserved
+
+    def move_usage(self, context, resource, from_tenant_id, to_tenant_id):
+        """Move an item of resource from a tenant to another.
+
+        The listeners above do not see the owner of an item changed by a
+        query UPDATE.
+        """
+        usage = QuotaUsage.__table__
+        for tenant_id, delta in ((from_tenant_id, -1), (to_tenant_id, 1)):
+            context.session.execute(usage.update().where(
+                _usage_filter(tenant_id, resource)).values(
+                    in_use=usage.c.in_use + delta))
+
+    def release_reservation(self, context, reservation):
+        tenant_id, reserved = reservation
+        usage = QuotaUsage.__table__
+        for key, delta in reserved.items():
+            # The reservation is gone if a resync ran in the meantime
+            context.session.execute(usage.update().where(
+                _usage_filter(tenant_id, key)).values(
+                    reserved=sa.case([(usage.c.reserved > delta,
+                                       usage.c.reserved - delta)],
+                                     else_=0)))
+
+    def resync(self, context, resources, plugin):
+        """Recount the usage of every tenant, one resource at a time.
+
+        The reservations of the requests in progress are dropped as well,
+        which also clears those left behind by requests that never
+        completed.
+        """
+        for key in resources:
+            model = TRACKED_MODELS.get(key)
+            if model is None:
+                continue
+            with context.session.begin(subtransactions=True):
+                # Lock the usage before counting, so that the items
+                # created meanwhile are added to the new count
+                usage_qry = context.session.query(QuotaUsage).filter_by(
+                    resource=key).with_lockmode('update')
+                usages = usage_qry.all()
+                count_qry = context.session.query(
+                    model.tenant_id, sa.func.count(model.id)).group_by(
+                        model.tenant_id)
+                counts = dict(count_qry.all())
+                for usage in usages:
+                    in_use = counts.get(usage['tenant_id'], 0)
+                    if usage['in_use'] != in_use or usage['reserved']:
+                        LOG.debug("Resync of the usage of %s by %s: "
+                                  "%s in use, was %s (%s reserved)",
+                                  key, usage['tenant_id'], in_use,
+                                  usage['in_use'], usage['reserved'])
+                        usage['in_use'] = in_use
+                        usage['reserved'] = 0
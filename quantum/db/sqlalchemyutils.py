@@ -0,0 +1,71 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sqlalchemy as sql
+
+from quantum.common import exceptions as q_exc
+
+
+def _get_column(model, key):
+    if key not in model.__table__.columns:
+        msg = _("%(key)s is not a sort key of %(table)s") % {
+            'key': key, 'table': model.__tablename__}
+        raise q_exc.InvalidInput(error_message=msg)
+    return getattr(model, key)
+
+
+def paginate_query(query, model, limit, sorts, marker_obj=None,
+                   page_reverse=False):
+    """Return the page of query starting after marker_obj.
+
+    The rows are ordered by the sort keys, followed by the id so that the
+    order is total and the page boundaries are stable.
+
+    :param limit: maximum number of rows returned, None for no limit.
+    :param sorts: list of (key, ascending) tuples, key being a column of
+                  model.
+    :param marker_obj: the last row of the previous page. Only the rows
+                       after it in the sort order are returned.
+    :param page_reverse: walk the sort order backwards, id included, to
+                         return the rows before marker_obj. They come
+                         last first.
+    """
+    sorts = list(sorts or [])
+    if 'id' not in [key for key, ascending in sorts]:
+        sorts.append(('id', True))
+    if page_reverse:
+        sorts = [(key, not ascending) for key, ascending in sorts]
+
+    for key, ascending in sorts:
+        column = _get_column(model, key)
+        query = query.order_by(column.asc() if ascending else column.desc())
+
+    if marker_obj is not None:
+        # (k1 > v1) or (k1 == v1 and k2 > v2) or ...
+        criteria = []
+        for i, (key, ascending) in enumerate(sorts):
+            crit = [_get_column(model, prev_key) == marker_obj[prev_key]
+                    for prev_key, prev_ascending in sorts[:i]]
+            column = _get_column(model, key)
+            if ascending:
+                crit.append(column > marker_obj[key])
+            else:
+                crit.append(column < marker_obj[key])
+            criteria.append(sql.and_(*crit))
+        query = query.filter(sql.or_(*criteria))
+
+    if limit:
+        query = query.limit(limit)
+    return query
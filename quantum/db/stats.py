@@ -0,0 +1,160 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Counters of the database connections and queries of the server.
+
+quantum.db.api.configure_db hooks them to the engine. The counters of
+the whole process are returned by get_stats, those of the current
+request by end_request.
+"""
+
+import logging
+import time
+
+from eventlet import corolocal
+from sqlalchemy import event
+from sqlalchemy import pool
+
+
+LOG = logging.getLogger(__name__)
+
+# Checkouts waiting longer than this many seconds are logged
+SLOW_CHECKOUT = 1.0
+
+
+class Stats(object):
+    """Connection and query counters."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.checkout_wait = 0.0
+        self.max_checkout_wait = 0.0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.queries = 0
+        self.query_time = 0.0
+
+    def as_dict(self):
+        return {'checkouts': self.checkouts,
+                'checkout_wait': self.checkout_wait,
+                'max_checkout_wait': self.max_checkout_wait,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'queries': self.queries,
+                'query_time': self.query_time}
+
+
+_STATS = Stats()
+# counters of the request served by the current green thread
+_REQUEST = corolocal.local()
+
+
+class TimedQueuePool(pool.QueuePool):
+    """QueuePool recording how long checkouts wait for a connection."""
+
+    def _do_get(self):
+        start = time.time()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            wait = time.time() - start
+            _STATS.checkout_wait += wait
+            _STATS.max_checkout_wait = max(_STATS.max_checkout_wait, wait)
+            if wait >= SLOW_CHECKOUT:
+                LOG.warn("Waited %.3fs for a database connection, %s in use",
+                         wait, _STATS.in_use)
+
+
+class StatsListener(object):
+    """Counts the connections checked out of the pool."""
+
+    def checkout(self, dbapi_con, con_record, con_proxy):
+        _STATS.checkouts += 1
+        _STATS.in_use += 1
+        _STATS.max_in_use = max(_STATS.max_in_use, _STATS.in_use)
+
+    def checkin(self, dbapi_con, con_record):
+        _STATS.in_use -= 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # NOTE: the start time goes away with the execution context of the
+    #       statement, after_cursor_execute is not called if it fails
+    if context is not None:
+        context._query_start = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    start = getattr(context, '_query_start', None)
+    elapsed = time.time() - start if start is not None else 0.0
+    _STATS.queries += 1
+    _STATS.query_time += elapsed
+    if getattr(_REQUEST, 'queries', None) is not None:
+        _REQUEST.queries += 1
+        _REQUEST.query_time += elapsed
+
+
+def listen(engine):
+    """Count the queries run by engine."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def start_request():
+    """Start counting the queries of the current request."""
+    _REQUEST.queries = 0
+    _REQUEST.query_time = 0.0
+
+
+def end_request():
+    """Stop counting the queries of the current request.
+
+    :returns: the number of queries run since start_request, and the
+              seconds spent running them.
+    """
+    queries = getattr(_REQUEST, 'queries', None)
+    if queries is None:
+        return 0, 0.0
+    _REQUEST.queries = None
+    return queries, _REQUEST.query_time
+
+
+def get_stats(engine=None):
+    """Return the counters of the process as a dict.
+
+    The size of the pool of engine and its connections currently in use
+    are added, when its pool keeps track of them.
+    """
+    result = _STATS.as_dict()
+    if engine is not None and isinstance(engine.pool, pool.QueuePool):
+        result.update({'pool_size': engine.pool.size(),
+                       'overflow': engine.pool.overflow(),
+                       'checked_out': engine.pool.checkedout()})
+    return result
+
+
+def reset():
+    """Reset the counters of the process."""
+    in_use = _STATS.in_use
+    _STATS.reset()
+    _STATS.in_use = in_use
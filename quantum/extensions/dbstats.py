@@ -0,0 +1,64 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import webob.exc
+
+from quantum.db import api as db
+from quantum.extensions import extensions
+from quantum import wsgi
+
+
+class Dbstats(object):
+    """Extension class exposing the database counters of the server.
+
+    GET /dbstats returns the connections checked out of the pool, the
+    time spent waiting for them, and the number and duration of the
+    queries run since the server started. It is restricted to admins.
+    """
+
+    @classmethod
+    def get_name(cls):
+        return "Database Statistics"
+
+    @classmethod
+    def get_alias(cls):
+        return "dbstats"
+
+    @classmethod
+    def get_description(cls):
+        return "Database connection pool and query counters of the server"
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/dbstats/api/v1.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2012-08-20T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        return [extensions.ResourceExtension('dbstats',
+                                             DbstatsController())]
+
+
+class DbstatsController(wsgi.Controller):
+
+    def index(self, request):
+        context = request.environ.get('quantum.context')
+        if context is None or not context.is_admin:
+            raise webob.exc.HTTPForbidden()
+        return {'dbstats': db.get_stats()}
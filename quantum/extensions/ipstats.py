@@ -0,0 +1,86 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import webob.exc
+
+from quantum.api.v2 import base
+from quantum.extensions import extensions
+from quantum.manager import QuantumManager
+from quantum import wsgi
+
+
+class Ipstats(object):
+    """Extension class exposing the address usage of subnets and networks.
+
+    GET /subnet_stats and GET /network_stats return, for each subnet or
+    network visible to the tenant, the number of addresses of the
+    allocation pools, how many of them are used and free, the number of
+    free ranges they are split in, and the number of ports. The lists
+    take the filters of the subnet and network lists.
+    """
+
+    @classmethod
+    def get_name(cls):
+        return "IP Address Statistics"
+
+    @classmethod
+    def get_alias(cls):
+        return "ipstats"
+
+    @classmethod
+    def get_description(cls):
+        return "Address usage of the subnets and networks"
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/ipstats/api/v1.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2012-08-27T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        plugin = QuantumManager.get_plugin()
+        return [extensions.ResourceExtension(
+                    'subnet_stats', IpstatsController(plugin, 'subnet')),
+                extensions.ResourceExtension(
+                    'network_stats', IpstatsController(plugin, 'network'))]
+
+
+class IpstatsController(wsgi.Controller):
+
+    def __init__(self, plugin, resource):
+        self._plugin = plugin
+        self._resource = resource
+        self._collection = '%s_stats' % resource
+
+    def _get_stats(self, request, filters):
+        ctx = request.environ.get('quantum.context')
+        if ctx is None:
+            raise webob.exc.HTTPForbidden()
+        getter = getattr(self._plugin, 'get_%ss_stats' % self._resource)
+        return getter(ctx, filters=filters)
+
+    def index(self, request):
+        return {self._collection: self._get_stats(request,
+                                                  base.filters(request))}
+
+    def show(self, request, id):
+        stats = self._get_stats(request, {'id': [id]})
+        if not stats:
+            raise webob.exc.HTTPNotFound()
+        return {self._collection: stats[0]}
@@ -0,0 +1,69 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import webob.exc
+
+from quantum.extensions import extensions
+from quantum.manager import QuantumManager
+from quantum import wsgi
+
+
+class Portpools(object):
+    """Extension class exposing the usage of the port pools.
+
+    GET /port_pools returns, for each network of the port_pools option,
+    the size and low watermark of its pool, the ports left in it, and
+    how many port creations were served from the pool (hits) or not
+    (misses) since the server started. It is restricted to admins.
+    """
+
+    @classmethod
+    def get_name(cls):
+        return "Port Pools"
+
+    @classmethod
+    def get_alias(cls):
+        return "portpools"
+
+    @classmethod
+    def get_description(cls):
+        return "Usage of the pools of ports created in advance"
+
+    @classmethod
+    def get_namespace(cls):
+        return "http://docs.openstack.org/ext/portpools/api/v1.0"
+
+    @classmethod
+    def get_updated(cls):
+        return "2012-09-03T10:00:00-00:00"
+
+    @classmethod
+    def get_resources(cls):
+        """Returns Ext Resources."""
+        plugin = QuantumManager.get_plugin()
+        return [extensions.ResourceExtension('port_pools',
+                                             PortpoolsController(plugin))]
+
+
+class PortpoolsController(wsgi.Controller):
+
+    def __init__(self, plugin):
+        self._plugin = plugin
+
+    def index(self, request):
+        ctx = request.environ.get('quantum.context')
+        if ctx is None or not ctx.is_admin:
+            raise webob.exc.HTTPForbidden()
+        return {'port_pools': self._plugin.get_port_pools_stats(ctx)}
@@ -38,7 +38,8 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2):
     be updated to take advantage of it.
     """
 
-    supported_extension_aliases = ["provider"]
+    supported_extension_aliases = ["provider", "dbstats", "ipstats",
+                                   "portpools"]
 
     def __init__(self):
         cdb.initialize(base=models_v2.model_base.BASEV2)
@@ -99,9 +100,13 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2):
         self._extend_network_dict(context, net)
         return self._fields(net, fields)
 
-    def get_networks(self, context, filters=None, fields=None, verbose=None):
-        nets = super(LinuxBridgePluginV2, self).get_networks(context, filters,
-                                                             None, verbose)
+    def get_networks(self, context, filters=None, fields=None, verbose=None,
+                     sorts=None, limit=None, marker=None, page_reverse=False,
+                     changes_since=None):
+        nets = super(LinuxBridgePluginV2, self).get_networks(
+            context, filters, None, verbose, sorts=sorts, limit=limit,
+            marker=marker, page_reverse=page_reverse,
+            changes_since=changes_since)
         for net in nets:
             self._extend_network_dict(context, net)
         # TODO(rkukura): Filter on extended attributes.
@@ -19,9 +19,30 @@ v2 Quantum Plug-in API specification.
 
 QuantumPluginBase provides the definition of minimum set of
 methods that needs to be implemented by a v2 Quantum Plug-in.
+
+The get_<resources>_count methods are used for quota checks.  Plug-ins
+should override them with a count done by their backend.
+
+Plug-ins able to sort and page the get_<resources> calls themselves
+advertise it with a class attribute named native_pagination_support
+set to True.  The API sorts and pages the full lists of other plug-ins.
+
+Plug-ins able to list the items created, updated or deleted since a given
+time advertise it with a class attribute named
+native_changes_since_support set to True.  Their get_<resources>
+methods then take a changes_since argument, and their get_deletions
+method returns the items of a resource deleted since that time.
 """
 
 from abc import ABCMeta, abstractmethod
+import copy
+import logging
+
+from quantum.common import exceptions
+from quantum.openstack.common import excutils
+
+
+LOG = logging.getLogger(__name__)
 
 
 class QuantumPluginBaseV2(object):
@@ -65,6 +86,15 @@ class QuantumPluginBaseV2(object):
     def update_subnet(self, context, id, subnet):
         pass
 
+    def create_subnets_bulk(self, context, subnets):
+        """
+        Creates several subnets at once.
+
+        :param subnets: {"subnets": [{"subnet": subnet_data}, ...]}
+        :returns: the list of created subnets, in the order of the request.
+        """
+        return self._create_bulk('subnet', context, subnets['subnets'])
+
     @abstractmethod
     def get_subnet(self, context, id, fields=None, verbose=None):
         pass
@@ -73,10 +103,51 @@ class QuantumPluginBaseV2(object):
     def delete_subnet(self, context, id):
         pass
 
+    def update_subnets_bulk(self, context, ids, subnet):
+        """
+        Updates several subnets with the same attributes.
+
+        :param ids: ids of the subnets to update.
+        :param subnet: {"subnet": subnet_data}
+        :returns: a tuple of the list of updated subnets, and of a dict
+                  mapping the id of each subnet that could not be updated
+                  to the error raised.
+        """
+        return self._update_bulk('subnet', context, ids, subnet)
+
+    def delete_subnets_bulk(self, context, ids):
+        """
+        Deletes several subnets.
+
+        :param ids: ids of the subnets to delete.
+        :returns: a dict mapping the id of each subnet that could not be
+                  deleted to the error raised.
+        """
+        return self._delete_bulk('subnet', context, ids)
+
     @abstractmethod
-    def get_subnets(self, context, filters=None, fields=None, verbose=None):
+    def get_subnets(self, context, filters=None, fields=None, verbose=None,
+                    sorts=None, limit=None, marker=None, page_reverse=False):
+        """
+        Retrieves a list of subnets.
+
+        :param filters: dict of lists of values to match, by attribute.
+        :param sorts: list of (key, ascending) tuples.
+        :param limit: maximum number of subnets returned.
+        :param marker: id of the subnet the page starts after.
+        :param page_reverse: return the page ending before marker.
+        """
         pass
 
+    def get_subnets_count(self, context, filters=None):
+        """
+        Returns the number of subnets matching filters.
+
+        Plugins should override this with a count done by their backend,
+        this default lists the subnets to count them.
+        """
+        return len(self.get_subnets(context, filters=filters, fields=['id']))
+
     @abstractmethod
     def create_network(self, context, network):
         """
@@ -100,18 +171,68 @@ class QuantumPluginBaseV2(object):
     def update_network(self, context, id, network):
         pass
 
+    def create_networks_bulk(self, context, networks):
+        """
+        Creates several networks at once.
+
+        :param networks: {"networks": [{"network": net_data}, ...]}
+        :returns: the list of created networks, in the order of the request.
+        """
+        return self._create_bulk('network', context, networks['networks'])
+
     @abstractmethod
     def delete_network(self, context, id):
         pass
 
+    def update_networks_bulk(self, context, ids, network):
+        """
+        Updates several networks with the same attributes.
+
+        :param ids: ids of the networks to update.
+        :param network: {"network": network_data}
+        :returns: a tuple of the list of updated networks, and of a dict
+                  mapping the id of each network that could not be updated
+                  to the error raised.
+        """
+        return self._update_bulk('network', context, ids, network)
+
+    def delete_networks_bulk(self, context, ids):
+        """
+        Deletes several networks.
+
+        :param ids: ids of the networks to delete.
+        :returns: a dict mapping the id of each network that could not be
+                  deleted to the error raised.
+        """
+        return self._delete_bulk('network', context, ids)
+
     @abstractmethod
     def get_network(self, context, id, fields=None, verbose=None):
         pass
 
     @abstractmethod
-    def get_networks(self, context, filters=None, fields=None, verbose=None):
+    def get_networks(self, context, filters=None, fields=None, verbose=None,
+                     sorts=None, limit=None, marker=None, page_reverse=False):
+        """
+        Retrieves a list of networks.
+
+        :param filters: dict of lists of values to match, by attribute.
+        :param sorts: list of (key, ascending) tuples.
+        :param limit: maximum number of networks returned.
+        :param marker: id of the network the page starts after.
+        :param page_reverse: return the page ending before marker.
+        """
         pass
 
+    def get_networks_count(self, context, filters=None):
+        """
+        Returns the number of networks matching filters.
+
+        Plugins should override this with a count done by their backend,
+        this default lists the networks to count them.
+        """
+        return len(self.get_networks(context, filters=filters, fields=['id']))
+
     @abstractmethod
     def create_port(self, context, port):
         """
@@ -153,6 +274,15 @@ class QuantumPluginBaseV2(object):
         """
         pass
 
+    def create_ports_bulk(self, context, ports):
+        """
+        Creates several ports at once.
+
+        :param ports: {"ports": [{"port": port_data}, ...]}
+        :returns: the list of created ports, in the order of the request.
+        """
+        return self._create_bulk('port', context, ports['ports'])
+
     @abstractmethod
     def update_port(self, context, id, port):
         """
@@ -187,10 +317,113 @@ class QuantumPluginBaseV2(object):
         """
         pass
 
+    def update_ports_bulk(self, context, ids, port):
+        """
+        Updates several ports with the same attributes.
+
+        :param ids: ids of the ports to update.
+        :param port: {"port": port_data}
+        :returns: a tuple of the list of updated ports, and of a dict
+                  mapping the id of each port that could not be updated
+                  to the error raised.
+        """
+        return self._update_bulk('port', context, ids, port)
+
+    def delete_ports_bulk(self, context, ids):
+        """
+        Deletes several ports.
+
+        :param ids: ids of the ports to delete.
+        :returns: a dict mapping the id of each port that could not be
+                  deleted to the error raised.
+        """
+        return self._delete_bulk('port', context, ids)
+
     @abstractmethod
     def get_port(self, context, id, fields=None, verbose=None):
         pass
 
     @abstractmethod
-    def get_ports(self, context, filters=None, fields=None, verbose=None):
+    def get_ports(self, context, filters=None, fields=None, verbose=None,
+                  sorts=None, limit=None, marker=None, page_reverse=False):
+        """
+        Retrieves a list of ports.
+
+        :param filters: dict of lists of values to match, by attribute.
+        :param sorts: list of (key, ascending) tuples.
+        :param limit: maximum number of ports returned.
+        :param marker: id of the port the page starts after.
+        :param page_reverse: return the page ending before marker.
+        """
         pass
+
+    def get_ports_count(self, context, filters=None):
+        """
+        Returns the number of ports matching filters.
+
+        Plugins should override this with a count done by their backend,
+        this default lists the ports to count them.
+        """
+        return len(self.get_ports(context, filters=filters, fields=['id']))
+
+    def _create_bulk(self, resource, context, items):
+        """
+        Emulates a bulk create with one create_<resource> call per item.
+
+        Plugins able to create several objects in a single transaction
+        should override the create_<resources>_bulk methods. Should one
+        of the creations fail, the objects already created are deleted
+        before the error is raised again.
+        """
+        creator = getattr(self, 'create_%s' % resource)
+        deleter = getattr(self, 'delete_%s' % resource)
+        objs = []
+        try:
+            for item in items:
+                objs.append(creator(context, item))
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for obj in reversed(objs):
+                    try:
+                        deleter(context, obj['id'])
+                    except Exception:
+                        LOG.exception(_("Unable to delete %(resource)s "
+                                        "%(id)s while undoing a bulk "
+                                        "create") %
+                                      {'resource': resource,
+                                       'id': obj['id']})
+        return objs
+
+    def _update_bulk(self, resource, context, ids, item):
+        """
+        Emulates a bulk update with one update_<resource> call per item.
+
+        Plugins able to update several objects with a few statements
+        should override the update_<resources>_bulk methods.
+        """
+        updater = getattr(self, 'update_%s' % resource)
+        objs = []
+        errors = {}
+        for id in ids:
+            try:
+                # The update may consume the body it is given
+                objs.append(updater(context, id, copy.deepcopy(item)))
+            except exceptions.QuantumException as e:
+                errors[id] = e
+        return objs, errors
+
+    def _delete_bulk(self, resource, context, ids):
+        """
+        Emulates a bulk delete with one delete_<resource> call per item.
+
+        Plugins able to delete several objects with a few statements
+        should override the delete_<resources>_bulk methods.
+        """
+        deleter = getattr(self, 'delete_%s' % resource)
+        errors = {}
+        for id in ids:
+            try:
+                deleter(context, id)
+            except exceptions.QuantumException as e:
+                errors[id] = e
+        return errors
@@ -18,7 +18,10 @@
 
 import logging
 
+import eventlet
+
 from quantum.common import exceptions
+from quantum import context as q_context
 from quantum.openstack.common import cfg
 from quantum.openstack.common import importutils
 
@@ -36,6 +39,10 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='quantum.quota.ConfDriver',
                help='default driver to use for quota checks'),
+    cfg.IntOpt('quota_resync_interval',
+               default=0,
+               help='seconds between two recounts of the usage cached by '
+                    'the quota driver, 0 to disable'),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -111,6 +118,21 @@ class ConfDriver(object):
             raise exceptions.OverQuota(overs=sorted(overs), quotas=quotas,
                                        usages={})
 
+    def make_reservation(self, context, resources, tenant_id, deltas,
+                         plugin):
+        """Check that tenant_id may create deltas more resources.
+
+        The usage is counted by the plugin every time, so there is nothing
+        to reserve.
+        """
+        values = dict((key, count_usage(context, resources[key], plugin,
+                                        tenant_id) + delta)
+                      for key, delta in deltas.items())
+        self.limit_check(context, resources, values)
+
+    def release_reservation(self, context, reservation):
+        pass
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -166,20 +188,35 @@ class CountableResource(BaseResource):
         self.count = count
 
 
+def count_usage(context, resource, plugin, tenant_id):
+    """Count the resources of tenant_id with the function of resource."""
+    # The collection of a resource is named after it
+    return resource.count(context, plugin, '%ss' % resource.name, tenant_id)
+
+
 class QuotaEngine(object):
     """Represent the set of recognized quotas."""
 
     def __init__(self, quota_driver_class=None):
-        """Initialize a Quota object."""
+        """Initialize a Quota object.
 
-        if not quota_driver_class:
-            quota_driver_class = cfg.CONF.QUOTAS.quota_driver
-
-        if isinstance(quota_driver_class, basestring):
-            quota_driver_class = importutils.import_object(quota_driver_class)
+        The quota_driver option is only read when the driver is first
+        used, as the engine is built before the configuration is parsed.
+        """
 
         self._resources = {}
-        self._driver = quota_driver_class
+        self._driver_class = quota_driver_class
+        self._driver = None
+
+    def get_driver(self):
+        driver_class = self._driver_class or cfg.CONF.QUOTAS.quota_driver
+        if not isinstance(driver_class, basestring):
+            return driver_class
+        if self._driver is None or self._driver[0] != driver_class:
+            LOG.debug("Loading quota driver %s", driver_class)
+            self._driver = (driver_class,
+                            importutils.import_object(driver_class))
+        return self._driver[1]
 
     def __contains__(self, resource):
         return resource in self._resources
@@ -236,7 +273,49 @@ class QuotaEngine(object):
         :param context: The request context, for access checks.
         """
 
-        return self._driver.limit_check(context, self._resources, values)
+        return self.get_driver().limit_check(context, self._resources,
+                                             values)
+
+    def make_reservation(self, context, tenant_id, deltas, plugin):
+        """Reserve quota for resources about to be created.
+
+        :param deltas: dict of the number of items of each resource about
+                       to be created for tenant_id.
+        :param plugin: the plugin used to count the resources.
+        :raises: OverQuota if the items would exceed the quota.
+        :returns: the reservation, to be passed to release_reservation once
+                  the items are created or their creation failed.
+        """
+
+        unknown = set(deltas) - set(self._resources)
+        if unknown:
+            raise exceptions.QuotaResourceUnknown(unknown=sorted(unknown))
+        return self.get_driver().make_reservation(context, self._resources,
+                                                  tenant_id, deltas, plugin)
+
+    def release_reservation(self, context, reservation):
+        """Release a reservation returned by make_reservation."""
+
+        self.get_driver().release_reservation(context, reservation)
+
+    def resync(self, context, plugin):
+        """Recount the usage cached by the driver, if any."""
+
+        driver = self.get_driver()
+        if hasattr(driver, 'resync'):
+            driver.resync(context, self._resources, plugin)
+
+    def move_usage(self, context, resource, from_tenant_id, to_tenant_id):
+        """Give an item of resource to another tenant in the driver usage.
+
+        Only needed for the changes of owner the driver cannot see, such
+        as the claim of a pooled port.
+        """
+
+        driver = self.get_driver()
+        if hasattr(driver, 'move_usage'):
+            driver.move_usage(context, resource, from_tenant_id,
+                              to_tenant_id)
 
     @property
     def resources(self):
@@ -247,8 +326,13 @@ QUOTAS = QuotaEngine()
 
 
 def _count_resource(context, plugin, resources, tenant_id):
+    filters = {'tenant_id': [tenant_id]}
+    count_getter = getattr(plugin, "get_%s_count" % resources, None)
+    if count_getter:
+        return count_getter(context, filters=filters)
+    # Plugins not derived from QuantumPluginBaseV2 may lack the count
     obj_getter = getattr(plugin, "get_%s" % resources)
-    obj_list = obj_getter(context, filters={'tenant_id': [tenant_id]})
+    obj_list = obj_getter(context, filters=filters)
     return len(obj_list) if obj_list else 0
 
 
@@ -260,3 +344,20 @@ resources = [
 
 
 QUOTAS.register_resources(resources)
+
+
+def _resync_periodically(plugin, interval):
+    while True:
+        eventlet.sleep(interval)
+        try:
+            QUOTAS.resync(q_context.get_admin_context(), plugin)
+        except Exception:
+            LOG.exception("Quota usage resync failed")
+
+
+def start_periodic_resync(plugin):
+    """Recount the quota usage every quota_resync_interval seconds."""
+    interval = cfg.CONF.QUOTAS.quota_resync_interval
+    if interval > 0:
+        LOG.debug("Resyncing quota usage every %s seconds", interval)
+        eventlet.spawn_n(_resync_periodically, plugin, interval)
@@ -18,7 +18,12 @@
 import logging
 
 from quantum.common import config
+from quantum.db import deletions
+from quantum.db.ipam import compact
+from quantum.db import port_pool
+from quantum import manager
 from quantum.openstack.common import cfg
+from quantum import quota
 from quantum import wsgi
 
 
@@ -72,6 +77,14 @@ class QuantumApiService(WsgiService):
         service = cls(app_name)
         return service
 
+    def start(self):
+        super(QuantumApiService, self).start()
+        plugin = manager.QuantumManager.get_plugin()
+        compact.start_periodic_compaction(plugin)
+        deletions.start_periodic_purge(plugin)
+        quota.start_periodic_resync(plugin)
+        port_pool.start_port_pools(plugin)
+
 
 def serve_wsgi(cls):
     try:
@@ -146,6 +146,11 @@ class APIv2TestBase(unittest.TestCase):
 
         self._plugin_patcher = mock.patch(plugin, autospec=True)
         self.plugin = self._plugin_patcher.start()
+        # The quota checks count the resources of the tenant
+        instance = self.plugin.return_value
+        instance.get_networks_count.return_value = 0
+        instance.get_subnets_count.return_value = 0
+        instance.get_ports_count.return_value = 0
 
         api = router.APIRouter()
         self.api = webtest.TestApp(api)
@@ -426,6 +431,72 @@ class JSONV2TestCase(APIv2TestBase):
     def test_list_noauth(self):
         self._test_list(None, _uuid())
 
+    def _test_list_pagination(self, params):
+        tenant_id = _uuid()
+        nets = [{'id': '00000000-0000-0000-0000-00000000000%s' % i,
+                 'name': 'net%s' % i,
+                 'admin_state_up': True, 'status': "ACTIVE",
+                 'tenant_id': tenant_id, 'subnets': []}
+                for i in range(3)]
+        instance = self.plugin.return_value
+        instance.get_networks.return_value = nets
+        res = self.api.get(_get_path('networks'), params)
+        # The plugin does not page natively, the API does it
+        instance.get_networks.assert_called_once_with(mock.ANY,
+                                                      filters={},
+                                                      fields=[],
+                                                      verbose=[])
+        return nets, res.json
+
+    def test_list_pagination_emulated(self):
+        nets, res = self._test_list_pagination({'limit': 2})
+        self.assertEqual([net['name'] for net in res['networks']],
+                         ['net0', 'net1'])
+        links = res['networks_links']
+        self.assertEqual([link['rel'] for link in links], ['next'])
+        self.assertTrue('marker=%s' % nets[1]['id'] in links[0]['href'])
+        self.assertTrue('limit=2' in links[0]['href'])
+
+    def test_list_pagination_emulated_marker(self):
+        marker = '00000000-0000-0000-0000-000000000001'
+        nets, res = self._test_list_pagination({'limit': 2,
+                                                'marker': marker})
+        self.assertEqual([net['name'] for net in res['networks']], ['net2'])
+        links = res['networks_links']
+        self.assertEqual([link['rel'] for link in links], ['previous'])
+        self.assertTrue('marker=%s' % nets[2]['id'] in links[0]['href'])
+        self.assertTrue('page_reverse=True' in links[0]['href'])
+
+        self.plugin.return_value.get_networks.reset_mock()
+        nets, res = self._test_list_pagination({'limit': 1,
+                                                'marker': nets[2]['id'],
+                                                'page_reverse': 'True'})
+        self.assertEqual([net['name'] for net in res['networks']], ['net1'])
+        links = res['networks_links']
+        self.assertEqual([link['rel'] for link in links],
+                         ['next', 'previous'])
+
+    def test_list_sorting_emulated(self):
+        nets, res = self._test_list_pagination({'sort_key': 'name',
+                                                'sort_dir': 'desc'})
+        self.assertEqual([net['name'] for net in res['networks']],
+                         ['net2', 'net1', 'net0'])
+        self.assertFalse('networks_links' in res)
+
+    def test_list_pagination_max_limit(self):
+        cfg.CONF.set_override('pagination_max_limit', 1)
+        nets, res = self._test_list_pagination({'limit': 2})
+        self.assertEqual(len(res['networks']), 1)
+
+    def test_list_pagination_bad_params(self):
+        for params in ({'limit': 0}, {'limit': 'x'},
+                       {'sort_key': 'bogus'},
+                       {'sort_key': 'name', 'sort_dir': 'up'},
+                       {'sort_key': ['name', 'id'], 'sort_dir': 'asc'}):
+            res = self.api.get(_get_path('networks'), params,
+                               expect_errors=True)
+            self.assertEqual(res.status_int, exc.HTTPBadRequest.code)
+
     def test_list_keystone(self):
         tenant_id = _uuid()
         self._test_list(tenant_id, tenant_id)
@@ -544,17 +615,22 @@ class JSONV2TestCase(APIv2TestBase):
                              {'name': 'net2', 'admin_state_up': True,
                               'tenant_id': _uuid()}]}
 
-        def side_effect(context, network):
-            nets = network.copy()
-            for net in nets['networks']:
-                net.update({'subnets': []})
+        def side_effect(context, networks):
+            nets = []
+            for net in networks['networks']:
+                net = net['network'].copy()
+                net.update({'id': _uuid(), 'subnets': []})
+                nets.append(net)
             return nets
 
         instance = self.plugin.return_value
-        instance.create_network.side_effect = side_effect
+        instance.create_networks_bulk.side_effect = side_effect
 
         res = self.api.post_json(_get_path('networks'), data)
         self.assertEqual(res.status_int, exc.HTTPCreated.code)
+        self.assertFalse(instance.create_network.called)
+        nets = res.json['networks']
+        self.assertEqual([net['name'] for net in nets], ['net1', 'net2'])
 
     def test_create_bulk_no_networks(self):
         data = {'networks': []}
@@ -804,41 +880,54 @@ class NotificationTest(APIv2TestBase):
 class QuotaTest(APIv2TestBase):
     def test_create_network_quota(self):
         cfg.CONF.set_override('quota_network', 1, group='QUOTAS')
-        net_id = _uuid()
-        initial_input = {'network': {'name': 'net1', 'tenant_id': _uuid()}}
-        full_input = {'network': {'admin_state_up': True, 'subnets': []}}
-        full_input['network'].update(initial_input['network'])
-
-        return_value = {'id': net_id, 'status': "ACTIVE"}
-        return_value.update(full_input['network'])
-        return_networks = {'networks': [return_value]}
+        tenant_id = _uuid()
+        initial_input = {'network': {'name': 'net1', 'tenant_id': tenant_id}}
         instance = self.plugin.return_value
-        instance.get_networks.return_value = return_networks
+        instance.get_networks_count.return_value = 1
         res = self.api.post_json(
             _get_path('networks'), initial_input, expect_errors=True)
-        instance.get_networks.assert_called_with(mock.ANY,
-                                                 filters=mock.ANY)
+        instance.get_networks_count.assert_called_with(
+            mock.ANY, filters={'tenant_id': [tenant_id]})
+        self.assertFalse(instance.get_networks.called)
         self.assertTrue("Quota exceeded for resources" in
                         res.json['QuantumError'])
 
     def test_create_network_quota_without_limit(self):
         cfg.CONF.set_override('quota_network', -1, group='QUOTAS')
-        net_id = _uuid()
         initial_input = {'network': {'name': 'net1', 'tenant_id': _uuid()}}
-        full_input = {'network': {'admin_state_up': True, 'subnets': []}}
-        full_input['network'].update(initial_input['network'])
-        return_networks = []
-        for i in xrange(0, 3):
-            return_value = {'id': net_id + str(i), 'status': "ACTIVE"}
-            return_value.update(full_input['network'])
-            return_networks.append(return_value)
-        self.assertEquals(3, len(return_networks))
-        instance = self.plugin.return_value
-        instance.get_networks.return_value = return_networks
+        instance = self.plugin.return_value
+        instance.get_networks_count.return_value = 3
         res = self.api.post_json(
             _get_path('networks'), initial_input)
         self.assertEqual(res.status_int, exc.HTTPCreated.code)
 
+    def _test_create_networks_bulk_quota(self, existing, expect_errors):
+        cfg.CONF.set_override('quota_network', 4, group='QUOTAS')
+        tenant_id = _uuid()
+        data = {'networks': [{'name': 'net%d' % i,
+                              'admin_state_up': True,
+                              'tenant_id': tenant_id} for i in range(3)]}
+        instance = self.plugin.return_value
+        instance.get_networks_count.return_value = existing
+        instance.create_networks_bulk.return_value = [
+            dict(network, id=_uuid(), status='ACTIVE', subnets=[])
+            for network in data['networks']]
+        res = self.api.post_json(_get_path('networks'), data,
+                                 expect_errors=expect_errors)
+        # One count for the whole request
+        instance.get_networks_count.assert_called_once_with(
+            mock.ANY, filters={'tenant_id': [tenant_id]})
+        return res
+
+    def test_create_networks_bulk_quota(self):
+        res = self._test_create_networks_bulk_quota(1, False)
+        self.assertEqual(res.status_int, exc.HTTPCreated.code)
+
+    def test_create_networks_bulk_over_quota(self):
+        res = self._test_create_networks_bulk_quota(2, True)
+        self.assertTrue("Quota exceeded for resources" in
+                        res.json['QuantumError'])
+
 
 class ExtensionTestCase(unittest.TestCase):
     # NOTE(jkoelker) This potentially leaks the mock object if the setUp
@@ -869,6 +958,11 @@ class ExtensionTestCase(unittest.TestCase):
 
         self._plugin_patcher = mock.patch(plugin, autospec=True)
         self.plugin = self._plugin_patcher.start()
+        # The quota checks count the resources of the tenant
+        instance = self.plugin.return_value
+        instance.get_networks_count.return_value = 0
+        instance.get_subnets_count.return_value = 0
+        instance.get_ports_count.return_value = 0
 
         # Instantiate mock plugin and enable the V2attributes extension
         QuantumManager.get_plugin().supported_extension_aliases = ["v2attrs"]
@@ -0,0 +1,136 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from quantum import context
+from quantum.db import port_pool
+from quantum.db import quota_db
+from quantum.manager import QuantumManager
+from quantum.openstack.common import cfg
+from quantum import quota
+from quantum.tests.unit import test_db_plugin
+
+
+class TestDbQuotaDriver(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestDbQuotaDriver, self).setUp()
+        cfg.CONF.set_override('quota_driver',
+                              'quantum.db.quota_db.DbQuotaDriver',
+                              group='QUOTAS')
+        self.driver = quota.QUOTAS.get_driver()
+        self.ctx = context.get_admin_context()
+
+    def _usage(self, resource):
+        usage_qry = self.ctx.session.query(quota_db.QuotaUsage)
+        usage = usage_qry.filter_by(tenant_id=self._tenant_id,
+                                    resource=resource).first()
+        return usage and (usage['in_use'], usage['reserved'])
+
+    def _create_networks(self, count):
+        networks = [{'name': 'net%d' % i, 'admin_state_up': True,
+                     'tenant_id': self._tenant_id} for i in range(count)]
+        return self._create_bulk('json', 'networks', 'network', networks)
+
+    def test_usage_tracks_create_and_delete(self):
+        self.assertEquals(self._usage('network'), None)
+        with self.network():
+            self.assertEquals(self._usage('network'), (1, 0))
+            with self.network():
+                self.assertEquals(self._usage('network'), (2, 0))
+            self.assertEquals(self._usage('network'), (1, 0))
+        self.assertEquals(self._usage('network'), (0, 0))
+
+    def test_usage_counts_existing_items(self):
+        cfg.CONF.set_override('quota_driver', 'quantum.quota.ConfDriver',
+                              group='QUOTAS')
+        with self.network():
+            cfg.CONF.set_override('quota_driver',
+                                  'quantum.db.quota_db.DbQuotaDriver',
+                                  group='QUOTAS')
+            with self.network():
+                self.assertEquals(self._usage('network'), (2, 0))
+
+    def test_usage_tracks_pooled_ports(self):
+        plugin = QuantumManager.get_plugin()
+        with mock.patch.object(port_pool, 'schedule_refill'):
+            with self.subnet() as subnet:
+                net_id = subnet['subnet']['network_id']
+                cfg.CONF.set_override('port_pools', ['%s:2' % net_id])
+                port_pool.refill(plugin, net_id)
+                with self.port(subnet=subnet):
+                    self.assertEquals(self._usage('port'), (1, 0))
+                    pooled = plugin.get_ports_count(
+                        self.ctx, {'tenant_id': [port_pool.POOL_TENANT_ID]})
+                    self.assertEquals(pooled, 1)
+                self.assertEquals(self._usage('port'), (0, 0))
+
+    def test_delete_network_releases_subnets(self):
+        with self.subnet():
+            self.assertEquals(self._usage('subnet'), (1, 0))
+        self.assertEquals(self._usage('subnet'), (0, 0))
+
+    def test_tenant_limit(self):
+        self.driver.update_quota_limit(self.ctx, self._tenant_id,
+                                       'network', 1)
+        quotas = self.driver.get_tenant_quotas(self.ctx,
+                                               quota.QUOTAS._resources,
+                                               self._tenant_id)
+        self.assertEquals(quotas['network'], 1)
+        self.assertEquals(quotas['port'], cfg.CONF.QUOTAS.quota_port)
+        with self.network():
+            res = self._create_network('json', 'net2', True)
+            self.assertEquals(res.status_int, 409)
+        self.driver.delete_tenant_quota(self.ctx, self._tenant_id)
+        with self.network():
+            with self.network():
+                pass
+
+    def test_bulk_reservation(self):
+        cfg.CONF.set_override('quota_network', 3, group='QUOTAS')
+        with self.network():
+            res = self._create_networks(3)
+            self.assertEquals(res.status_int, 409)
+            self.assertEquals(self._usage('network'), (1, 0))
+            res = self._create_networks(2)
+            self.assertEquals(res.status_int, 201)
+            self.assertEquals(self._usage('network'), (3, 0))
+            for network in self.deserialize('json', res)['networks']:
+                self._delete('networks', network['id'])
+
+    def test_failed_create_releases_reservation(self):
+        with self.subnet() as subnet:
+            # Overlaps the first subnet
+            res = self._create_subnet('json', self._tenant_id,
+                                      subnet['subnet']['network_id'],
+                                      '10.0.0.1', '10.0.0.0/24')
+            self.assertEquals(res.status_int, 400)
+            self.assertEquals(self._usage('subnet'), (1, 0))
+
+    def test_resync(self):
+        with self.network():
+            usage_qry = self.ctx.session.query(quota_db.QuotaUsage)
+            with self.ctx.session.begin():
+                usage = usage_qry.filter_by(tenant_id=self._tenant_id,
+                                            resource='network').one()
+                usage['in_use'] = 5
+                usage['reserved'] = 2
+            quota.QUOTAS.resync(self.ctx, QuantumManager.get_plugin())
+            self.assertEquals(self._usage('network'), (1, 0))
+            # A reservation released after the resync does not go below 0
+            self.driver.release_reservation(
+                self.ctx, (self._tenant_id, {'network': 1}))
+            self.assertEquals(self._usage('network'), (1, 0))
@@ -0,0 +1,169 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+
+import eventlet
+import mock
+import unittest2
+import webob.exc
+
+from quantum import context
+from quantum.db import api as db
+from quantum.db import stats
+from quantum.extensions import dbstats
+from quantum.manager import QuantumManager
+from quantum.openstack.common import cfg
+from quantum.tests.unit import test_db_plugin
+
+
+class TestDbStats(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestDbStats, self).setUp()
+        stats.reset()
+
+    def test_queries_counted(self):
+        with self.network():
+            before = db.get_stats()
+            req = self.new_list_request('networks')
+            req.get_response(self.api)
+            after = db.get_stats()
+            self.assertTrue(after['queries'] > before['queries'])
+            self.assertTrue(after['checkouts'] > before['checkouts'])
+
+    def test_request_queries_counted(self):
+        plugin = QuantumManager.get_plugin()
+        with contextlib.nested(self.network(), self.network()):
+            stats.start_request()
+            plugin.get_networks(context.get_admin_context())
+            queries, query_time = stats.end_request()
+            self.assertEquals(queries, 2)
+            # Queries run outside of a request are not counted
+            plugin.get_networks(context.get_admin_context())
+            self.assertEquals(stats.end_request(), (0, 0.0))
+
+    def test_failed_query_not_timed(self):
+        ctx = context.get_admin_context()
+        self.assertRaises(Exception, ctx.session.execute,
+                          'SELECT * FROM no_such_table')
+        stats.start_request()
+        with mock.patch.object(stats, 'time') as fake_time:
+            fake_time.time.side_effect = [10.0, 10.5]
+            ctx.session.execute('SELECT 1')
+        self.assertEquals(stats.end_request(), (1, 0.5))
+
+    def test_stats_admin_only(self):
+        controller = dbstats.DbstatsController()
+        request = mock.Mock()
+        request.environ = {'quantum.context': context.get_admin_context()}
+        self.assertTrue('queries' in controller.index(request)['dbstats'])
+        request.environ = {'quantum.context':
+                           context.Context('', self._tenant_id)}
+        self.assertRaises(webob.exc.HTTPForbidden, controller.index,
+                          request)
+        request.environ = {}
+        self.assertRaises(webob.exc.HTTPForbidden, controller.index,
+                          request)
+
+
+class TestConfigureDb(unittest2.TestCase):
+
+    def setUp(self):
+        super(TestConfigureDb, self).setUp()
+        db._ENGINE = None
+        db._MAKER = None
+
+    def tearDown(self):
+        super(TestConfigureDb, self).tearDown()
+        db._ENGINE = None
+        db._MAKER = None
+        db._SLAVE_ENGINE = None
+        db._SLAVE_MAKER = None
+        cfg.CONF.reset()
+
+    def test_pool_options(self):
+        cfg.CONF.set_override('sql_pool_size', 20, 'DATABASE')
+        with contextlib.nested(
+            mock.patch.object(db, 'create_engine'),
+            mock.patch.object(db, 'register_models'),
+            mock.patch.object(stats, 'listen')) as (create_engine,
+                                                    register_models,
+                                                    listen):
+            db.configure_db({'sql_connection': 'mysql://localhost/quantum',
+                             'sql_max_overflow': 5})
+        engine_args = create_engine.call_args[1]
+        self.assertEquals(engine_args['poolclass'], stats.TimedQueuePool)
+        self.assertEquals(engine_args['pool_size'], 20)
+        self.assertEquals(engine_args['max_overflow'], 5)
+        self.assertFalse('pool_timeout' in engine_args)
+
+    def test_retry_backoff(self):
+        with contextlib.nested(
+            mock.patch.object(db.time, 'sleep'),
+            mock.patch.object(db, 'register_models')) as (sleep,
+                                                          register_models):
+            register_models.side_effect = [False, False, False, True]
+            db.retry_registration(-1, 1, reconnect_interval_max=3)
+        self.assertEquals([args[0][0] for args in sleep.call_args_list],
+                          [1, 2, 3, 3])
+
+    def test_slave_connection(self):
+        cfg.CONF.set_override('slave_connection', 'sqlite://', 'DATABASE')
+        db.configure_db({'sql_connection': 'sqlite://'})
+        self.assertTrue(db._SLAVE_ENGINE is not None)
+        self.assertTrue(db._SLAVE_ENGINE is not db._ENGINE)
+        self.assertTrue(db.get_session().bind is db._ENGINE)
+        self.assertTrue(db.get_session(slave=True).bind is db._SLAVE_ENGINE)
+        ctx = context.get_admin_context()
+        ctx.read_only = True
+        self.assertTrue(ctx.session.bind is db._SLAVE_ENGINE)
+
+    def test_no_slave_connection(self):
+        db.configure_db({'sql_connection': 'sqlite://'})
+        self.assertTrue(db._SLAVE_ENGINE is None)
+        self.assertTrue(db.get_session(slave=True).bind is db._ENGINE)
+
+    def _ticks_during_slow_query(self, options):
+        """Count the runs of a green thread while a query sleeps 0.5s."""
+        db.configure_db(options)
+        connection = db._ENGINE.connect()
+        connection.connection.create_function(
+            'sleep', 1, eventlet.patcher.original('time').sleep)
+        ticks = []
+
+        def tick():
+            while True:
+                ticks.append(None)
+                eventlet.sleep(0.01)
+
+        ticker = eventlet.spawn(tick)
+        eventlet.sleep(0)
+        before = len(ticks)
+        connection.execute('SELECT sleep(0.5)')
+        during = len(ticks) - before
+        ticker.kill()
+        connection.close()
+        return during
+
+    def test_slow_query_blocks_hub(self):
+        self.assertEquals(
+            self._ticks_during_slow_query({'sql_connection': 'sqlite://'}),
+            0)
+
+    def test_dbpool_slow_query_does_not_block_hub(self):
+        ticks = self._ticks_during_slow_query({'sql_connection': 'sqlite://',
+                                               'sql_dbpool_enable': True})
+        self.assertTrue(ticks > 10)
@@ -0,0 +1,147 @@
+# Copyright (c) 2012 OpenStack, LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest2
+
+from quantum import context
+from quantum.db.ipam import base as ipam
+from quantum.db.ipam import freemap_driver
+from quantum.openstack.common import cfg
+from quantum.tests.unit import test_db_plugin
+
+
+class TestFreeMap(unittest2.TestCase):
+
+    def _map(self, pools, allocated=()):
+        free_map = freemap_driver.FreeMap(4, pools)
+        free_map.load(allocated)
+        return free_map
+
+    def test_load(self):
+        free_map = self._map([(30, 40), (2, 10)], [2, 5, 6, 10, 35])
+        self.assertEquals(free_map.ranges(),
+                          [(3, 4), (7, 9), (30, 34), (36, 40)])
+
+    def test_allocate_lowest(self):
+        free_map = self._map([(2, 3), (10, 10)])
+        self.assertEquals(free_map.allocate(), 2)
+        self.assertEquals(free_map.allocate(), 3)
+        self.assertEquals(free_map.allocate(), 10)
+        self.assertEquals(free_map.allocate(), None)
+
+    def test_allocate_specific_splits(self):
+        free_map = self._map([(2, 10)])
+        self.assertTrue(free_map.allocate_specific(5))
+        self.assertEquals(free_map.ranges(), [(2, 4), (6, 10)])
+        self.assertTrue(free_map.allocate_specific(2))
+        self.assertTrue(free_map.allocate_specific(10))
+        self.assertEquals(free_map.ranges(), [(3, 4), (6, 9)])
+        self.assertFalse(free_map.allocate_specific(5))
+        self.assertFalse(free_map.allocate_specific(11))
+
+    def test_release_merges(self):
+        free_map = self._map([(2, 10)], [4, 5, 6])
+        free_map.release(5)
+        self.assertEquals(free_map.ranges(), [(2, 3), (5, 5), (7, 10)])
+        free_map.release(4)
+        free_map.release(6)
+        self.assertEquals(free_map.ranges(), [(2, 10)])
+        free_map.release(6)
+        self.assertEquals(free_map.ranges(), [(2, 10)])
+
+    def test_in_pools(self):
+        free_map = self._map([(2, 10), (20, 30)])
+        self.assertTrue(free_map.in_pools(2))
+        self.assertTrue(free_map.in_pools(30))
+        self.assertFalse(free_map.in_pools(15))
+        self.assertFalse(free_map.in_pools(1))
+
+
+class TestFreeMapPortsV2(test_db_plugin.TestPortsV2):
+
+    def setUp(self):
+        super(TestFreeMapPortsV2, self).setUp()
+        cfg.CONF.set_override('ipam_driver',
+                              'quantum.db.ipam.freemap_driver.FreeMapDriver')
+        ipam._DRIVER = None
+
+    def tearDown(self):
+        ipam._DRIVER = None
+        super(TestFreeMapPortsV2, self).tearDown()
+
+    def test_requested_split_availability_ranges(self):
+        self.skipTest("IPAvailabilityRange is not used by this driver")
+
+    def test_requested_ip_v6_ranges_numeric_order(self):
+        self.skipTest("IPAvailabilityRange is not used by this driver")
+
+    def _test_compact_ip_ranges(self, batch_size):
+        self.skipTest("IPAvailabilityRange is not used by this driver")
+
+    def test_compact_ip_ranges_stale_allocations(self):
+        self.skipTest("IPAvailabilityRange is not used by this driver")
+
+    def test_compact_ip_ranges_large_leak(self):
+        self.skipTest("IPAvailabilityRange is not used by this driver")
+
+    def test_rollback_undoes_free_map_changes(self):
+        driver = ipam.get_driver()
+        ctx = context.get_admin_context()
+        with self.subnet() as subnet:
+            try:
+                with ctx.session.begin():
+                    ip = driver.generate_ip(ctx, subnet['subnet'])
+                    self.assertEquals(ip, '10.0.0.2')
+                    raise ValueError()
+            except ValueError:
+                pass
+            with ctx.session.begin():
+                ip = driver.generate_ip(ctx, subnet['subnet'])
+            self.assertEquals(ip, '10.0.0.2')
+
+    def test_savepoint_rollback_keeps_earlier_changes(self):
+        driver = ipam.get_driver()
+        ctx = context.get_admin_context()
+        with self.subnet() as subnet:
+            with ctx.session.begin():
+                ip = driver.generate_ip(ctx, subnet['subnet'])
+                self.assertEquals(ip, '10.0.0.2')
+                try:
+                    with ctx.session.begin_nested():
+                        ip = driver.generate_ip(ctx, subnet['subnet'])
+                        self.assertEquals(ip, '10.0.0.3')
+                        raise ValueError()
+                except ValueError:
+                    pass
+                ip = driver.generate_ip(ctx, subnet['subnet'])
+                self.assertEquals(ip, '10.0.0.3')
+
+    def test_rollback_keeps_changes_of_other_sessions(self):
+        driver = ipam.get_driver()
+        ctx = context.get_admin_context()
+        other_ctx = context.get_admin_context()
+        with self.subnet() as subnet:
+            with other_ctx.session.begin():
+                ip = driver.generate_ip(other_ctx, subnet['subnet'])
+                self.assertEquals(ip, '10.0.0.2')
+                try:
+                    with ctx.session.begin():
+                        ip = driver.generate_ip(ctx, subnet['subnet'])
+                        self.assertEquals(ip, '10.0.0.3')
+                        raise ValueError()
+                except ValueError:
+                    pass
+                ip = driver.generate_ip(other_ctx, subnet['subnet'])
+                self.assertEquals(ip, '10.0.0.3')
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compare the IPAM drivers of QuantumDbPluginV2.
+
+Every driver allocates addresses for a number of ports on a fresh
+in-memory sqlite database, releases every other one to fragment the
+free space, and allocates them again.  All ports are then deleted and
+created again with a single bulk request.  The wall clock time and the
+number of SQL statements of each phase are reported.
+
+Usage: tools/benchmark_ipam.py [ports] [driver ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+from sqlalchemy import event
+
+from quantum.api.v2 import attributes
+from quantum.common import config
+from quantum import context
+from quantum.db import api as db
+from quantum.db import db_base_plugin_v2
+from quantum.db.ipam import base as ipam
+from quantum.openstack.common import cfg
+
+
+DRIVERS = ['quantum.db.ipam.range_driver.RangeTableDriver',
+           'quantum.db.ipam.freemap_driver.FreeMapDriver']
+
+
+class StatementCounter(object):
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def _port(network_id):
+    return {'port': {'network_id': network_id,
+                     'name': '',
+                     'admin_state_up': True,
+                     'device_id': '',
+                     'mac_address': attributes.ATTR_NOT_SPECIFIED,
+                     'fixed_ips': attributes.ATTR_NOT_SPECIFIED,
+                     'tenant_id': 'bench'}}
+
+
+def _phase(name, counter, func, *args):
+    start_count = counter.count
+    start = time.time()
+    result = func(*args)
+    elapsed = time.time() - start
+    print "  %-10s %8.3fs %8d statements" % (name, elapsed,
+                                             counter.count - start_count)
+    return result
+
+
+def run(driver, num_ports):
+    db._ENGINE = None
+    db._MAKER = None
+    ipam._DRIVER = None
+    cfg.CONF.set_override('ipam_driver', driver)
+
+    plugin = db_base_plugin_v2.QuantumDbPluginV2()
+    counter = StatementCounter(db._ENGINE)
+    ctx = context.get_admin_context()
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'tenant_id': 'bench'}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'network_id': network['id'], 'name': 'bench', 'ip_version': 4,
+        'cidr': '10.0.0.0/16', 'enable_dhcp': True, 'tenant_id': 'bench',
+        'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED}})
+
+    def create(count):
+        return [plugin.create_port(ctx, _port(network['id']))
+                for i in xrange(count)]
+
+    def create_bulk(count):
+        ports = [_port(network['id']) for i in xrange(count)]
+        return plugin.create_ports_bulk(ctx, {'ports': ports})
+
+    def delete(ports):
+        for port in ports:
+            plugin.delete_port(ctx, port['id'])
+
+    print driver
+    ports = _phase('create', counter, create, num_ports)
+    _phase('delete', counter, delete, ports[::2])
+    ports = ports[1::2] + _phase('recreate', counter, create,
+                                 len(ports[::2]))
+    delete(ports)
+    _phase('bulk', counter, create_bulk, num_ports)
+
+
+def main(argv):
+    config.parse(args=[])
+    num_ports = int(argv[1]) if len(argv) > 1 else 500
+    for driver in argv[2:] or DRIVERS:
+        run(driver, num_ports)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
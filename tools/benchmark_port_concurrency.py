@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure port creation throughput of parallel creators on one subnet.
+
+For each ipam_range_allocation strategy of the range table driver, a
+number of green threads create ports on the same subnet of a fresh
+database.  The ports created per second and the number of times a
+range was changed under an allocator, forcing it to retry, are
+reported.
+
+The default in-memory sqlite database runs every statement on one
+connection, so the creators only interleave between statements.  Pass
+the URL of a scratch MySQL or PostgreSQL database to measure row lock
+contention.  Its tables are dropped at the end of every run.
+
+Usage: tools/benchmark_port_concurrency.py [creators] [ports] [sql_connection]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+from quantum.api.v2 import attributes
+from quantum.common import config
+from quantum import context
+from quantum.db import api as db
+from quantum.db import db_base_plugin_v2
+from quantum.db.ipam import base as ipam
+from quantum.db import models_v2
+from quantum.openstack.common import cfg
+
+
+STRATEGIES = ['lowest', 'random']
+
+
+def run(strategy, creators, num_ports, sql_connection):
+    db._ENGINE = None
+    db._MAKER = None
+    ipam._DRIVER = None
+    # The plugin keeps an engine that is already configured
+    db.configure_db({'sql_connection': sql_connection,
+                     'base': models_v2.model_base.BASEV2})
+    cfg.CONF.set_override('ipam_driver',
+                          'quantum.db.ipam.range_driver.RangeTableDriver')
+    cfg.CONF.set_override('ipam_range_allocation', strategy)
+
+    plugin = db_base_plugin_v2.QuantumDbPluginV2()
+    ctx = context.get_admin_context()
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'tenant_id': 'bench'}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'network_id': network['id'], 'name': 'bench', 'ip_version': 4,
+        'cidr': '10.0.0.0/16', 'enable_dhcp': True, 'tenant_id': 'bench',
+        'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED}})
+
+    driver = ipam.get_driver()
+    take = driver._take
+    conflicts = [0]
+
+    def counting_take(*args):
+        taken = take(*args)
+        if not taken:
+            conflicts[0] += 1
+        return taken
+    driver._take = counting_take
+
+    def create(i):
+        return plugin.create_port(context.get_admin_context(), {'port': {
+            'network_id': network['id'],
+            'name': '',
+            'admin_state_up': True,
+            'device_id': '',
+            'mac_address': attributes.ATTR_NOT_SPECIFIED,
+            'fixed_ips': attributes.ATTR_NOT_SPECIFIED,
+            'tenant_id': 'bench'}})
+
+    pool = eventlet.GreenPool(creators)
+    start = time.time()
+    ports = list(pool.imap(create, xrange(num_ports)))
+    elapsed = time.time() - start
+    ips = set(port['fixed_ips'][0]['ip_address'] for port in ports)
+    print "  %-8s %8.3fs %8.1f ports/s %6d retries %6d duplicates" % (
+        strategy, elapsed, num_ports / elapsed, conflicts[0],
+        num_ports - len(ips))
+    db.unregister_models(models_v2.model_base.BASEV2)
+
+
+def main(argv):
+    config.parse(args=[])
+    creators = int(argv[1]) if len(argv) > 1 else 50
+    num_ports = int(argv[2]) if len(argv) > 2 else 1000
+    sql_connection = argv[3] if len(argv) > 3 else 'sqlite://'
+    print "%s creators, %s ports, %s" % (creators, num_ports, sql_connection)
+    for strategy in STRATEGIES:
+        run(strategy, creators, num_ports, sql_connection)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
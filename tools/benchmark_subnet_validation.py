@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 OpenStack, LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Time the overlap checks run when a subnet is created.
+
+The allocation pools of a IPv6 /64 split in a number of pools of
+arbitrary size are validated, and the CIDR of a new subnet is checked
+against a network with a number of subnets.  No database is used.
+
+Usage: tools/benchmark_subnet_validation.py [pools] [subnets]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
+
+import netaddr
+
+from quantum.common import config
+from quantum.db import db_base_plugin_v2
+from quantum.db import models_v2
+
+
+def _time(name, func, *args):
+    start = time.time()
+    func(*args)
+    print "  %-30s %8.3fs" % (name, time.time() - start)
+
+
+def validate_pools(plugin, num_pools):
+    cidr = netaddr.IPNetwork('2001:db8::/64')
+    # Pools of uneven sizes, so that each of them spans many CIDRs
+    step = (cidr.size - 2) // num_pools
+    pools = []
+    for i in xrange(num_pools):
+        first = cidr.first + 2 + i * step
+        pools.append({'start': str(netaddr.IPAddress(first)),
+                      'end': str(netaddr.IPAddress(first + step - 3))})
+    pools.reverse()
+    _time('%d pools in a /64' % num_pools, plugin._validate_allocation_pools,
+          pools, '2001:db8::1', str(cidr))
+
+
+def validate_cidr(plugin, num_subnets):
+    network = models_v2.Network(id='bench')
+    for i in xrange(num_subnets):
+        network.subnets.append(models_v2.Subnet(
+            cidr='10.%d.%d.0/24' % (i // 256, i % 256)))
+    _time('cidr against %d subnets' % num_subnets,
+          plugin._validate_subnet_cidr, network, '10.255.255.0/24')
+
+
+def main(argv):
+    config.parse(args=[])
+    num_pools = int(argv[1]) if len(argv) > 1 else 1000
+    num_subnets = int(argv[2]) if len(argv) > 2 else 500
+    plugin = db_base_plugin_v2.QuantumDbPluginV2()
+    validate_pools(plugin, num_pools)
+    validate_cidr(plugin, num_subnets)
+
+
+if __name__ == '__main__':
+    main(sys.argv)